@@ -0,0 +1,149 @@
+# --- ARCHIVO HISTÓRICO DE TELEMETRÍA (PARQUET, PARTICIONADO POR FLOTA Y DÍA) ---
+# El poller agrega aquí cada snapshot consultado. Las filas se acumulan en memoria y se
+# escriben cada N sondeos como un archivo Parquet nuevo dentro de
+#   <raiz>/flota=<nombre>/fecha=<AAAA-MM-DD>/parte-<hora>-<n>.parquet
+# (append-only: nunca se reescribe un archivo existente). <hora> es la primera HORA_CONSULTA del
+# archivo (HHMMSSffffff, hora de Venezuela como la partición), no la del servidor al escribir. Las lecturas usan pyarrow.dataset
+# con memory-map, filtro por partición y solo las columnas pedidas, así una consulta
+# histórica no carga días completos en RAM.
+#
+# pyarrow es opcional: sin él, el archivo queda deshabilitado y el dashboard funciona igual.
+
+import itertools
+import os
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence
+from urllib.parse import quote
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.fs as pafs
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+# Columnas del snapshot que se archivan (el resto es presentación y se puede recalcular)
+COLUMNAS_ARCHIVO = [
+    "UNIT_ID", "UNIDAD", "LAST_REPORT_DT", "LATITUD", "LONGITUD", "VELOCIDAD", "IGNICION_ACTIVA",
+    "IGNICION", "EN_SEDE_FLAG", "EN_RESGUARDO_SECUNDARIO_FLAG", "EN_VERTEDERO_FLAG", "DISTANCIA_SITIO_KM",
+    "UBICACION_TEXTO", "LAST_REPORT_TIME_DISPLAY",  # Necesarias para la reproducción (Parquet las comprime por diccionario)
+]
+SONDEOS_POR_ESCRITURA = 12  # ~1 minuto con el poller a 5 s
+
+
+def pyarrow_disponible() -> bool:
+    return pa is not None
+
+
+def carpeta_particion(raiz: str, flota: str, fecha: str) -> str:
+    """Carpeta de la partición (flota, día 'AAAA-MM-DD')."""
+    return os.path.join(raiz, f"flota={quote(flota, safe='')}", f"fecha={fecha}")
+
+
+def dias_archivados(raiz: str, flota: str) -> List[str]:
+    """Días ('AAAA-MM-DD') con datos archivados de la flota, del más reciente al más antiguo."""
+    carpeta_flota = os.path.dirname(carpeta_particion(raiz, flota, ""))
+    if not os.path.isdir(carpeta_flota):
+        return []
+    return sorted((nombre[len("fecha="):] for nombre in os.listdir(carpeta_flota) if nombre.startswith("fecha=")),
+                  reverse=True)
+
+
+class ArchivoTelemetria:
+    """
+    Archivo append-only de snapshots. `agregar` es barato (solo acumula en memoria); cada
+    `sondeos_por_escritura` llamadas se escribe todo lo acumulado, un archivo por flota y día.
+
+    Solo se archivan los reportes nuevos de cada unidad (un LastReportTime repetido en varios
+    sondeos se guarda una vez, salvo que cambie la velocidad: otro reporte en el mismo minuto). Thread-safe.
+    """
+
+    def __init__(self, raiz: str, sondeos_por_escritura: int = SONDEOS_POR_ESCRITURA):
+        self.raiz = raiz
+        self.sondeos_por_escritura = max(1, int(sondeos_por_escritura))
+        self._lock = threading.Lock()
+        self._pendientes: Dict[str, List[pd.DataFrame]] = {}
+        self._ultimo_reporte: Dict[str, pd.DataFrame] = {}
+        self._sondeos = 0
+        self._consecutivo = itertools.count()
+
+    def agregar(self, flota: str, df: pd.DataFrame, hora_consulta: datetime) -> None:
+        """Acumula las filas con reportes nuevos del snapshot y escribe si toca."""
+        if df.empty or "LAST_REPORT_DT" not in df.columns:
+            return
+        filas = df[COLUMNAS_ARCHIVO].copy()
+        filas["UNIT_ID"] = filas["UNIT_ID"].astype(str)
+        filas["UNIDAD"] = filas["UNIDAD"].astype(str)
+        filas["IGNICION"] = filas["IGNICION"].astype(str)
+        filas.insert(0, "HORA_CONSULTA", pd.Timestamp(hora_consulta).tz_localize(None))
+
+        with self._lock:
+            # Reportes repetidos desde el sondeo anterior no se archivan otra vez
+            anterior = self._ultimo_reporte.get(flota)
+            if anterior is not None:
+                previo = filas["UNIT_ID"].map(anterior["LAST_REPORT_DT"])
+                velocidad_previa = filas["UNIT_ID"].map(anterior["VELOCIDAD"])
+                mismo_minuto = (filas["LAST_REPORT_DT"] == previo) & (filas["VELOCIDAD"] != velocidad_previa)
+                filas = filas[previo.isna() | (filas["LAST_REPORT_DT"] > previo) | mismo_minuto]
+            self._ultimo_reporte[flota] = df.assign(UNIT_ID=df["UNIT_ID"].astype(str)) \
+                .drop_duplicates("UNIT_ID").set_index("UNIT_ID")[["LAST_REPORT_DT", "VELOCIDAD"]]
+
+            if not filas.empty:
+                self._pendientes.setdefault(flota, []).append(filas)
+            self._sondeos += 1
+            if self._sondeos < self.sondeos_por_escritura:
+                return
+            pendientes, self._pendientes, self._sondeos = self._pendientes, {}, 0
+
+        self._escribir(pendientes)
+
+    def vaciar(self) -> None:
+        """Escribe lo acumulado sin esperar al próximo lote (p. ej. al cerrar el proceso)."""
+        with self._lock:
+            pendientes, self._pendientes, self._sondeos = self._pendientes, {}, 0
+        self._escribir(pendientes)
+
+    def _escribir(self, pendientes: Dict[str, List[pd.DataFrame]]) -> None:
+        for flota, partes in pendientes.items():
+            lote = pd.concat(partes, ignore_index=True)
+            for fecha, filas_dia in lote.groupby(lote["HORA_CONSULTA"].dt.strftime("%Y-%m-%d")):
+                carpeta = carpeta_particion(self.raiz, flota, fecha)
+                nombre = f"parte-{filas_dia['HORA_CONSULTA'].min():%H%M%S%f}-{next(self._consecutivo):06d}.parquet"
+                try:
+                    os.makedirs(carpeta, exist_ok=True)
+                    tabla = pa.Table.from_pandas(filas_dia, preserve_index=False)
+                    pq.write_table(tabla, os.path.join(carpeta, nombre), compression="zstd")
+                except Exception as e:
+                    # Un error de disco no debe afectar el monitoreo en vivo (se pierde solo este lote)
+                    print(f"❌ [ARCHIVO] No se pudo escribir {len(filas_dia)} filas de {flota} ({fecha}): {e}")
+
+
+def leer_archivo(raiz: str, flota: Optional[str] = None, desde: Optional[str] = None, hasta: Optional[str] = None,
+                 columnas: Optional[Sequence[str]] = None) -> pd.DataFrame:
+    """
+    Lee el archivo histórico filtrando por flota y rango de días ('AAAA-MM-DD', inclusivo) y
+    cargando solo `columnas` (None = todas). Las particiones que no aplican ni se abren.
+    """
+    if not pyarrow_disponible():
+        raise ImportError("Leer el archivo histórico requiere pyarrow (pip install pyarrow).")
+    if not os.path.isdir(raiz):
+        return pd.DataFrame(columns=list(columnas or []))
+
+    particiones = ds.partitioning(pa.schema([("flota", pa.string()), ("fecha", pa.string())]), flavor="hive")
+    dataset = ds.dataset(raiz, format="parquet", partitioning=particiones,
+                         filesystem=pafs.LocalFileSystem(use_mmap=True))
+
+    filtro = None
+    for condicion in (
+        ds.field("flota") == flota if flota is not None else None,
+        ds.field("fecha") >= desde if desde is not None else None,
+        ds.field("fecha") <= hasta if hasta is not None else None,
+    ):
+        if condicion is not None:
+            filtro = condicion if filtro is None else filtro & condicion
+
+    return dataset.to_table(columns=list(columnas) if columnas is not None else None, filter=filtro).to_pandas()
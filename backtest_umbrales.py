@@ -0,0 +1,227 @@
+# --- SIMULACIÓN DE UMBRALES SOBRE UN DÍA ARCHIVADO ("¿QUÉ PASARÍA SI...?") ---
+# Cuenta cuántas alertas (y cuántos minutos) habría producido cada combinación de umbrales
+# con los reportes reales de una flota en un día del archivo histórico.
+#
+# Sin recorrer los reportes sondeo a sondeo: con las mismas reglas que las máquinas de estado del
+# dashboard (estado_unidades), cada parada y cada tramo de velocidad alta es un intervalo entre dos
+# reportes de la unidad, y los umbrales se comparan contra esos intervalos con broadcasting:
+#   - Falla GPS: una unidad falla cuando el hueco entre dos reportes supera el umbral de su ignición.
+#     Como en aplicar_falla_gps, un reporte que ya estaba en Falla GPS al consultarse cuenta como
+#     si la unidad estuviera en base (no suma a paradas ni a excesos), con cada par de umbrales GPS.
+#   - Paradas: las paradas no dependen de umbrales; cada umbral de parada es un filtro sobre su duración.
+#   - Excesos: cada umbral de velocidad define sus propios tramos; uno se registra si empezó fuera
+#     de base y terminó con un reporte bajo el umbral tras durar lo mínimo.
+
+from typing import Any, Iterable, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from archivo_telemetria import leer_archivo
+from estado_unidades import DURACION_MINIMA_EXCESO_MIN, horas_efectivas
+
+COLUMNAS_REPORTES = [
+    "HORA_CONSULTA", "UNIT_ID", "LAST_REPORT_DT", "VELOCIDAD", "IGNICION_ACTIVA",
+    "EN_SEDE_FLAG", "EN_RESGUARDO_SECUNDARIO_FLAG", "EN_VERTEDERO_FLAG",
+]
+_UN_MINUTO = np.timedelta64(1, "m")
+
+
+def cargar_reportes_dia(raiz: str, flota: str, fecha: str) -> pd.DataFrame:
+    """Reportes archivados de la flota en el día 'AAAA-MM-DD' (solo las columnas que usa la simulación)."""
+    return leer_archivo(raiz, flota=flota, desde=fecha, hasta=fecha, columnas=COLUMNAS_REPORTES)
+
+
+def _ordenar_reportes(reportes: pd.DataFrame) -> pd.DataFrame:
+    """
+    Reportes distintos de cada unidad (mismo criterio que estado_unidades: un LastReportTime repetido
+    solo cuenta otra vez si cambió la velocidad), agrupados por unidad y en orden cronológico.
+    """
+    reportes = reportes.dropna(subset=["LAST_REPORT_DT"])
+    orden = ["UNIT_ID", "LAST_REPORT_DT"] + (["HORA_CONSULTA"] if "HORA_CONSULTA" in reportes.columns else [])
+    reportes = reportes.sort_values(orden, kind="stable").reset_index(drop=True)
+    anterior = reportes.groupby("UNIT_ID", sort=False)[["LAST_REPORT_DT", "VELOCIDAD"]].shift()
+    repetido = (reportes["LAST_REPORT_DT"] == anterior["LAST_REPORT_DT"]) & \
+               (reportes["VELOCIDAD"] == anterior["VELOCIDAD"])
+    return reportes[~repetido].reset_index(drop=True)
+
+
+def _siguiente(marcas: np.ndarray) -> np.ndarray:
+    """Para cada posición del último eje, la primera posición marcada desde ella en adelante (n si no hay)."""
+    n = marcas.shape[-1]
+    posiciones = np.where(marcas, np.arange(n), n)
+    return np.minimum.accumulate(posiciones[..., ::-1], axis=-1)[..., ::-1]
+
+
+def _en_falla_gps(fechas: np.ndarray, encendidas: np.ndarray, hora_referencia: Any,
+                  encendida: np.ndarray, apagada: np.ndarray) -> np.ndarray:
+    """
+    (par GPS, reporte): la unidad estaba en Falla GPS a `hora_referencia` con ese par de umbrales
+    (mismo criterio que aplicar_falla_gps: minutos sin reportar > umbral de su ignición).
+    """
+    minutos_sin_reportar = (hora_referencia - fechas) / _UN_MINUTO
+    umbrales = np.where(encendidas[None, :], encendida[:, None], apagada[:, None])
+    return np.nan_to_num(minutos_sin_reportar, nan=-np.inf)[None, :] > umbrales
+
+
+def _paradas(codigos_unidad: np.ndarray, velocidades: np.ndarray, horas: np.ndarray,
+             fuera_de_base: np.ndarray, falla_al_cierre: np.ndarray,
+             fin_del_dia: np.datetime64) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    (duración en min, vista fuera de base por par GPS) de cada parada que terminó o seguía al cierre
+    del día. `fuera_de_base` es (par GPS, reporte); `falla_al_cierre` es (par GPS, reporte) evaluada
+    al cierre, y descarta las paradas en curso de unidades que para entonces estaban en Falla GPS.
+    """
+    n = len(velocidades)
+    nueva_unidad = np.append(True, codigos_unidad[1:] != codigos_unidad[:-1])
+    detenida = velocidades <= 1.0
+    # Cada parada es una racha de reportes detenidos de la misma unidad: [primero, ultimo]
+    primero = np.flatnonzero(detenida & (nueva_unidad | ~np.append(False, detenida[:-1])))
+    ultimo = _siguiente(np.append(~detenida[1:] | nueva_unidad[1:], True))[primero]
+
+    # Cuenta desde el último reporte en movimiento (o desde el primer reporte si la unidad arrancó detenida)
+    inicio = np.where(nueva_unidad[primero], horas[primero], horas[np.maximum(primero - 1, 0)])
+    termino = (ultimo + 1 < n) & ~nueva_unidad[np.minimum(ultimo + 1, n - 1)]
+    # Como EstadoParadas: el reporte en movimiento la cierra solo si el último reporte detenido es posterior al inicio
+    terminada = termino & (inicio < horas[ultimo])
+    en_curso = ~termino
+    fin = np.where(terminada, horas[np.minimum(ultimo + 1, n - 1)], fin_del_dia)
+    duracion = (fin - inicio) / _UN_MINUTO
+
+    # Vista fuera de base: algún reporte detenido de la racha fuera de base (y sin Falla GPS)
+    filas_detenidas = np.flatnonzero(detenida)
+    vista = np.logical_or.reduceat(fuera_de_base[:, filas_detenidas],
+                                   np.searchsorted(filas_detenidas, primero), axis=1)
+    vista &= ~(en_curso[None, :] & falla_al_cierre[:, ultimo])
+    cuenta = terminada | en_curso
+    return duracion[cuenta], vista[:, cuenta]
+
+
+def _excesos(codigos_unidad: np.ndarray, velocidades: np.ndarray, horas: np.ndarray,
+             fuera_de_base: np.ndarray, umbrales: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    (conteo, minutos) de excesos registrables, (umbral de velocidad, par GPS). Un tramo es una racha de
+    reportes de la unidad con velocidad >= umbral; el exceso empieza en su primer reporte fuera de base
+    y termina con el siguiente reporte bajo el umbral (los tramos abiertos al cierre no se registran).
+    """
+    n = len(velocidades)
+    nueva_unidad = np.append(True, codigos_unidad[1:] != codigos_unidad[:-1])
+    en_exceso = velocidades[None, :] >= umbrales[:, None]
+    empieza = en_exceso & (nueva_unidad[None, :] | ~np.pad(en_exceso[:, :-1], ((0, 0), (1, 0))))
+    i_umbral, primero = np.nonzero(empieza)
+    fin = _siguiente(~en_exceso)[i_umbral, primero]
+    cerrado = (fin < n) & (codigos_unidad[np.minimum(fin, n - 1)] == codigos_unidad[primero])
+    i_umbral, primero, fin = i_umbral[cerrado], primero[cerrado], fin[cerrado]
+
+    # Primer reporte fuera de base del tramo, por par GPS (el tramo son las filas [primero, fin))
+    inicio = _siguiente(fuera_de_base)[:, primero]
+    registrado = inicio < fin[None, :]
+    duracion = (horas[fin][None, :] - horas[np.minimum(inicio, n - 1)]) / _UN_MINUTO
+    registrado &= duracion >= DURACION_MINIMA_EXCESO_MIN
+
+    n_umbrales, n_pares = len(umbrales), len(fuera_de_base)
+    claves = (i_umbral[None, :] * n_pares + np.arange(n_pares)[:, None])[registrado]
+    conteo = np.bincount(claves, minlength=n_umbrales * n_pares).reshape(n_umbrales, n_pares)
+    minutos = np.bincount(claves, weights=duracion[registrado],
+                          minlength=n_umbrales * n_pares).reshape(n_umbrales, n_pares)
+    return conteo, minutos
+
+
+def _fallas_gps(codigos_unidad: np.ndarray, fechas: np.ndarray, encendidas: np.ndarray,
+                encendida: np.ndarray, apagada: np.ndarray, fin_del_dia: np.datetime64):
+    """(conteo, minutos) de episodios de Falla GPS por par de umbrales (encendida, apagada)."""
+    # Hueco hasta el siguiente reporte de la misma unidad (el último, hasta el cierre del día)
+    siguiente = np.append(fechas[1:], fin_del_dia)
+    ultima_de_unidad = np.append(codigos_unidad[1:] != codigos_unidad[:-1], True)
+    siguiente[ultima_de_unidad] = fin_del_dia
+    huecos = (siguiente - fechas) / _UN_MINUTO
+
+    umbrales = np.where(encendidas[None, :], encendida[:, None], apagada[:, None])
+    exceso = huecos[None, :] - umbrales
+    return (exceso > 0).sum(axis=1), np.clip(exceso, 0, None).sum(axis=1)
+
+
+def evaluar_umbrales(reportes: pd.DataFrame, umbrales_parada: Iterable[float], umbrales_velocidad: Iterable[float],
+                     gps_min_encendida: Iterable[float], gps_min_apagada: Iterable[float],
+                     fin_del_dia: Optional[Any] = None) -> pd.DataFrame:
+    """
+    Tabla comparativa con una fila por combinación de umbrales (producto cartesiano de las cuatro listas):
+    paradas largas, excesos de velocidad y fallas GPS que se habrían registrado, con sus minutos.
+    `reportes` es lo que retorna cargar_reportes_dia; `fin_del_dia` por defecto es su última HORA_CONSULTA.
+    """
+    umbrales_parada = np.asarray(list(umbrales_parada), dtype=np.float64)
+    umbrales_velocidad = np.asarray(list(umbrales_velocidad), dtype=np.float64)
+    gps_encendida = np.asarray(list(gps_min_encendida), dtype=np.float64)
+    gps_apagada = np.asarray(list(gps_min_apagada), dtype=np.float64)
+
+    # Una fila por combinación, en el orden de itertools.product; i_* es la posición de cada umbral en su lista
+    i_parada, i_velocidad, i_encendida, i_apagada = (
+        ejes.ravel() for ejes in np.meshgrid(np.arange(len(umbrales_parada)), np.arange(len(umbrales_velocidad)),
+                                             np.arange(len(gps_encendida)), np.arange(len(gps_apagada)), indexing="ij")
+    )
+    combinaciones = pd.DataFrame({
+        "STOP_THRESHOLD_MINUTES": umbrales_parada[i_parada],
+        "SPEED_THRESHOLD_KPH": umbrales_velocidad[i_velocidad],
+        "GPS_MIN_ENCENDIDA": gps_encendida[i_encendida],
+        "GPS_MIN_APAGADA": gps_apagada[i_apagada],
+    })
+    reportes = _ordenar_reportes(reportes)
+    if reportes.empty:
+        for columna in ("PARADAS_LARGAS", "EXCESOS_VELOCIDAD", "FALLAS_GPS"):
+            combinaciones[columna] = 0
+        for columna in ("MINUTOS_PARADA_LARGA", "MINUTOS_EXCESO", "MINUTOS_FALLA_GPS"):
+            combinaciones[columna] = 0.0
+        return combinaciones
+
+    if fin_del_dia is None:
+        fin_del_dia = reportes["HORA_CONSULTA"].max() if "HORA_CONSULTA" in reportes.columns else reportes["LAST_REPORT_DT"].max()
+    fin_del_dia = pd.Timestamp(fin_del_dia).tz_localize(None).to_datetime64().astype("datetime64[ns]")
+
+    codigos_unidad = pd.factorize(reportes["UNIT_ID"])[0]
+    velocidades = reportes["VELOCIDAD"].to_numpy(dtype=np.float64)
+    fechas = reportes["LAST_REPORT_DT"].to_numpy(dtype="datetime64[ns]")
+    encendidas = reportes["IGNICION_ACTIVA"].to_numpy(dtype=bool)
+    horas_consulta = (reportes["HORA_CONSULTA"].to_numpy(dtype="datetime64[ns]")
+                      if "HORA_CONSULTA" in reportes.columns else None)
+    horas = horas_efectivas(fechas, horas_consulta)
+
+    # --- FALLA GPS AL CONSULTAR (todos los pares encendida/apagada) ---
+    par_encendida, par_apagada = (ejes.ravel() for ejes in np.meshgrid(gps_encendida, gps_apagada, indexing="ij"))
+    i_par_gps = i_encendida * len(gps_apagada) + i_apagada
+    if horas_consulta is None:
+        # Sin hora de consulta cada reporte se toma como recién llegado
+        falla_al_consultar = np.zeros((len(par_encendida), len(reportes)), dtype=bool)
+    else:
+        falla_al_consultar = _en_falla_gps(fechas, encendidas, horas_consulta, par_encendida, par_apagada)
+    fuera_de_base = ~(reportes["EN_SEDE_FLAG"] | reportes["EN_RESGUARDO_SECUNDARIO_FLAG"] |
+                      reportes["EN_VERTEDERO_FLAG"]).to_numpy(dtype=bool)
+    fuera_de_base = fuera_de_base[None, :] & ~falla_al_consultar
+
+    # --- PARADAS LARGAS (mismo criterio que el log: duración fuera de base > umbral) ---
+    paradas, vistas = _paradas(codigos_unidad, velocidades, horas, fuera_de_base,
+                               _en_falla_gps(fechas, encendidas, fin_del_dia, par_encendida, par_apagada),
+                               fin_del_dia)
+    largas = paradas[None, :] > umbrales_parada[:, None]
+    paradas_largas = largas.astype(np.int64) @ vistas.T.astype(np.int64)
+    minutos_parada = np.where(largas, paradas[None, :], 0.0) @ vistas.T
+
+    # --- EXCESOS DE VELOCIDAD (solo los que duran lo suficiente para registrarse) ---
+    # Los pares GPS que dejan las mismas filas fuera de base dan los mismos excesos (lo normal es que
+    # ningún reporte llegue en Falla GPS y todos los pares coincidan)
+    vistos = {}
+    i_patron = np.array([vistos.setdefault(fila.tobytes(), len(vistos)) for fila in np.packbits(fuera_de_base, axis=1)])
+    patrones = fuera_de_base[np.unique(i_patron, return_index=True)[1]]
+    excesos, minutos_exceso = _excesos(codigos_unidad, velocidades, horas, patrones, umbrales_velocidad)
+    excesos, minutos_exceso = excesos[:, i_patron], minutos_exceso[:, i_patron]
+
+    # --- FALLA GPS (todos los pares encendida/apagada) ---
+    fallas, minutos_falla = _fallas_gps(codigos_unidad, fechas, encendidas, par_encendida, par_apagada, fin_del_dia)
+
+    # --- ARMADO DE LA TABLA: cada métrica depende solo de sus propios umbrales ---
+    combinaciones["PARADAS_LARGAS"] = paradas_largas[i_parada, i_par_gps]
+    combinaciones["MINUTOS_PARADA_LARGA"] = minutos_parada[i_parada, i_par_gps]
+    combinaciones["EXCESOS_VELOCIDAD"] = excesos[i_velocidad, i_par_gps]
+    combinaciones["MINUTOS_EXCESO"] = minutos_exceso[i_velocidad, i_par_gps]
+    combinaciones["FALLAS_GPS"] = fallas[i_par_gps]
+    combinaciones["MINUTOS_FALLA_GPS"] = minutos_falla[i_par_gps]
+    return combinaciones
@@ -0,0 +1,79 @@
+# --- MICRO-BENCHMARK: DECODIFICACIÓN DE RESPUESTAS FORESIGHT ---
+# Compara los decodificadores disponibles (json / orjson / msgspec) incluyendo la ingestión
+# a columnas tipadas, que es lo que realmente paga cada refresco.
+#
+# Uso:
+#   python benchmarks/bench_decodificacion.py respuesta1.json respuesta2.json ...
+# Los archivos son respuestas crudas grabadas de la API (el cuerpo tal cual llegó).
+# Sin archivos, se generan respuestas sintéticas con la forma de la API (incluye campos
+# que el dashboard no usa) para 50, 300 y 1500 unidades.
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from decodificacion_foresight import DECODIFICADORES  # noqa: E402
+from ingestion_unidades import TIME_FORMAT, ingerir_unidades  # noqa: E402
+
+
+def respuesta_sintetica(n_unidades: int, semilla: int = 0) -> bytes:
+    """Respuesta con la forma de 'usersearchplatform' y ~40 campos por unidad."""
+    rnd = random.Random(semilla)
+    ahora = datetime.now()
+    unidades = []
+    for i in range(n_unidades):
+        unidad = {
+            "unitid": 300000 + i,
+            "name": f"U{300000 + i}-FOSPUCA",
+            "ylat": f"{10.48 + rnd.uniform(-0.05, 0.05):.6f}",
+            "xlong": f"{-66.86 + rnd.uniform(-0.05, 0.05):.6f}",
+            "speed_dunit": str(rnd.choice([0, 0, 0, 25, 45, 72])),
+            "ignition": rnd.choice(["true", "false"]),
+            "location": f"Av. Principal {i}, Caracas, Distrito Capital",
+            "LastReportTime": (ahora - timedelta(minutes=rnd.randint(0, 120))).strftime(TIME_FORMAT),
+        }
+        # Campos que la API envía y el dashboard no usa
+        for j in range(32):
+            unidad[f"campo_extra_{j}"] = f"valor {rnd.random():.8f}"
+        unidades.append(unidad)
+    return json.dumps({"ForesightFlexAPI": {"DATA": unidades}}).encode()
+
+
+def medir(funcion, repeticiones: int) -> float:
+    """Mejor tiempo (ms) de `repeticiones` ejecuciones."""
+    mejor = float("inf")
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        mejor = min(mejor, time.perf_counter() - inicio)
+    return mejor * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark de decodificación de respuestas Foresight")
+    parser.add_argument("respuestas", nargs="*", help="Archivos con respuestas crudas grabadas de la API")
+    parser.add_argument("--repeticiones", type=int, default=20)
+    args = parser.parse_args()
+
+    if args.respuestas:
+        cargas = [(os.path.basename(ruta), open(ruta, "rb").read()) for ruta in args.respuestas]
+    else:
+        cargas = [(f"sintetica_{n}", respuesta_sintetica(n)) for n in (50, 300, 1500)]
+
+    print(f"Decodificadores disponibles: {', '.join(DECODIFICADORES)}")
+    for nombre_carga, contenido in cargas:
+        print(f"\n{nombre_carga} ({len(contenido) / 1024:.0f} KiB)")
+        for nombre, decodificar in DECODIFICADORES.items():
+            solo_decodificar = medir(lambda: decodificar(contenido), args.repeticiones)
+            con_ingestion = medir(lambda: ingerir_unidades(decodificar(contenido)), args.repeticiones)
+            print(f"  {nombre:8s} decodificar: {solo_decodificar:8.2f} ms   + ingestión: {con_ingestion:8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
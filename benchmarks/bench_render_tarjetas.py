@@ -0,0 +1,127 @@
+# --- MICRO-BENCHMARK: RENDERIZADO DE LA REJILLA DE TARJETAS ---
+# Cuenta los mensajes "delta" que Streamlit envía al navegador y el tiempo de servidor de
+# dibujar la rejilla, para el renderizador anterior (st.columns + varios st.markdown +
+# st.expander por tarjeta) y para la rejilla HTML en bloques de tarjetas_unidades.py.
+#
+# Uso:
+#   python benchmarks/bench_render_tarjetas.py [--unidades 50 300 1500] [--cambios 0.05]
+# Cada caso dibuja la rejilla dos veces en la misma ejecución: la primera vez (página nueva)
+# y un refresco en el que cambia la fracción `--cambios` de las tarjetas.
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from streamlit.runtime.scriptrunner_utils import script_run_context  # noqa: E402
+from streamlit.testing.v1 import AppTest  # noqa: E402
+
+RAIZ_REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Deltas enviados desde que se reinició el contador
+_DELTAS = {"n": 0}
+_enqueue_original = script_run_context.ScriptRunContext.enqueue
+
+
+def _enqueue_contando(self, mensaje):
+    if mensaje.WhichOneof("type") == "delta":
+        _DELTAS["n"] += 1
+    return _enqueue_original(self, mensaje)
+
+
+script_run_context.ScriptRunContext.enqueue = _enqueue_contando
+
+
+def _script(raiz_repo: str, modo: str, n_unidades: int, fraccion_cambios: float):
+    """Script de Streamlit que dibuja la rejilla dos veces y guarda tiempos y deltas en session_state."""
+    import sys
+    import time
+    from dataclasses import replace
+
+    import streamlit as st
+    from streamlit.runtime.scriptrunner_utils import script_run_context
+
+    sys.path.insert(0, raiz_repo)
+    from tarjetas_unidades import CSS_TARJETAS, RejillaTarjetas, TarjetaUnidad
+
+    contador = script_run_context.ScriptRunContext.enqueue.__globals__["_DELTAS"]
+    columnas_por_fila = 5
+    tarjetas = [
+        TarjetaUnidad(
+            nombre=f"U{300000 + i}", velocidad=f"{(i * 7) % 90}", estado="Encendida 🔥",
+            estilo="background-color: #4CAF50; padding: 15px; border-radius: 5px; color: white; margin-bottom: 0px;",
+            color_velocidad="white", tiempo_parado=f"{i % 40} min",
+            falla_motivo="Encendida **9 minutos** sin reportar (Umbral 5 min)." if i % 11 == 0 else None,
+            estado_gps="Encendida 🔥", direccion=f"Av. Principal {i}, Caracas", ultimo_reporte="Oct 16 2026 08:15AM",
+            coordenadas=f"(-66.{i:04d}, 10.{i:04d})",
+        )
+        for i in range(n_unidades)
+    ]
+    paso = max(1, round(1 / fraccion_cambios)) if fraccion_cambios > 0 else None
+    refresco = [replace(t, velocidad=str(int(t.velocidad) + 1)) if paso and i % paso == 0 else t
+                for i, t in enumerate(tarjetas)]
+
+    def dibujar_widgets(contenedor, lista):
+        # Renderizador anterior: todo se vuelve a dibujar en cada ciclo
+        with contenedor.container():
+            for inicio in range(0, len(lista), columnas_por_fila):
+                columnas = st.columns(columnas_por_fila)
+                for columna, t in zip(columnas, lista[inicio:inicio + columnas_por_fila]):
+                    with columna:
+                        st.markdown(f'<div style="{t.estilo}">', unsafe_allow_html=True)
+                        st.markdown(f'<p style="text-align: center;"><span>{t.nombre}</span></p>', unsafe_allow_html=True)
+                        st.markdown(f'<p style="text-align: center;">📍 <span style="color: {t.color_velocidad};">{t.velocidad} Km</span></p>', unsafe_allow_html=True)
+                        st.markdown(f'<p style="text-align: center;">{t.estado}</p>', unsafe_allow_html=True)
+                        st.markdown('</div>', unsafe_allow_html=True)
+                        with st.expander("Detalles ℹ️", expanded=False):
+                            st.caption(f"Tiempo Parado: **{t.tiempo_parado}**")
+                            if t.falla_motivo:
+                                st.error(f"🚫 **Motivo Falla GPS:** {t.falla_motivo}\n\n🕒 **Último Reporte:** {t.ultimo_reporte}")
+                            st.caption(f"Estado GPS: **{t.estado_gps}**")
+                            st.caption(f"Dirección: **{t.direccion}**")
+                            if not t.falla_motivo:
+                                st.caption(f"Último Reporte: **{t.ultimo_reporte}**")
+                            st.caption(f"Coordenadas: {t.coordenadas}")
+                st.markdown("<div style='height: 15px;'></div>", unsafe_allow_html=True)
+
+    st.markdown(f"<style>{CSS_TARJETAS}</style>", unsafe_allow_html=True)
+    if modo == "widgets":
+        espacio = st.empty()
+        dibujar = lambda lista: dibujar_widgets(espacio, lista)  # noqa: E731
+    else:
+        rejilla = RejillaTarjetas(st.container(), columnas_por_fila, None if modo == "html_unico" else 50)
+        dibujar = rejilla.actualizar
+
+    resultados = []
+    for lista in (tarjetas, refresco):
+        contador["n"] = 0
+        inicio = time.perf_counter()
+        dibujar(lista)
+        resultados.append(((time.perf_counter() - inicio) * 1000, contador["n"]))
+    st.session_state["resultados"] = resultados
+
+
+def medir(modo: str, n_unidades: int, fraccion_cambios: float):
+    prueba = AppTest.from_function(_script, args=(RAIZ_REPO, modo, n_unidades, fraccion_cambios), default_timeout=600)
+    prueba.run()
+    if prueba.exception:
+        raise RuntimeError(prueba.exception[0].value)
+    return prueba.session_state["resultados"]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark del renderizado de la rejilla de tarjetas")
+    parser.add_argument("--unidades", type=int, nargs="*", default=[50, 300, 1500])
+    parser.add_argument("--cambios", type=float, default=0.05, help="Fracción de tarjetas que cambia en el refresco")
+    args = parser.parse_args()
+
+    print(f"{'modo':12s} {'unidades':>8s} | {'inicial ms':>10s} {'deltas':>7s} | {'refresco ms':>11s} {'deltas':>7s}")
+    for n_unidades in args.unidades:
+        for modo in ("widgets", "html", "html_unico"):
+            (ms_inicial, deltas_inicial), (ms_refresco, deltas_refresco) = medir(modo, n_unidades, args.cambios)
+            print(f"{modo:12s} {n_unidades:8d} | {ms_inicial:10.1f} {deltas_inicial:7d} | {ms_refresco:11.1f} {deltas_refresco:7d}")
+
+
+if __name__ == "__main__":
+    main()
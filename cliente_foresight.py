@@ -0,0 +1,132 @@
+# --- CLIENTE HTTP DE LA API FORESIGHT ---
+# Una sola requests.Session con pool de conexiones keep-alive para todo el proceso
+# (evita pagar TCP+TLS en cada refresco) y consulta concurrente de varias flotas,
+# cada una con su propio timeout. La URL y los encabezados se reciben como parámetros
+# para poder apuntar el cliente a un servidor local de prueba.
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Mapping, Optional, Union
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from decodificacion_foresight import decodificar_unidades
+
+API_URL = "https://flexapi.foresightgps.com/ForesightFlexAPI.ashx"
+TIMEOUT_API_SEGUNDOS = 5
+TAMANO_POOL_CONEXIONES = 32
+# Las listas grandes de IDs (p. ej. "Toda Flota") se parten en lotes de este tamaño que se
+# consultan en paralelo. Cada flota puede sobrescribirlo con 'tamano_lote_ids' en su JSON.
+TAMANO_LOTE_IDS = 50
+
+
+def crear_sesion_http(tamano_pool: int = TAMANO_POOL_CONEXIONES) -> requests.Session:
+    """Crea la sesión HTTP compartida con un pool de conexiones persistentes (keep-alive)."""
+    sesion = requests.Session()
+    adaptador = HTTPAdapter(pool_connections=tamano_pool, pool_maxsize=tamano_pool)
+    sesion.mount("https://", adaptador)
+    sesion.mount("http://", adaptador)
+    return sesion
+
+
+def construir_payload(ids: str) -> Dict[str, Any]:
+    """Payload de 'usersearchplatform' para una lista de IDs separada por comas."""
+    return {
+        "userid": "82825",
+        "requesttype": 0,
+        "isdeleted": 0,
+        "pageindex": 1,
+        "orderby": "name",
+        "orderdirection": "ASC",
+        "conncode": "SATEQSA",
+        "elements": 1,
+        "ids": ids,
+        "method": "usersearchplatform",
+        # Aseguramos un tamaño de página suficiente para todos los IDs
+        "pagesize": len(ids.split(',')) + 5,
+        "prefix": True
+    }
+
+
+def dividir_ids(ids: str, tamano_lote: int = TAMANO_LOTE_IDS) -> List[str]:
+    """Parte la cadena de IDs separados por comas en lotes (sin vacíos ni duplicados, conservando el orden)."""
+    lista_ids = list(dict.fromkeys(i.strip() for i in ids.split(',') if i.strip()))
+    tamano_lote = max(1, int(tamano_lote))
+    return [",".join(lista_ids[i:i + tamano_lote]) for i in range(0, len(lista_ids), tamano_lote)]
+
+
+def _consultar_lote(sesion: requests.Session, ids: str, headers: Mapping[str, str],
+                    api_url: str, timeout: float) -> List[Dict[str, Any]]:
+    response = sesion.post(api_url, json=construir_payload(ids), headers=headers, timeout=timeout)
+    response.raise_for_status()
+    # Se decodifican los bytes crudos (msgspec/orjson si están instalados) en vez de response.json()
+    try:
+        return decodificar_unidades(response.content)
+    except ValueError as e:
+        # Igual que response.json(): un JSON inválido se reporta como error de la petición
+        raise requests.exceptions.InvalidJSONError(f"Respuesta JSON inválida: {e}", response=response) from e
+
+
+def consultar_unidades(sesion: requests.Session, ids: str, headers: Mapping[str, str],
+                       api_url: str = API_URL, timeout: float = TIMEOUT_API_SEGUNDOS,
+                       tamano_lote: int = TAMANO_LOTE_IDS) -> List[Dict[str, Any]]:
+    """
+    Retorna la lista 'DATA' de la respuesta para los IDs dados.
+
+    Si hay más IDs que `tamano_lote`, se consultan por lotes en paralelo y se unen los
+    resultados. Los lotes que fallan se omiten (se conserva lo que sí llegó); solo si
+    TODOS fallan se lanza la excepción (requests.exceptions.RequestException).
+    """
+    lotes = dividir_ids(ids, tamano_lote)
+    if len(lotes) <= 1:
+        return _consultar_lote(sesion, lotes[0] if lotes else ids, headers, api_url, timeout)
+
+    unidades: List[Dict[str, Any]] = []
+    errores: List[Exception] = []
+    with ThreadPoolExecutor(max_workers=min(TAMANO_POOL_CONEXIONES, len(lotes))) as executor:
+        futuros = [executor.submit(_consultar_lote, sesion, lote, headers, api_url, timeout) for lote in lotes]
+        for futuro in futuros:
+            try:
+                unidades.extend(futuro.result())
+            except requests.exceptions.RequestException as e:
+                errores.append(e)
+
+    if len(errores) == len(lotes):
+        raise errores[0]
+    if errores:
+        print(f" [ADVERTENCIA] {len(errores)} de {len(lotes)} lotes de IDs fallaron; se muestran las unidades recibidas. ({errores[0]})")
+
+    # Cada lote viene ordenado por nombre; reordenamos el total para mantener el orden de la API
+    return sorted(unidades, key=lambda unidad: unidad.get("name", ""))
+
+
+def consultar_flotas_concurrente(sesion: requests.Session, ids_por_flota: Mapping[str, str],
+                                 headers: Mapping[str, str], api_url: str = API_URL,
+                                 timeouts: Optional[Mapping[str, float]] = None,
+                                 tamanos_lote: Optional[Mapping[str, int]] = None,
+                                 max_hilos: int = TAMANO_POOL_CONEXIONES) -> Dict[str, Union[List[Dict[str, Any]], Exception]]:
+    """
+    Consulta varias flotas en paralelo. El resultado de cada flota es su lista de unidades
+    o la excepción que produjo (una flota que falla no afecta a las demás).
+    """
+    timeouts = timeouts or {}
+    tamanos_lote = tamanos_lote or {}
+    resultados: Dict[str, Union[List[Dict[str, Any]], Exception]] = {}
+    if not ids_por_flota:
+        return resultados
+
+    with ThreadPoolExecutor(max_workers=min(max_hilos, len(ids_por_flota))) as executor:
+        futuros = {
+            nombre_flota: executor.submit(
+                consultar_unidades, sesion, ids, headers, api_url,
+                timeouts.get(nombre_flota, TIMEOUT_API_SEGUNDOS),
+                tamanos_lote.get(nombre_flota, TAMANO_LOTE_IDS)
+            )
+            for nombre_flota, ids in ids_por_flota.items()
+        }
+        for nombre_flota, futuro in futuros.items():
+            try:
+                resultados[nombre_flota] = futuro.result()
+            except Exception as e:
+                resultados[nombre_flota] = e
+    return resultados
@@ -5,18 +5,31 @@ import json
 import pandas as pd
 import time
 import numpy as np
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
+import atexit
 import base64
 import os
 from datetime import datetime, timedelta, timezone
 
+from archivo_telemetria import ArchivoTelemetria, dias_archivados, pyarrow_disponible
+from backtest_umbrales import cargar_reportes_dia, evaluar_umbrales
+from cliente_foresight import (
+    API_URL, TAMANO_LOTE_IDS, TIMEOUT_API_SEGUNDOS, consultar_flotas_concurrente, consultar_unidades, crear_sesion_http
+)
+from estado_unidades import TTL_ESTADO_HORAS, AlmacenEstadoUnidades, EstadoExcesos
+from geocercas import clasificar_geocercas, construir_indice_geocercas, haversine
+from historial_posiciones import HistorialPosiciones
+from ingestion_unidades import FECHAS_REPORTE, ingerir_unidades, minutos_desde
+from persistencia_estado import PersistenciaEstadoSQLite
+from poller_flotas import PollerFlotas, SnapshotFlota
+from reproduccion_archivo import VELOCIDAD_MAXIMA, VELOCIDAD_MINIMA, ReproduccionArchivo
+from tarjetas_unidades import CSS_TARJETAS, RejillaTarjetas, TarjetaUnidad
+
 
 # --- CONFIGURACIÓN DE ZONA HORARIA Y LÓGICA DE TIEMPO ---
 
 # Definir la zona horaria de Venezuela (VET = UTC-4)
 VENEZUELA_TZ = timezone(timedelta(hours=-4))
-# Formato de fecha y hora requerido para parsear 'LastReportTime': 'Sep 30 2025 12:57PM'
-TIME_FORMAT = '%b %d %Y %I:%M%p'
 COLOR_FALLA_GPS = "#AAAAAA" # Gris para Falla GPS
 
 # --- 🔒 CONSTANTE DE CONTRASEÑA 🔒 ---
@@ -35,62 +48,64 @@ def obtener_hora_venezuela() -> datetime:
     """Retorna el objeto datetime con la hora actual en la Zona Horaria de Venezuela (VET)."""
     return datetime.now(VENEZUELA_TZ)
 
-# 🚨 FUNCIÓN OPTIMIZADA 🚨
-def verificar_falla_gps(unidad_data: Dict[str, Any], hora_venezuela: datetime, 
-                        minutos_encendida: int, minutos_apagada: int) -> Dict[str, Any]:
+# 🚨 FUNCIÓN OPTIMIZADA (POR SESIÓN) 🚨
+# La evaluación de Falla GPS ya NO forma parte de la consulta a la API: el poller publica un solo
+# snapshot por flota y cada sesión aplica aquí sus propios umbrales (paso vectorizado y barato).
+def _motivo_falla_gps(minutos_sin_reportar: float, encendida: bool, minutos_encendida: int, minutos_apagada: int) -> str:
+    """Texto (Markdown) del motivo de Falla GPS. Solo se construye para las unidades que fallan."""
+    if encendida:
+        return f"Encendida **{minutos_sin_reportar:.0f} minutos** sin reportar (Umbral {minutos_encendida} min)."
+
+    # Display simplificado a minutos totales (o horas si es mucho)
+    if minutos_sin_reportar >= 60:
+        tiempo_display = f"{(minutos_sin_reportar / 60.0):.1f} horas"
+    else:
+        tiempo_display = f"{minutos_sin_reportar:.0f} minutos"
+
+    umbral_display = f"{minutos_apagada // 60}h {minutos_apagada % 60}min" if minutos_apagada >= 60 else f"{minutos_apagada}min"
+
+    return f"Apagada **{tiempo_display}** sin reportar (Umbral {umbral_display})."
+
+
+def aplicar_falla_gps(df: pd.DataFrame, hora_venezuela: datetime,
+                      minutos_encendida: int, minutos_apagada: int) -> pd.DataFrame:
     """
-    Evalúa si la unidad debe cambiar a estado 'Falla GPS' y actualiza el diccionario de datos.
+    Marca como 'Falla GPS' las unidades que superan el umbral de minutos sin reportar
+    (según su ignición) y sobrescribe su estado, estilo y banderas de ubicación.
+    Modifica y retorna `df` (debe ser la copia de la sesión, no el snapshot compartido).
     """
-    last_report_str = unidad_data.get('LastReportTime')
-    ignicion_raw = unidad_data.get("ignition", "false").lower()
-    estado_ignicion = ignicion_raw == "true"
-    
-    if not last_report_str:
-        return unidad_data
-
-    try:
-        last_report_dt = datetime.strptime(last_report_str, TIME_FORMAT).replace(tzinfo=VENEZUELA_TZ)
-    except ValueError:
-        return unidad_data 
+    if df.empty or 'LAST_REPORT_TIME_DISPLAY' not in df.columns:
+        return df
 
-    # 1. Calcular la diferencia de tiempo
-    diferencia_tiempo: timedelta = hora_venezuela - last_report_dt
-    minutos_sin_reportar = diferencia_tiempo.total_seconds() / 60.0
-    
-    # 2. Definir los umbrales de tiempo
-    UMBRAL_ENCENDIDA = timedelta(minutes=minutos_encendida)
-    UMBRAL_APAGADA = timedelta(minutes=minutos_apagada)
-    
-    es_falla_gps = False
-    motivo_falla = ""
-    
-    if estado_ignicion: 
-        if diferencia_tiempo > UMBRAL_ENCENDIDA:
-            es_falla_gps = True
-            motivo_falla = f"Encendida **{minutos_sin_reportar:.0f} minutos** sin reportar (Umbral {minutos_encendida} min)."
-    else: 
-        if diferencia_tiempo > UMBRAL_APAGADA:
-            es_falla_gps = True
-            # Display simplificado a minutos totales (o horas si es mucho)
-            if minutos_sin_reportar >= 60:
-                 tiempo_display = f"{(minutos_sin_reportar / 60.0):.1f} horas"
-            else:
-                 tiempo_display = f"{minutos_sin_reportar:.0f} minutos"
+    # 1. Calcular la diferencia de tiempo para toda la columna de una vez (VET sin tz, como lo reporta la API).
+    # LAST_REPORT_DT ya viene parseada (y memoizada) desde la ingestión del poller.
+    if 'LAST_REPORT_DT' in df.columns:
+        reportes = df['LAST_REPORT_DT']
+    else:
+        reportes = FECHAS_REPORTE.parsear(df['LAST_REPORT_TIME_DISPLAY'])
+    hora_local = pd.Timestamp(hora_venezuela.replace(tzinfo=None))
+    minutos_sin_reportar = minutos_desde(reportes, hora_local)
 
-            umbral_display = f"{minutos_apagada // 60}h {minutos_apagada % 60}min" if minutos_apagada >= 60 else f"{minutos_apagada}min"
+    # 2. Umbral según ignición (reportes sin fecha válida nunca se marcan como falla)
+    encendidas = df['IGNICION_ACTIVA'].to_numpy(dtype=bool)
+    umbrales = np.where(encendidas, minutos_encendida, minutos_apagada)
+    es_falla_gps = np.nan_to_num(minutos_sin_reportar, nan=-np.inf) > umbrales
 
-            motivo_falla = f"Apagada **{tiempo_display}** sin reportar (Umbral {umbral_display})."
-            
     # 3. Aplicar el estado y estilo si es Falla GPS
-    if es_falla_gps:
-        unidad_data['Estado_Falla_GPS'] = True 
-        unidad_data['FALLA_GPS_MOTIVO'] = motivo_falla 
-        unidad_data['LAST_REPORT_TIME_FOR_DETAIL'] = last_report_str 
-        unidad_data['IGNICION_OVERRIDE'] = "Falla GPS 🚫"
-        # Usamos el f-string para el estilo
-        unidad_data['CARD_STYLE_OVERRIDE'] = f"background-color: {COLOR_FALLA_GPS}; padding: 15px; border-radius: 5px; color: black; margin-bottom: 0px;"
+    df['ES_FALLA_GPS_FLAG'] = es_falla_gps
+    df['FALLA_GPS_MOTIVO'] = None
+    if es_falla_gps.any():
+        df.loc[es_falla_gps, 'FALLA_GPS_MOTIVO'] = [
+            _motivo_falla_gps(minutos, encendida, minutos_encendida, minutos_apagada)
+            for minutos, encendida in zip(minutos_sin_reportar[es_falla_gps], encendidas[es_falla_gps])
+        ]
+        df.loc[es_falla_gps, 'IGNICION'] = "Falla GPS 🚫"
+        df.loc[es_falla_gps, 'CARD_STYLE'] = ESTILO_FALLA_GPS
+        # Para fines de métricas, marcamos el tipo de resguardo como NINGUNO
+        for bandera in ('EN_SEDE_FLAG', 'EN_RESGUARDO_SECUNDARIO_FLAG', 'EN_VERTEDERO_FLAG'):
+            df.loc[es_falla_gps, bandera] = False
 
-    return unidad_data
+    return df
 
 
 # --- 🚨 CONFIGURACIÓN DE AUDIO Y BASE64 (EJECUCIÓN ÚNICA AL INICIO) 🚨 ---
@@ -144,6 +159,16 @@ def reproducir_alerta_sonido(base64_str):
     </script>
     """
     st.markdown(audio_html, unsafe_allow_html=True)
+
+def hay_unidades_nuevas_en_alerta(clave_estado: str, unidades: pd.Series) -> bool:
+    """
+    Guarda las unidades con alerta pendiente en este ciclo y retorna True si alguna no la tenía en el anterior.
+    El audio suena solo entonces: cada reproducción reenvía el MP3 completo (decenas de KB, nunca cacheable).
+    """
+    actuales = set(unidades)
+    nuevas = actuales - st.session_state[clave_estado]
+    st.session_state[clave_estado] = actuales
+    return bool(nuevas)
 # --- CONFIGURACIÓN DE PÁGINA ---
 st.set_page_config(
     page_title="Monitoreo GPS - FOSPUCA",
@@ -173,9 +198,9 @@ st.markdown("""
     }
     </style>
     """, unsafe_allow_html=True)
+# Rejilla HTML de tarjetas (un bloque por llamada, ver tarjetas_unidades.py)
+st.markdown(f"<style>{CSS_TARJETAS}</style>", unsafe_allow_html=True)
 # --- CONFIGURACIÓN DE LA API Y SEGURIDAD (st.secrets) ---
-API_URL = "https://flexapi.foresightgps.com/ForesightFlexAPI.ashx"
-
 try:
 # --- 🔑 La clave se carga de forma SEGURA desde st.secrets ---
     BASIC_AUTH_HEADER = st.secrets["api"]["basic_auth_header"]
@@ -211,9 +236,11 @@ def cargar_configuracion_flotas(config_dir: str = CONFIG_DIR) -> Dict[str, Dict[
                 with open(filepath, 'r', encoding='utf-8') as f:
                     data = json.load(f)
                     
-                    # 🚨 MODIFICACIÓN CLAVE: Ahora se valida la existencia de 'sede_coords'.
-                    if all(key in data for key in ["ids", "sede_coords"]):
+                    # 🚨 MODIFICACIÓN CLAVE: La sede puede definirse con 'sede_coords' (puntos) y/o 'sede_poligonos'.
+                    if "ids" in data and any(key in data for key in ["sede_coords", "sede_poligonos"]):
                         
+                        data.setdefault("sede_coords", [])
+
                         # Hacemos que 'resguardo_secundario_coords' sea opcional.
                         if "resguardo_secundario_coords" not in data:
                             data["resguardo_secundario_coords"] = []
@@ -222,9 +249,16 @@ def cargar_configuracion_flotas(config_dir: str = CONFIG_DIR) -> Dict[str, Dict[
                         if "vertedero_coords" not in data:
                             data["vertedero_coords"] = []
 
+                        # 🚨 Zonas poligonales opcionales (lotes irregulares): listas de polígonos [[lat, lon], ...]
+                        for clave_poligonos in ("vertedero_poligonos", "sede_poligonos", "resguardo_secundario_poligonos"):
+                            data.setdefault(clave_poligonos, [])
+
+                        # 🚨 ÍNDICE ESPACIAL: Se construye una sola vez al cargar la flota.
+                        data["indice_geocercas"] = construir_indice_geocercas(data, PROXIMIDAD_KM)
+
                         flotas_config[nombre_flota] = data
                     else:
-                        print(f" [ADVERTENCIA] Archivo '{filename}' omitido: faltan claves obligatorias (ids, sede_coords).")
+                        print(f" [ADVERTENCIA] Archivo '{filename}' omitido: faltan claves obligatorias (ids y sede_coords o sede_poligonos).")
 
             except json.JSONDecodeError:
                 print(f" [ERROR] No se pudo parsear el archivo JSON: {filename}. Revisa su formato.")
@@ -246,7 +280,7 @@ if not FLOTAS_CONFIG:
     st.markdown("""
         1.  Asegúrate de tener la carpeta **`configuracion_flotas`** al lado de `dashboard.py`.
         2.  Revisa que tus archivos JSON estén dentro de esa carpeta.
-        3.  Verifica que **TODOS** los archivos JSON utilicen el formato con **`"ids"`** y **`"sede_coords"`** (ej: `"sede_coords": [[10.456, -66.123]]`).
+        3.  Verifica que **TODOS** los archivos JSON utilicen el formato con **`"ids"`** y **`"sede_coords"`** (ej: `"sede_coords": [[10.456, -66.123]]`) o **`"sede_poligonos"`** (lista de polígonos `[[lat, lon], ...]`).
     """)
     st.stop() 
 
@@ -259,18 +293,14 @@ HEADERS = {
     "Authorization": BASIC_AUTH_HEADER
 }
 
+# --- SESIÓN HTTP COMPARTIDA (pool de conexiones keep-alive para todo el proceso) ---
+@st.cache_resource(ttl=None)
+def obtener_sesion_http():
+    """Retorna la sesión HTTP única del proceso, reutilizada por todas las consultas a la API."""
+    return crear_sesion_http()
+
+SESION_HTTP = obtener_sesion_http()
 
-# --- CALCULO DE DISTANCIA (FUNCIÓN HAVERSINE) ---
-def haversine(lat1, lon1, lat2, lon2):
-    """Calcula la distancia Haversine entre dos puntos en la Tierra (en km). OPTIMIZADA con numpy."""
-    R = 6371  
-    # Vectorización con numpy
-    lat1, lon1, lat2, lon2 = map(np.radians, [lat1, lon1, lat2, lon2])
-    dlon = lon2 - lon1
-    dlat = lat2 - lat1
-    a = np.sin(dlat/2.0)**2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon/2.0)**2
-    c = 2 * np.arcsin(np.sqrt(a)) 
-    return R * c
 
 # --- FUNCIÓN AUXILIAR PARA ESTILOS (Sigue existiendo para la Leyenda) ---
 def get_card_style(ignicion_status, speed):
@@ -305,18 +335,30 @@ def get_card_style(ignicion_status, speed):
     )
     return style
 
+# --- ESTADOS Y ESTILOS DE TARJETA (categorías fijas para las columnas IGNICION / CARD_STYLE) ---
+ESTILO_FALLA_GPS = f"background-color: {COLOR_FALLA_GPS}; padding: 15px; border-radius: 5px; color: black; margin-bottom: 0px;"
+ESTADOS_TARJETA = [
+    "Encendida 🔥",
+    "Encendida (Sede) 🔥",
+    "Apagada ❄️",
+    "Vertedero 🚛",
+    "Resguardo (Sede) 🛡️",
+    "Resguardo (Fuera de Sede) 🛡️",
+    "Falla GPS 🚫",
+]
+# Mismo orden que ESTADOS_TARJETA (Falla GPS usa texto negro sobre el gris)
+ESTILOS_TARJETA = [get_card_style(estado, 0) for estado in ESTADOS_TARJETA[:-1]] + [ESTILO_FALLA_GPS]
+
 # --- CALLBACK MODIFICADO PARA DESCARTE ---
 def descartar_alerta_stop(unidad_id_a_descartar):
-    """Marca la alerta de Parada Larga como 'descartada' y DESACTIVA la bandera de audio."""
+    """Marca la alerta de Parada Larga como 'descartada'."""
     st.session_state['alertas_descartadas'][unidad_id_a_descartar] = True
-    st.session_state['reproducir_audio_alerta'] = False 
 
 
 # --- DESCARTAR EXCESO DE VELOCIDAD ---
 def descartar_alerta_velocidad(unidad_id_a_descartar):
-    """Marca la alerta de Exceso de Velocidad como 'descartada' y DESACTIVA la bandera de audio."""
+    """Marca la alerta de Exceso de Velocidad como 'descartada'."""
     st.session_state['alertas_velocidad_descartadas'][unidad_id_a_descartar] = True
-    st.session_state['reproducir_audio_velocidad'] = False
 
 
 # --- DATOS DE RESPALDO (FALLBACK) ---
@@ -328,6 +370,7 @@ def get_fallback_data(error_type="Conexión Fallida"):
         "UNIDAD": "FALLBACK", 
         "UNIT_ID": "FALLBACK_ID",
         "IGNICION": "N/A", 
+        "IGNICION_ACTIVA": False,
         "VELOCIDAD": 0.0, 
         "LATITUD": 0.0, 
         "LONGITUD": 0.0, 
@@ -335,181 +378,146 @@ def get_fallback_data(error_type="Conexión Fallida"):
         "CARD_STYLE": "background-color: #D32F2F; padding: 15px; border-radius: 5px; color: white; margin-bottom: 0px;",
         "FALLA_GPS_MOTIVO": None,
         "LAST_REPORT_TIME_DISPLAY": None,
+        "LAST_REPORT_DT": pd.NaT,
         "STOP_DURATION_MINUTES": 0.0, # Añadido para consistencia
         "STOP_DURATION_TIMEDELTA": timedelta(seconds=0), # Añadido para consistencia
         "EN_SEDE_FLAG": False, # Añadido para consistencia
         "EN_RESGUARDO_SECUNDARIO_FLAG": False, # Añadido para consistencia
         "EN_VERTEDERO_FLAG": False, # NUEVO FLAG
-        "ES_FALLA_GPS_FLAG": False # Añadido para consistencia
+        "ES_FALLA_GPS_FLAG": False, # Añadido para consistencia
+        "DISTANCIA_SITIO_KM": float("inf")
     }])
 
-# --- FUNCIÓN DE OBTENCIÓN Y FILTRADO DE DATOS DINÁMICA (TTL de 5 segundos) ---
-# Se usan los argumentos gps_min_encendida y gps_min_apagada para que la función sepa cuándo refrescar el caché.
-@st.cache_data(ttl=5)
-def obtener_datos_unidades(nombre_flota: str, config: Dict[str, Any], gps_min_encendida: int, gps_min_apagada: int):
-    """Obtiene y limpia los datos de la API, aplicando la lógica de color por estado/sede, incluyendo Falla GPS."""
-    
+# --- FUNCIÓN DE OBTENCIÓN Y FILTRADO DE DATOS DINÁMICA ---
+# Sin caché propio: el PollerFlotas compartido es quien la llama (una vez por flota e intervalo).
+
+def _validar_configuracion_flota(nombre_flota: str, config: Dict[str, Any]):
+    """Retorna un DataFrame de FALLBACK si la configuración de la flota no es usable, o None si está bien."""
     flota_data = config.get(nombre_flota)
     if not flota_data:
         # Esto no debería pasar si la lógica de selección en el sidebar es correcta
         return get_fallback_data("Configuración de Flota No Encontrada")
 
-    # 🚨 OBTENCIÓN DE COORDENADAS DE UBICACIONES DINÁMICAS DESDE EL JSON 🚨
-    # Todas son listas de listas de [lat, lon]
-    SEDE_COORDS = flota_data.get("sede_coords", [])
-    COORDENADAS_RESGUARDO_SECUNDARIO = flota_data.get("resguardo_secundario_coords", [])
-    COORDENADAS_VERTEDERO = flota_data.get("vertedero_coords", []) # ¡NUEVO!
-    
-    if not SEDE_COORDS:
-        return get_fallback_data("Error de Configuración: 'sede_coords' vacía.")
-
-    # Aseguramos un tamaño de página suficiente para todos los IDs
-    payload = {
-        "userid": "82825",
-        "requesttype": 0,
-        "isdeleted": 0,
-        "pageindex": 1,
-        "orderby": "name",
-        "orderdirection": "ASC",
-        "conncode": "SATEQSA",
-        "elements": 1,
-        "ids": flota_data["ids"], 
-        "method": "usersearchplatform",
-        "pagesize": len(flota_data["ids"].split(',')) + 5, 
-        "prefix": True
-    }
+    # 🚨 Las coordenadas de ubicaciones dinámicas (listas de [lat, lon]) y los polígonos se leen
+    # del JSON dentro de clasificar_geocercas. Solo validamos aquí que exista la sede.
+    if not flota_data.get("sede_coords", []) and not flota_data.get("sede_poligonos", []):
+        return get_fallback_data("Error de Configuración: 'sede_coords' y 'sede_poligonos' vacías.")
+    return None
+
+
+def _fallback_por_error_api(e: Exception) -> pd.DataFrame:
+    """
+    DataFrame de FALLBACK para un error de la API. El poller solo lo publica si la flota
+    nunca tuvo datos buenos; si los tuvo, sigue sirviendo el último snapshot (obsoleto).
+    """
+    return get_fallback_data("Error de Conexión/API")
+
+
+def obtener_datos_unidades(nombre_flota: str, config: Dict[str, Any]):
+    """
+    Obtiene y limpia los datos de la API, aplicando la lógica de color por estado/sede.
+    La Falla GPS se evalúa después, por sesión (aplicar_falla_gps).
+    Lanza requests.exceptions.RequestException si la API falla (el poller decide qué mostrar).
+    """
     
-    try:
-        response = requests.post(API_URL, json=payload, headers=HEADERS, timeout=5)
-        response.raise_for_status()  
-        data = response.json()
-        
-        lista_unidades = data.get("ForesightFlexAPI", {}).get("DATA", [])
-        
-        if not lista_unidades:
-            return get_fallback_data("Lista de Unidades Vacía (Revisa IDs)")
-        
-        hora_actual_ve = obtener_hora_venezuela()
+    fallback = _validar_configuracion_flota(nombre_flota, config)
+    if fallback is not None:
+        return fallback
+
+    flota_data = config[nombre_flota]
+    lista_unidades = consultar_unidades(
+        SESION_HTTP, flota_data["ids"], HEADERS, API_URL,
+        timeout=flota_data.get("timeout_segundos", TIMEOUT_API_SEGUNDOS),
+        tamano_lote=flota_data.get("tamano_lote_ids", TAMANO_LOTE_IDS)
+    )
 
-        # --- PROCESAMIENTO DE DATOS REALES ---
-        datos_filtrados = []
-        for unidad in lista_unidades:
-            
-            # 1. APLICAR LÓGICA DE FALLA GPS CON PARÁMETROS DINÁMICOS
-            unidad_con_falla_check = verificar_falla_gps(unidad, hora_actual_ve, gps_min_encendida, gps_min_apagada)
-            
-            es_falla_gps = unidad_con_falla_check.get('Estado_Falla_GPS', False)
-            
-            # Extracción y limpieza de datos
-            ignicion_raw = unidad_con_falla_check.get("ignition", "false").lower()
-            # Uso de float() con valor por defecto seguro
-            velocidad = float(unidad_con_falla_check.get("speed_dunit", 0.0))
-            lat = float(unidad_con_falla_check.get("ylat", 0.0))
-            lon = float(unidad_con_falla_check.get("xlong", 0.0))
-            # unit_id debe ser único, usamos unitid o name como fallback
-            unit_id = unidad_con_falla_check.get("unitid", unidad_con_falla_check.get("name", "N/A_ID_FALLBACK")) 
-
-            ignicion_estado = ignicion_raw == "true"
-            
-            falla_gps_motivo = None
-            last_report_time_display = unidad_con_falla_check.get('LastReportTime', 'N/A')
-            
-            if es_falla_gps:
-                # Caso Falla GPS: Sobrescribe el estado y estilo
-                estado_final_display = unidad_con_falla_check['IGNICION_OVERRIDE']
-                card_style = unidad_con_falla_check['CARD_STYLE_OVERRIDE']
-                falla_gps_motivo = unidad_con_falla_check.get('FALLA_GPS_MOTIVO')
-                last_report_time_display = unidad_con_falla_check.get('LAST_REPORT_TIME_FOR_DETAIL', last_report_time_display)
-                
-                # Para fines de métricas, marcamos el tipo de resguardo como NINGUNO
-                en_sede = False
-                en_resguardo_secundario = False
-                en_vertedero = False # ¡NUEVO FLAG!
-                
-            else:
-                # --- CÁLCULO DE DISTANCIA A UBICACIONES DINÁMICAS ---
-                
-                # 1. ¿Está en el VERTEDERO? (Máxima Prioridad Operacional)
-                en_vertedero = False
-                for vertedero_coords in COORDENADAS_VERTEDERO:
-                    v_lat, v_lon = vertedero_coords
-                    distancia = haversine(lat, lon, v_lat, v_lon)
-                    if distancia <= PROXIMIDAD_KM:
-                        en_vertedero = True
-                        break 
-                
-                # 2. ¿Está en la SEDE? (Revisar solo si NO está en Vertedero)
-                en_sede = False
-                if not en_vertedero:
-                    for sede_coords in SEDE_COORDS:
-                        lat_sede, lon_sede = sede_coords
-                        distancia = haversine(lat, lon, lat_sede, lon_sede)
-                        if distancia <= PROXIMIDAD_KM:
-                            en_sede = True
-                            break 
-                
-                # 3. ¿Está en Resguardo Secundario? (Revisar solo si NO está en Vertedero ni Sede)
-                en_resguardo_secundario = False
-                if not en_vertedero and not en_sede and COORDENADAS_RESGUARDO_SECUNDARIO: 
-                    for resguardo_coords in COORDENADAS_RESGUARDO_SECUNDARIO:
-                        lat_res, lon_res = resguardo_coords
-                        distancia_resguardo = haversine(lat, lon, lat_res, lon_res)
-                        if distancia_resguardo <= PROXIMIDAD_KM:
-                            en_resguardo_secundario = True
-                            break
-                
-                # --- LÓGICA DE ESTADO FINAL ---
-                
-                estado_final_display = "Apagada ❄️" 
-                color_fondo = "#D32F2F" 
-                color_texto = "white"
-                
-                if en_vertedero:
-                    estado_final_display = "Vertedero 🚛"; 
-                    color_fondo = COLOR_VERTEDERO
-                    color_texto = "white" 
-                
-                elif ignicion_estado:
-                    if en_sede:
-                        estado_final_display = "Encendida (Sede) 🔥"; color_fondo = "#B37305"
-                    else:
-                        estado_final_display = "Encendida 🔥"; color_fondo = "#4CAF50"
-                
-                else: # Apagada
-                    if en_sede:
-                        estado_final_display = "Resguardo (Sede) 🛡️"; color_fondo = "#337ab7"
-                    elif en_resguardo_secundario:
-                        estado_final_display = "Resguardo (Fuera de Sede) 🛡️"; color_fondo = COLOR_RESGUARDO_SECUNDARIO
-                
-                card_style = f"background-color: {color_fondo}; padding: 15px; border-radius: 5px; color: {color_texto}; margin-bottom: 0px;"
-
-            datos_filtrados.append({
-                "UNIDAD": unidad_con_falla_check.get("name", "N/A"),
-                "UNIT_ID": unit_id, 
-                "IGNICION": estado_final_display, 
-                "VELOCIDAD": velocidad,
-                "LATITUD": lat,
-                "LONGITUD": lon,
-                "UBICACION_TEXTO": unidad_con_falla_check.get("location", "Dirección no disponible"),
-                "CARD_STYLE": card_style,
-                "FALLA_GPS_MOTIVO": falla_gps_motivo,
-                "LAST_REPORT_TIME_DISPLAY": last_report_time_display,
-                "STOP_DURATION_MINUTES": 0.0, # Inicializado para el DataFrame
-                "STOP_DURATION_TIMEDELTA": timedelta(seconds=0), # Inicializado para el DataFrame
-                # NUEVAS COLUMNAS PARA MÉTRICAS (incluido Vertedero)
-                "EN_SEDE_FLAG": en_sede,
-                "EN_RESGUARDO_SECUNDARIO_FLAG": en_resguardo_secundario,
-                "EN_VERTEDERO_FLAG": en_vertedero, # ¡NUEVO FLAG!
-                "ES_FALLA_GPS_FLAG": es_falla_gps
-            })
-        
-        # El DataFrame se devuelve con las columnas inicializadas
-        return pd.DataFrame(datos_filtrados)
+    return procesar_datos_unidades(flota_data, lista_unidades)
+
+
+def obtener_datos_flotas_lote(nombres_flotas: List[str], config: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Refresca varias flotas a la vez: todas van en paralelo por la sesión HTTP compartida.
+    El valor de una flota cuya consulta falló es la excepción (para el last-known-good del poller).
+    """
+    resultados = {}
+    ids_por_flota = {}
+    for nombre_flota in nombres_flotas:
+        fallback = _validar_configuracion_flota(nombre_flota, config)
+        if fallback is None:
+            ids_por_flota[nombre_flota] = config[nombre_flota]["ids"]
+
+    respuestas = consultar_flotas_concurrente(
+        SESION_HTTP, ids_por_flota, HEADERS, API_URL,
+        timeouts={n: config[n].get("timeout_segundos", TIMEOUT_API_SEGUNDOS) for n in ids_por_flota},
+        tamanos_lote={n: config[n].get("tamano_lote_ids", TAMANO_LOTE_IDS) for n in ids_por_flota}
+    )
+
+    for nombre_flota in nombres_flotas:
+        respuesta = respuestas.get(nombre_flota)
+        if respuesta is None:
+            resultados[nombre_flota] = _validar_configuracion_flota(nombre_flota, config)
+        elif isinstance(respuesta, Exception):
+            resultados[nombre_flota] = respuesta
+        else:
+            resultados[nombre_flota] = procesar_datos_unidades(config[nombre_flota], respuesta)
+    return resultados
+
+
+def procesar_datos_unidades(flota_data: Dict[str, Any], lista_unidades: List[Dict[str, Any]]) -> pd.DataFrame:
+    """
+    Convierte la lista 'DATA' de la API en el DataFrame de tarjetas (estado, estilo, banderas de ubicación).
+    No depende de los umbrales de Falla GPS: eso lo aplica cada sesión con aplicar_falla_gps.
+    """
+    if not lista_unidades:
+        return get_fallback_data("Lista de Unidades Vacía (Revisa IDs)")
+
+    # --- INGESTIÓN COLUMNAR (una pasada, columnas tipadas) ---
+    return clasificar_unidades(flota_data, ingerir_unidades(lista_unidades))
+
+
+def clasificar_unidades(flota_data: Dict[str, Any], df_unidades: pd.DataFrame) -> pd.DataFrame:
+    """
+    Agrega estado, estilo y banderas de ubicación al DataFrame de ingerir_unidades (lo modifica y lo retorna).
+    La usan tanto los datos en vivo como la reproducción del archivo.
+    """
+    n_unidades = len(df_unidades)
+
+    # --- CLASIFICACIÓN DE GEOCERCAS EN LOTE (todas las unidades en un solo cálculo) ---
+    geocercas = clasificar_geocercas(df_unidades["LATITUD"].to_numpy(), df_unidades["LONGITUD"].to_numpy(),
+                                     flota_data, PROXIMIDAD_KM)
+    en_vertedero = geocercas["EN_VERTEDERO_FLAG"]
+    en_sede = geocercas["EN_SEDE_FLAG"]
+    en_resguardo_secundario = geocercas["EN_RESGUARDO_SECUNDARIO_FLAG"]
+    ignicion_estado = df_unidades["IGNICION_ACTIVA"].to_numpy()
+
+    # --- LÓGICA DE ESTADO FINAL (vectorizada, mismo orden de prioridad que antes) ---
+    estado_final = np.select(
+        [
+            en_vertedero,
+            ignicion_estado & en_sede,
+            ignicion_estado,
+            en_sede,
+            en_resguardo_secundario,
+        ],
+        ["Vertedero 🚛", "Encendida (Sede) 🔥", "Encendida 🔥", "Resguardo (Sede) 🛡️", "Resguardo (Fuera de Sede) 🛡️"],
+        default="Apagada ❄️"
+    )
+    df_unidades["IGNICION"] = pd.Categorical(estado_final, categories=ESTADOS_TARJETA)
+    # El estilo se deriva del estado: una sola cadena CSS por categoría, no una por unidad
+    df_unidades["CARD_STYLE"] = pd.Categorical.from_codes(df_unidades["IGNICION"].cat.codes, categories=ESTILOS_TARJETA)
 
-    except requests.exceptions.RequestException as e:
-        error_msg = f"API Error: {e}" if not hasattr(e, 'response') else f"HTTP Error: {e.response.status_code}"
-        print(f"❌ Error de Conexión/API: {error_msg}")
-        return get_fallback_data("Error de Conexión/API")
+    df_unidades["FALLA_GPS_MOTIVO"] = None # Lo completa aplicar_falla_gps en cada sesión
+    df_unidades["STOP_DURATION_MINUTES"] = 0.0 # Inicializado para el DataFrame
+    df_unidades["STOP_DURATION_TIMEDELTA"] = pd.to_timedelta(np.zeros(n_unidades), unit="s") # Inicializado para el DataFrame
+    # NUEVAS COLUMNAS PARA MÉTRICAS (incluido Vertedero)
+    df_unidades["EN_SEDE_FLAG"] = en_sede
+    df_unidades["EN_RESGUARDO_SECUNDARIO_FLAG"] = en_resguardo_secundario
+    df_unidades["EN_VERTEDERO_FLAG"] = en_vertedero # ¡NUEVO FLAG!
+    df_unidades["ES_FALLA_GPS_FLAG"] = False # Lo evalúa aplicar_falla_gps en cada sesión
+    df_unidades["DISTANCIA_SITIO_KM"] = geocercas["DISTANCIA_SITIO_KM"]
+
+    # El DataFrame se devuelve con las columnas inicializadas
+    return df_unidades
 
 
 # --- FUNCIÓN PARA MOSTRAR LA LEYENDA DE COLORES EN EL SIDEBAR ---
@@ -565,11 +573,38 @@ def save_dynamic_config():
     st.session_state['config_params']['GPS_MIN_ENCENDIDA'] = st.session_state['input_gps_min_on_temp']
     st.session_state['config_params']['GPS_MIN_APAGADA'] = st.session_state['input_gps_min_off_temp']
     
-    # Limpiar la caché para que la próxima llamada a la API use los nuevos parámetros
-    st.cache_data.clear()
+    # 🚨 INVALIDACIÓN ACOTADA: Solo se refresca la flota de esta sesión (nunca st.cache_data.clear(),
+    # que borraría la caché de TODOS los usuarios, incluida la configuración de flotas).
+    # Los umbrales GPS se aplican por sesión sobre el snapshot, así que no requieren nueva consulta.
+    flota_actual = st.session_state.get('flota_seleccionada')
+    if flota_actual:
+        obtener_poller_flotas().invalidar(lambda clave: clave == flota_actual)
     
     st.toast("✅ Configuración guardada y aplicada!", icon='💾')
 
+def simular_umbrales():
+    """
+    Cuenta las alertas que habría producido el día archivado elegido con umbrales alrededor de los del
+    formulario (sin guardarlos). El resultado se muestra en el panel de configuración.
+    """
+    flota_actual = st.session_state.get('flota_seleccionada')
+    fecha = st.session_state.get('simulacion_fecha')
+    if not flota_actual or not fecha:
+        return
+    parada = st.session_state['input_stop_threshold_temp']
+    velocidad = st.session_state['input_speed_threshold_temp']
+    gps_encendida = st.session_state['input_gps_min_on_temp']
+    gps_apagada = st.session_state['input_gps_min_off_temp']
+
+    tabla = evaluar_umbrales(
+        cargar_reportes_dia(RUTA_ARCHIVO_TELEMETRIA, flota_actual, fecha),
+        umbrales_parada=sorted({max(1, parada + delta) for delta in (-5, 0, 5, 10)}),
+        umbrales_velocidad=sorted({max(10, velocidad + delta) for delta in (-10, -5, 0, 5, 10)}),
+        gps_min_encendida=sorted({gps_encendida, gps_encendida * 2}),
+        gps_min_apagada=sorted({gps_apagada, gps_apagada + 30}),
+    )
+    st.session_state['resultado_simulacion'] = {'flota': flota_actual, 'fecha': fecha, 'tabla': tabla}
+
 # --- INICIALIZACIÓN DEL ESTADO DE SESIÓN ---
 
 if 'flota_seleccionada' not in st.session_state:
@@ -578,6 +613,14 @@ if 'filtro_en_ruta' not in st.session_state:
     st.session_state['filtro_en_ruta'] = False
 if 'filtro_estado_especifico' not in st.session_state: 
     st.session_state['filtro_estado_especifico'] = "Mostrar Todos"
+# Paginación de la rejilla de tarjetas: solo se describe y dibuja la página visible
+OPCIONES_TARJETAS_POR_PAGINA = [25, 50, 100, 200]
+if 'pagina_tarjetas' not in st.session_state:
+    st.session_state['pagina_tarjetas'] = 0
+if 'tarjetas_por_pagina' not in st.session_state:
+    st.session_state['tarjetas_por_pagina'] = 50
+if 'ordenar_por_severidad' not in st.session_state:
+    st.session_state['ordenar_por_severidad'] = True
 if 'authenticated' not in st.session_state:
     st.session_state['authenticated'] = False
 if 'config_params' not in st.session_state:
@@ -590,36 +633,135 @@ if 'config_params' not in st.session_state:
         'TIME_SLEEP': 3
     }
 
+# Base SQLite local donde se respalda el historial de paradas entre reinicios
+RUTA_ESTADO_DB = "estado_unidades.sqlite3"
+
 # 🚨 NUEVA FUNCIÓN COMPARTIDA: Almacena el estado de parada globalmente (Shared State) 🚨
 @st.cache_resource(ttl=None) 
-def get_global_stop_state() -> Dict[str, Any]:
-    """Retorna un diccionario de estado que es único y compartido por todos los usuarios (Global State)."""
-    # Usaremos una simple clave para almacenar el estado de cada unidad
-    return {}
+def get_global_stop_state() -> AlmacenEstadoUnidades:
+    """Retorna el historial de paradas que es único y compartido por todos los usuarios (Global State)."""
+    # Particionado por flota, protegido con lock y con desalojo por TTL (ver estado_unidades.py).
+    # Se respalda en SQLite para que un reinicio no reinicie los temporizadores de parada.
+    try:
+        persistencia = PersistenciaEstadoSQLite(RUTA_ESTADO_DB)
+    except Exception as e:
+        print(f"❌ [ESTADO] No se pudo abrir {RUTA_ESTADO_DB}, el estado será solo en memoria: {e}")
+        persistencia = None
+    return AlmacenEstadoUnidades(persistencia=persistencia)
 
 # Inicializar y obtener la referencia al estado global (se ejecuta una sola vez)
 current_stop_state = get_global_stop_state()
 # ------------------------------------------------------------------------------------
 
+# 🚨 POLLER COMPARTIDO: Una sola consulta a la API por flota e intervalo para todo el proceso 🚨
+INTERVALO_POLLER_SEGUNDOS = 5 # Frecuencia con la que el hilo de fondo refresca cada flota
+INTERVALO_SIN_LECTORES_SEGUNDOS = 30 # Flotas que nadie mira: se siguen consultando para el historial de paradas
+
+@st.cache_resource(ttl=None)
+def obtener_historial_posiciones() -> HistorialPosiciones:
+    """Buffers circulares de posiciones por unidad (únicos por proceso, los llena el poller)."""
+    return HistorialPosiciones()
+
+historial_posiciones = obtener_historial_posiciones()
+
+# Archivo histórico (Parquet por flota y día). Requiere pyarrow; sin él queda deshabilitado.
+RUTA_ARCHIVO_TELEMETRIA = "archivo_telemetria"
+
+@st.cache_resource(ttl=None)
+def obtener_archivo_telemetria():
+    """Archivo append-only de snapshots (único por proceso) o None si pyarrow no está instalado."""
+    if not pyarrow_disponible():
+        print("⚠️ [ARCHIVO] pyarrow no está instalado: no se archivará la telemetría.")
+        return None
+    archivo = ArchivoTelemetria(RUTA_ARCHIVO_TELEMETRIA)
+    atexit.register(archivo.vaciar) # Lo acumulado en memoria se escribe al cerrar el proceso
+    return archivo
+
+archivo_telemetria = obtener_archivo_telemetria()
+
+def registrar_movimiento(nombre_flota: str, resultado: Any) -> Any:
+    """
+    Alimenta el historial de paradas, el de posiciones y el archivo con cada consulta REAL del poller (no con
+    cada lectura de una sesión), así las paradas no dependen de quién tiene el dashboard abierto.
+    """
+    if isinstance(resultado, pd.DataFrame) and not resultado.empty and "FALLBACK" not in str(resultado["UNIDAD"].iloc[0]):
+        ahora = obtener_hora_venezuela()
+        current_stop_state.registrar_snapshot(nombre_flota, resultado, ahora)
+        historial_posiciones.agregar_snapshot(resultado, ahora)
+        historial_posiciones.desalojar(pd.Timestamp(ahora) - pd.Timedelta(hours=TTL_ESTADO_HORAS))
+        if archivo_telemetria is not None:
+            archivo_telemetria.agregar(nombre_flota, resultado, ahora)
+    return resultado
+
+@st.cache_resource(ttl=None)
+def obtener_poller_flotas() -> PollerFlotas:
+    """Retorna el poller único del proceso. Todas las sesiones leen de sus snapshots."""
+    poller = PollerFlotas(
+        lambda nombre_flota: registrar_movimiento(nombre_flota, obtener_datos_unidades(nombre_flota, FLOTAS_CONFIG)),
+        intervalo_segundos=INTERVALO_POLLER_SEGUNDOS,
+        funcion_consulta_lote=lambda claves: {
+            nombre_flota: registrar_movimiento(nombre_flota, resultado)
+            for nombre_flota, resultado in obtener_datos_flotas_lote(claves, FLOTAS_CONFIG).items()
+        },
+        funcion_fallback=_fallback_por_error_api,
+        intervalo_sin_lectores_segundos=INTERVALO_SIN_LECTORES_SEGUNDOS
+    )
+    # Todas las flotas configuradas se siguen aunque no haya sesiones abiertas
+    poller.suscribir_permanente(FLOTAS_CONFIG.keys())
+    return poller
+
+poller_flotas = obtener_poller_flotas()
+
 # El resto de variables deben seguir usando st.session_state ya que son locales a cada usuario.
 if 'alertas_descartadas' not in st.session_state:
     st.session_state['alertas_descartadas'] = {}
 if 'alertas_velocidad_descartadas' not in st.session_state:
     st.session_state['alertas_velocidad_descartadas'] = {}
-if 'reproducir_audio_alerta' not in st.session_state:
-    st.session_state['reproducir_audio_alerta'] = False
-if 'reproducir_audio_velocidad' not in st.session_state:
-    st.session_state['reproducir_audio_velocidad'] = False
+# Unidades con alerta pendiente en el último ciclo: el audio suena cuando entra alguna nueva
+if 'unidades_alerta_parada' not in st.session_state:
+    st.session_state['unidades_alerta_parada'] = set()
+if 'unidades_alerta_velocidad' not in st.session_state:
+    st.session_state['unidades_alerta_velocidad'] = set()
 if 'log_historial' not in st.session_state:
     st.session_state['log_historial'] = [] 
+# Excesos de velocidad: dependen del umbral de ESTA sesión, así que su estado es por sesión (por flota)
+if 'estado_excesos' not in st.session_state:
+    st.session_state['estado_excesos'] = {}
+# Último evento de fin de parada ya registrado en el log de esta sesión (por flota)
+if 'secuencia_eventos_parada' not in st.session_state:
+    st.session_state['secuencia_eventos_parada'] = {}
+
+# Fuente de datos de esta sesión: el poller (en vivo) o la reproducción del archivo histórico
+FUENTE_EN_VIVO = "En Vivo 📡"
+FUENTE_REPRODUCCION = "Reproducción ⏪"
+VELOCIDAD_REPRODUCCION_INICIAL = 10
+if 'fuente_datos' not in st.session_state:
+    st.session_state['fuente_datos'] = FUENTE_EN_VIVO
+if 'reproduccion' not in st.session_state:
+    st.session_state['reproduccion'] = None
+# (versión de los datos, hora monotónica) del último ciclo de monitoreo dibujado: con ellas vigilar_datos
+# decide, sin dibujar nada, si hay algo nuevo que mostrar
+if 'ciclo_dibujado' not in st.session_state:
+    st.session_state['ciclo_dibujado'] = None
 
 
 # --- CONFIGURACION DEL SIDEBAR ---
 
 def actualizar_dashboard():
-    """Función de callback para re-ejecutar el script al cambiar el filtro o flota."""
-    st.cache_data.clear() 
-    pass
+    """
+    Función de callback para re-ejecutar el script al cambiar el filtro o flota.
+    Los filtros solo cambian la presentación: NO se limpia ninguna caché ni se consulta la API.
+    Se vuelve a la primera página de tarjetas.
+    """
+    st.session_state['pagina_tarjetas'] = 0
+
+def cambiar_pagina_tarjetas(desplazamiento: int):
+    """Callback de los botones de página (el ciclo la acota al número real de páginas)."""
+    st.session_state['pagina_tarjetas'] = max(0, st.session_state['pagina_tarjetas'] + desplazamiento)
+
+def reiniciar_reproduccion():
+    """Vuelve a reproducir desde la hora elegida (se recrea en el próximo ciclo)."""
+    st.session_state['reproduccion'] = None
 
 with st.sidebar:
     # 1. SELECCIÓN DE FLOTA
@@ -647,6 +789,35 @@ with st.sidebar:
     else:
         st.session_state['flota_seleccionada'] = flota_actual
 
+    # 2. FUENTE DE DATOS: en vivo o reproducción acelerada del archivo histórico
+    st.radio(
+        "Fuente de datos:",
+        options=[FUENTE_EN_VIVO, FUENTE_REPRODUCCION],
+        key="fuente_datos",
+        on_change=actualizar_dashboard,
+        horizontal=True,
+        label_visibility="collapsed"
+    )
+
+    if st.session_state['fuente_datos'] == FUENTE_REPRODUCCION:
+        if archivo_telemetria is None:
+            st.warning("La reproducción requiere **pyarrow** (`pip install pyarrow`).")
+        elif st.session_state['flota_seleccionada']:
+            dias_disponibles = dias_archivados(RUTA_ARCHIVO_TELEMETRIA, st.session_state['flota_seleccionada'])
+            if not dias_disponibles:
+                st.info("Todavía no hay datos archivados de esta flota.")
+            else:
+                if st.session_state.get('reproduccion_fecha') not in dias_disponibles:
+                    st.session_state.pop('reproduccion_fecha', None) # Día de otra flota: se vuelve al más reciente
+                st.selectbox("Día a reproducir", options=dias_disponibles, key="reproduccion_fecha")
+                st.slider("Desde la hora", min_value=0, max_value=23, value=0, step=1, key="reproduccion_hora")
+                st.slider(
+                    "Velocidad de Reproducción (×)", min_value=VELOCIDAD_MINIMA, max_value=VELOCIDAD_MAXIMA,
+                    value=VELOCIDAD_REPRODUCCION_INICIAL, step=1, key="reproduccion_velocidad",
+                    help="Minutos del archivo por minuto real. Todos los sondeos se procesan aunque solo se dibuje el último."
+                )
+                st.button("⏮️ Reiniciar Reproducción", on_click=reiniciar_reproduccion, use_container_width=True)
+
 
     # --- NUEVA SECCIÓN: CONFIGURACIÓN DINÁMICA DE PARÁMETROS ---
     with st.expander("⚙️ **Configuración Dinámica**", expanded=st.session_state['authenticated']):
@@ -670,10 +841,10 @@ with st.sidebar:
                 value=st.session_state['config_params']['TIME_SLEEP'], 
                 step=1, 
                 key="input_time_sleep_temp", 
-                help="Tiempo de espera entre actualizaciones completas del Dashboard (tiempo.sleep)."
+                help="En vivo: tiempo máximo sin redibujar cuando el poller no publica datos nuevos (nunca menos que su intervalo); los datos nuevos se muestran en ~1 segundo. En reproducción: pausa entre ciclos."
             )
             
-            st.caption(f"TTL de Datos (API): **5 segundos** (fijo en el código, pero se limpia con cada cambio de parámetro).")
+            st.caption(f"Refresco de Datos (API): **{INTERVALO_POLLER_SEGUNDOS} segundos** (poller compartido por todas las sesiones).")
             
             st.markdown("##### Umbrales de Alerta")
             
@@ -720,6 +891,26 @@ with st.sidebar:
                 use_container_width=True,
                 key="btn_save_config"
             )
+
+            # --- SIMULACIÓN: ¿cuántas alertas habría dado un día archivado con otros umbrales? ---
+            if archivo_telemetria is not None and st.session_state['flota_seleccionada']:
+                dias_simulacion = dias_archivados(RUTA_ARCHIVO_TELEMETRIA, st.session_state['flota_seleccionada'])
+                if dias_simulacion:
+                    st.markdown("##### Simulación sobre el Archivo")
+                    if st.session_state.get('simulacion_fecha') not in dias_simulacion:
+                        st.session_state.pop('simulacion_fecha', None)
+                    st.selectbox("Día a simular", options=dias_simulacion, key="simulacion_fecha")
+                    st.button(
+                        "🧪 Simular Umbrales del Formulario",
+                        on_click=simular_umbrales,
+                        use_container_width=True,
+                        key="btn_simular_umbrales",
+                        help="Paradas largas, excesos y fallas GPS que habría producido ese día con umbrales cercanos a los del formulario."
+                    )
+                    resultado_simulacion = st.session_state.get('resultado_simulacion')
+                    if resultado_simulacion and resultado_simulacion['flota'] == st.session_state['flota_seleccionada']:
+                        st.caption(f"Resultado para **{resultado_simulacion['flota']}**, día **{resultado_simulacion['fecha']}**:")
+                        st.dataframe(resultado_simulacion['tabla'], hide_index=True, use_container_width=True)
             
         else:
             # --- USUARIO NO AUTENTICADO: SOLICITAR CONTRASEÑA ---
@@ -774,6 +965,23 @@ with st.sidebar:
             )
 # --- FIN DEL EXPANDER DE FILTROS ---
 
+        # --- VISTA DE TARJETAS: orden y paginación ---
+        with st.expander("Vista de Tarjetas 🗂️", expanded=False):
+            st.checkbox(
+                "Ordenar por severidad (Paradas Largas, Excesos y Falla GPS primero)",
+                key="ordenar_por_severidad",
+                on_change=actualizar_dashboard
+            )
+            st.selectbox(
+                "Tarjetas por página",
+                options=OPCIONES_TARJETAS_POR_PAGINA,
+                key="tarjetas_por_pagina",
+                on_change=actualizar_dashboard
+            )
+            col_anterior, col_siguiente = st.columns(2)
+            col_anterior.button("◀ Anterior", on_click=cambiar_pagina_tarjetas, args=(-1,), use_container_width=True)
+            col_siguiente.button("Siguiente ▶", on_click=cambiar_pagina_tarjetas, args=(1,), use_container_width=True)
+
     # --- PLACEHOLDERS EN EL SIDEBAR (Declaración única) ---
     metricas_placeholder = st.empty() # Este es el placeholder que contendrá el expander de estadísticas.
     st.markdown("---")
@@ -787,7 +995,15 @@ with st.sidebar:
     debug_status_placeholder = st.empty()
     log_placeholder = st.empty() 
     
-# --- Función para generar la línea de métrica con estilo (Fuera del sidebar para uso en el loop) ---
+def formatear_antiguedad(segundos: float) -> str:
+    """Texto corto para la antigüedad de un snapshot (seg / min / horas)."""
+    if segundos < 60:
+        return f"{segundos:.0f} seg"
+    if segundos < 3600:
+        return f"{int(segundos // 60)} min {int(segundos % 60):02} seg"
+    return f"{(segundos / 3600.0):.1f} horas"
+
+# --- Función para generar la línea de métrica con estilo (Fuera del sidebar para uso en el ciclo de monitoreo) ---
 def format_metric_line(label, value=None, value_size="1.5rem", is_header=False, is_section_title=False):
     """Genera el HTML para las métricas con estilo unificado: Etiqueta a la izquierda, Valor a la derecha."""
         
@@ -810,16 +1026,269 @@ def format_metric_line(label, value=None, value_size="1.5rem", is_header=False,
     """
     return html_content
 
-# === BUCLE PRINCIPAL (while True) ===
+# --- DETECCIÓN POR SESIÓN (paradas largas, excesos y log), común a datos en vivo y reproducción ---
+def detectar_eventos_sesion(df_data_original: pd.DataFrame, flota: str, almacen_paradas: AlmacenEstadoUnidades,
+                            estados_excesos: Dict[str, EstadoExcesos], secuencias_eventos: Dict[str, int],
+                            now: pd.Timestamp, config: Dict[str, Any], hora_consulta: pd.Timestamp) -> None:
+    """
+    Completa STOP_DURATION_* en `df_data_original` (copia de la sesión, con Falla GPS ya aplicada) y agrega al
+    log de la sesión los excesos de velocidad y las paradas largas que terminaron. `hora_consulta` es la hora
+    en que se consultaron esos datos (ubica cada reporte dentro de su minuto de LastReportTime).
+    """
+    # Determinar si la unidad NO está en ninguna zona de resguardo/sede/vertedero
+    is_out_of_hq = ~(df_data_original['EN_SEDE_FLAG'] | df_data_original['EN_RESGUARDO_SECUNDARIO_FLAG'] |
+                     df_data_original['EN_VERTEDERO_FLAG'] | df_data_original['ES_FALLA_GPS_FLAG']).to_numpy(dtype=bool)
+    unit_ids = df_data_original['UNIT_ID'].to_numpy()
+    velocidades = df_data_original['VELOCIDAD'].to_numpy()
+
+    # Duración de parada: desde el último reporte en movimiento (historial que alimenta el poller)
+    minutos_parada, duracion_parada = almacen_paradas.duraciones_parada(flota, unit_ids, velocidades, now)
+    df_data_original['STOP_DURATION_MINUTES'] = minutos_parada
+    df_data_original['STOP_DURATION_TIMEDELTA'] = duracion_parada
+
+    # Excesos de velocidad con el umbral de esta sesión (un reporte repetido no cuenta dos veces)
+    estado_excesos = estados_excesos.setdefault(flota, EstadoExcesos())
+    excesos = estado_excesos.aplicar_snapshot(
+        unit_ids, velocidades, is_out_of_hq, df_data_original['LAST_REPORT_DT'].to_numpy(), now, config['SPEED_THRESHOLD_KPH'],
+        horas_consulta=hora_consulta
+    )
 
-# Placeholder para el contenido principal (Tarjetas)
-placeholder_main_content = st.empty() 
+    # --- LOG: solo las filas que cambiaron de estado ---
+    hora_log = now.strftime('%H:%M:%S')
+    for pos in np.flatnonzero(excesos['FIN_EXCESO_FLAG']):
+        nombre_unidad = df_data_original['UNIDAD'].iat[pos]
+        nombre_unidad_display = nombre_unidad.split('-')[0] if '-' in nombre_unidad else nombre_unidad
+
+        # --- LÓGICA DE EXCESO DE VELOCIDAD (END/LOG) ---
+        log_message = (
+            f"**🟡 {hora_log}** | Unidad: **{nombre_unidad_display}** "
+            f"| Exceso de Velocidad Máx: **{excesos['VELOCIDAD_MAXIMA_EXCESO'][pos]:.1f} Km/h** "
+            f"| por: **{excesos['DURACION_EXCESO_MIN'][pos]:.1f} min** "
+            f"| en Dirección: {df_data_original['UBICACION_TEXTO'].iat[pos]}"
+        )
+        st.session_state['log_historial'].insert(0, log_message)
+
+    # --- LÓGICA DE PARADA LARGA (Log FIN Parada Larga, eventos que publica el historial de paradas) ---
+    eventos_parada, secuencia = almacen_paradas.eventos_desde(flota, secuencias_eventos.get(flota))
+    secuencias_eventos[flota] = secuencia
+    for evento in eventos_parada:
+        # Solo se registran las paradas que fueron "largas" fuera de base con el umbral de esta sesión
+        if not evento['PARADA_FUERA_DE_BASE_MIN'] > config['STOP_THRESHOLD_MINUTES']:
+            continue
+        nombre_unidad = evento['UNIDAD']
+        nombre_unidad_display = nombre_unidad.split('-')[0] if '-' in nombre_unidad else nombre_unidad
+        log_message = (
+            f"**🟢 {evento['HORA_REPORTE'].strftime('%H:%M:%S')}** | Unidad: **{nombre_unidad_display}** "
+            f"| FIN de Parada Larga, por: **{evento['PARADA_FINALIZADA_MIN']:.1f} min** "
+            f"| Ubicación: {evento['UBICACION_TEXTO']}"
+        )
+        st.session_state['log_historial'].insert(0, log_message)
+
+    en_movimiento = velocidades > 1.0
+    if en_movimiento.any():
+        # Reinicio de estados de alerta al moverse
+        unidades_en_movimiento = set(df_data_original['UNIDAD'].to_numpy()[en_movimiento])
+        for clave_descartes in ('alertas_descartadas', 'alertas_velocidad_descartadas'):
+            descartadas = st.session_state[clave_descartes]
+            for unidad in unidades_en_movimiento.intersection(descartadas):
+                del descartadas[unidad]
+
+
+# --- ⏪ REPRODUCCIÓN DEL ARCHIVO (por sesión) ---
+def obtener_reproduccion_sesion(flota: str):
+    """
+    Reproducción de esta sesión para la flota, día y hora elegidos en el sidebar (se recrea si cambian).
+    Tiene su propio historial de paradas y de excesos: nunca toca el estado compartido en vivo.
+    """
+    fecha = st.session_state.get('reproduccion_fecha')
+    if archivo_telemetria is None or not fecha:
+        return None
+    parametros = (flota, fecha, st.session_state.get('reproduccion_hora', 0))
+    reproduccion_sesion = st.session_state['reproduccion']
+    if reproduccion_sesion is None or reproduccion_sesion['parametros'] != parametros:
+        reproduccion_sesion = st.session_state['reproduccion'] = {
+            'parametros': parametros,
+            'reproduccion': ReproduccionArchivo(
+                RUTA_ARCHIVO_TELEMETRIA, flota, fecha,
+                velocidad=st.session_state.get('reproduccion_velocidad', VELOCIDAD_REPRODUCCION_INICIAL),
+                desde=pd.Timestamp(fecha) + pd.Timedelta(hours=parametros[2])
+            ),
+            'estado_paradas': AlmacenEstadoUnidades(),
+            'estado_excesos': {},
+            'secuencia_eventos_parada': {},
+            'snapshot': None,
+        }
+    reproduccion_sesion['reproduccion'].cambiar_velocidad(
+        st.session_state.get('reproduccion_velocidad', VELOCIDAD_REPRODUCCION_INICIAL)
+    )
+    return reproduccion_sesion
 
-# Usamos la referencia al estado global obtenida antes del bucle
-# current_stop_state = get_global_stop_state()
+def avanzar_reproduccion(reproduccion_sesion: Dict[str, Any], config: Dict[str, Any]) -> bool:
+    """
+    Aplica los sondeos archivados que ya "ocurrieron" según el reloj de la reproducción (todos, para no perder
+    eventos a 100×) y deja el último como snapshot a mostrar. Retorna False si todavía no hay nada que mostrar.
+    """
+    reproduccion = reproduccion_sesion['reproduccion']
+    sondeos = reproduccion.avanzar()
+    for indice, (hora_consulta, df_ingestion) in enumerate(sondeos):
+        flota = reproduccion.flota
+        df_sondeo = clasificar_unidades(FLOTAS_CONFIG[flota], df_ingestion)
+        # Lo mismo que hace registrar_movimiento con cada consulta real del poller
+        reproduccion_sesion['estado_paradas'].registrar_snapshot(flota, df_sondeo, hora_consulta)
+        if indice < len(sondeos) - 1:
+            # Sondeos intermedios: alertas y log igual que si la sesión los hubiera visto (el último lo procesa el ciclo)
+            hora_sondeo = hora_consulta.tz_localize('America/Caracas')
+            df_sesion = aplicar_falla_gps(df_sondeo.copy(), hora_sondeo, config['GPS_MIN_ENCENDIDA'], config['GPS_MIN_APAGADA'])
+            detectar_eventos_sesion(df_sesion, flota, reproduccion_sesion['estado_paradas'],
+                                    reproduccion_sesion['estado_excesos'],
+                                    reproduccion_sesion['secuencia_eventos_parada'], hora_sondeo, config,
+                                    hora_sondeo)
+        else:
+            hora_epoch = hora_consulta.tz_localize(VENEZUELA_TZ).timestamp()
+            reproduccion_sesion['snapshot'] = SnapshotFlota(
+                datos=df_sondeo, hora_consulta=hora_epoch, version=reproduccion.sondeos_entregados,
+                hora_ultimo_exito=hora_epoch
+            )
+    return reproduccion_sesion['snapshot'] is not None
 
-while True:
-    
+
+# --- 📡 DETECCIÓN DE DATOS NUEVOS (sin esperas ni redibujos) ---
+INTERVALO_REVISION_SEGUNDOS = 1 # Cada cuánto vigilar_datos mira si hay datos nuevos (sin dibujar nada)
+
+def ciclo_pendiente(flota: str, config: Dict[str, Any]) -> bool:
+    """
+    True si el ciclo de monitoreo tiene algo nuevo que mostrar. En vivo: el poller publicó una versión distinta
+    de la dibujada, o no publicó nada en TIME_SLEEP segundos (al menos un intervalo del poller) y hay que
+    actualizar la antigüedad y la Falla GPS. En reproducción: ya "ocurrió" otro sondeo y pasaron TIME_SLEEP
+    segundos desde el último ciclo. Solo compara: nunca espera ni dibuja.
+    """
+    dibujado = st.session_state['ciclo_dibujado']
+    if dibujado is None:
+        return False
+    version_dibujada, hora_dibujado = dibujado
+    transcurrido = time.monotonic() - hora_dibujado
+    if st.session_state['fuente_datos'] == FUENTE_REPRODUCCION:
+        reproduccion_sesion = st.session_state['reproduccion']
+        return (reproduccion_sesion is not None and transcurrido >= config['TIME_SLEEP']
+                and reproduccion_sesion['reproduccion'].sondeo_pendiente())
+    snapshot = poller_flotas.obtener_snapshot(flota)
+    return (snapshot.version != version_dibujada
+            or transcurrido >= max(config['TIME_SLEEP'], INTERVALO_POLLER_SEGUNDOS))
+
+
+# --- TARJETAS DE UNIDADES (descripción pura; el HTML lo arma tarjetas_unidades.py) ---
+COLUMNS_PER_ROW = 5
+ESTILO_PARADA_LARGA = "background-color: #FFC107; padding: 15px; border-radius: 5px; color: black; margin-bottom: 0px;"
+
+def ordenar_por_severidad(df_data_mostrada: pd.DataFrame, stop_threshold_minutes: float,
+                          speed_threshold_kph: float) -> pd.DataFrame:
+    """
+    Paradas largas (la más larga primero), excesos de velocidad (el más rápido primero) y Falla GPS antes que
+    el resto, que conserva el orden de la flota. Mismas condiciones que el resaltado de las tarjetas.
+    """
+    velocidades = df_data_mostrada['VELOCIDAD'].to_numpy(dtype=np.float64)
+    minutos_parada = df_data_mostrada['STOP_DURATION_MINUTES'].to_numpy(dtype=np.float64)
+    es_falla_gps = df_data_mostrada['ES_FALLA_GPS_FLAG'].to_numpy(dtype=bool)
+    fuera_de_base = ~(df_data_mostrada['EN_SEDE_FLAG'] | df_data_mostrada['EN_RESGUARDO_SECUNDARIO_FLAG'] |
+                      df_data_mostrada['EN_VERTEDERO_FLAG']).to_numpy(dtype=bool)
+
+    parada_larga = ~es_falla_gps & fuera_de_base & (minutos_parada > stop_threshold_minutes) & (velocidades < 1.0)
+    exceso = ~es_falla_gps & ~parada_larga & (velocidades >= speed_threshold_kph)
+    severidad = np.select([parada_larga, exceso, es_falla_gps], [0, 1, 2], default=3)
+    # Dentro de cada grupo: mayor duración / mayor velocidad primero (np.lexsort es estable: el resto no se mueve)
+    desempate = np.select([parada_larga, exceso], [-minutos_parada, -velocidades], default=0.0)
+    return df_data_mostrada.iloc[np.lexsort((desempate, severidad))]
+
+# Ventana del desplazamiento que muestra cada tarjeta (sale del historial de posiciones del poller)
+MINUTOS_DESPLAZAMIENTO = 20
+
+def desplazamientos_km(df_pagina: pd.DataFrame, now: pd.Timestamp) -> np.ndarray:
+    """
+    Distancia en línea recta (km) entre la posición actual de cada unidad y la que tenía hace
+    MINUTOS_DESPLAZAMIENTO minutos según el historial de posiciones (NaN si no hay una muestra tan antigua).
+    """
+    anteriores = historial_posiciones.posicion_en(df_pagina['UNIT_ID'], now - pd.Timedelta(minutes=MINUTOS_DESPLAZAMIENTO))
+    return haversine(anteriores['LATITUD'].to_numpy(), anteriores['LONGITUD'].to_numpy(),
+                     df_pagina['LATITUD'].to_numpy(dtype=np.float64), df_pagina['LONGITUD'].to_numpy(dtype=np.float64))
+
+def describir_tarjetas(df_data_mostrada: pd.DataFrame, stop_threshold_minutes: float,
+                       speed_threshold_kph: float, desplazamientos: Optional[np.ndarray] = None) -> List[TarjetaUnidad]:
+    """
+    Contenido visible de cada tarjeta (mismo orden que el DataFrame), con los umbrales de esta sesión.
+    `desplazamientos` (km, ver desplazamientos_km) es opcional: sin él las tarjetas no lo muestran.
+    """
+    if desplazamientos is None:
+        desplazamientos = np.full(len(df_data_mostrada), np.nan)
+    tarjetas = []
+    for (unidad, velocidad_float, card_style, estado_ignicion, stop_duration, en_sede, en_resguardo, en_vertedero,
+         es_falla_gps, falla_motivo, last_report_display, ubicacion, latitud, longitud, desplazamiento) in zip(
+            df_data_mostrada['UNIDAD'], df_data_mostrada['VELOCIDAD'], df_data_mostrada['CARD_STYLE'],
+            df_data_mostrada['IGNICION'], df_data_mostrada['STOP_DURATION_MINUTES'], df_data_mostrada['EN_SEDE_FLAG'],
+            df_data_mostrada['EN_RESGUARDO_SECUNDARIO_FLAG'], df_data_mostrada['EN_VERTEDERO_FLAG'],
+            df_data_mostrada['ES_FALLA_GPS_FLAG'], df_data_mostrada['FALLA_GPS_MOTIVO'],
+            df_data_mostrada['LAST_REPORT_TIME_DISPLAY'], df_data_mostrada['UBICACION_TEXTO'],
+            df_data_mostrada['LATITUD'], df_data_mostrada['LONGITUD'], desplazamientos):
+
+        estado_display = estado_ignicion
+        color_velocidad = "white"
+
+        # Determinar si la unidad NO está en ninguna zona crítica
+        is_out_of_hq_status = not (en_sede or en_resguardo or en_vertedero or es_falla_gps)
+
+        # Lógica de Precedencia: Falla GPS > Parada Larga > Exceso de Velocidad
+        if es_falla_gps:
+            color_velocidad = "black"
+        else:
+            # Resaltado visual para Parada Larga
+            if stop_duration > stop_threshold_minutes and velocidad_float < 1.0 and is_out_of_hq_status:
+                card_style = ESTILO_PARADA_LARGA
+                estado_display = f"Parada Larga 🛑: {stop_duration:.0f} min"
+                color_velocidad = "black"
+
+            # Resaltado visual para Exceso de Velocidad
+            elif velocidad_float > speed_threshold_kph + 4.0:
+                color_velocidad = "#D32F2F" # ROJO (Crítico)
+                estado_display = "EXCESO VELOCIDAD 🚨"
+            elif velocidad_float >= speed_threshold_kph:
+                color_velocidad = "#FF9800" # NARANJA (Alerta)
+                estado_display = "Alerta Velocidad ⚠️"
+
+        # El texto de la velocidad debe ser negro si el fondo es claro (Vertedero o Falla GPS)
+        if (COLOR_VERTEDERO == "#FCC6BB" and en_vertedero) or es_falla_gps:
+            color_velocidad = "black"
+
+        tarjetas.append(TarjetaUnidad(
+            nombre=unidad.split('-')[0] if '-' in unidad else unidad,
+            velocidad=f"{velocidad_float:.0f}",
+            estado=estado_display,
+            estilo=card_style,
+            color_velocidad=color_velocidad,
+            tiempo_parado=f"{int(stop_duration)} min",
+            falla_motivo=falla_motivo if isinstance(falla_motivo, str) and falla_motivo else None,
+            estado_gps=estado_ignicion,
+            direccion=ubicacion,
+            ultimo_reporte=last_report_display,
+            coordenadas=f"({longitud:.4f}, {latitud:.4f})",
+            desplazamiento=None if np.isnan(desplazamiento) else f"{desplazamiento:.1f} km en {MINUTOS_DESPLAZAMIENTO} min",
+        ))
+    return tarjetas
+
+
+# === CICLO DE MONITOREO (fragmento) Y VIGILANCIA DE DATOS NUEVOS ===
+# El ciclo (encabezado, métricas, alertas y log; retorna las tarjetas, que dibuja el script) corre en cada
+# ejecución completa; los widgets que dibuja en el sidebar (botones de aceptar alertas) solo lo re-ejecutan a él. Antes un while True
+# con time.sleep re-ejecutaba todo el ciclo a ciegas, para siempre.
+# No tiene refresco periódico propio: una ejecución de fragmento vuelve a enviar todo lo que dibuja (Streamlit
+# borra lo que no reenvía), así que redibujar sin datos nuevos no es gratis. En su lugar, vigilar_datos corre
+# cada INTERVALO_REVISION_SEGUNDOS sin dibujar nada, compara la versión publicada con la dibujada (ver
+# ciclo_pendiente) y relanza el script solo cuando hay algo nuevo que mostrar.
+
+@st.fragment
+def ciclo_monitoreo() -> List[TarjetaUnidad]:
+    """
+    Un ciclo: lee el snapshot (o la reproducción), detecta eventos y dibuja todo lo que cambia con los datos,
+    salvo la rejilla: retorna las tarjetas de la página visible y las dibuja la ejecución completa del script.
+    """
     flota_a_usar = st.session_state['flota_seleccionada'] 
     
     # LECTURA DE LOS PARÁMETROS ACTIVOS
@@ -828,7 +1297,6 @@ while True:
     SPEED_THRESHOLD_KPH = config['SPEED_THRESHOLD_KPH']
     GPS_MIN_ENCENDIDA = config['GPS_MIN_ENCENDIDA']
     GPS_MIN_APAGADA = config['GPS_MIN_APAGADA']
-    TIME_SLEEP = config['TIME_SLEEP']
 
     # --- CONDICIÓN CRÍTICA: NO EJECUTAR SI NO HAY FLOTA SELECCIONADA ---
     if not flota_a_usar:
@@ -853,123 +1321,50 @@ while True:
         except NameError:
              # Solo si se accede antes de la inicialización del sidebar
              pass
-            
-        time.sleep(1) 
-        continue 
+        return []
     # --------------------------------------------------------------------------
 
     # Obtener datos
-    # 🚨 NOTA: La función obtener_datos_unidades ahora retorna flags EN_VERTEDERO_FLAG
-    df_data_original = obtener_datos_unidades(flota_a_usar, FLOTAS_CONFIG, GPS_MIN_ENCENDIDA, GPS_MIN_APAGADA)
+    if st.session_state['fuente_datos'] == FUENTE_REPRODUCCION:
+        # ⏪ REPRODUCCIÓN: los sondeos archivados pasan por la misma clasificación y alertas que en vivo
+        reproduccion_sesion = obtener_reproduccion_sesion(flota_a_usar)
+        if reproduccion_sesion is None or not avanzar_reproduccion(reproduccion_sesion, config):
+            with placeholder_main_content.container():
+                st.markdown(f"<h2 id='main-title'>Rastreo GPS - Flota {flota_a_usar}</h2>", unsafe_allow_html=True)
+                st.markdown("---")
+                st.info("⏪ No hay datos archivados para reproducir con la flota, el día y la hora seleccionados.")
+            return []
+        snapshot_flota = reproduccion_sesion['snapshot']
+        almacen_paradas = reproduccion_sesion['estado_paradas']
+        estados_excesos_sesion = reproduccion_sesion['estado_excesos']
+        secuencias_eventos_sesion = reproduccion_sesion['secuencia_eventos_parada']
+        now = reproduccion_sesion['reproduccion'].reloj.tz_localize('America/Caracas')
+    else:
+        # 🚨 NOTA: Los datos vienen del snapshot compartido del poller (no se consulta la API por sesión).
+        reproduccion_sesion = None
+        snapshot_flota = poller_flotas.obtener_snapshot(flota_a_usar)
+        almacen_paradas = current_stop_state
+        estados_excesos_sesion = st.session_state['estado_excesos']
+        secuencias_eventos_sesion = st.session_state['secuencia_eventos_parada']
+        now = pd.Timestamp.now(tz='America/Caracas')
+
+    st.session_state['ciclo_dibujado'] = (snapshot_flota.version, time.monotonic())
+
+    # Se trabaja sobre una copia porque el ciclo escribe STOP_DURATION_* en el DataFrame.
+    df_data_original = snapshot_flota.datos.copy()
     
     is_fallback = "FALLBACK" in df_data_original["UNIDAD"].iloc[0]
-    
-    # -- LÓGICA DE DETECCIÓN DE PARADAS LARGAS Y EXCESO DE VELOCIDAD --
 
-    now = pd.Timestamp.now(tz='America/Caracas') 
+    # 🚨 FALLA GPS CON LOS UMBRALES DE ESTA SESIÓN (un fetch por flota sirve a todos los umbrales) 🚨
+    if not is_fallback:
+        df_data_original = aplicar_falla_gps(df_data_original, now, GPS_MIN_ENCENDIDA, GPS_MIN_APAGADA)
     
+    # -- LÓGICA DE DETECCIÓN DE PARADAS LARGAS Y EXCESO DE VELOCIDAD --
     if not is_fallback:
-        # Optimización: Iterar sobre las filas y actualizar el estado
-        for index, row in df_data_original.iterrows():
-            unit_id_api = row['UNIT_ID']
-            velocidad = row['VELOCIDAD']
-            
-            # Inicialización de estado completo
-            if unit_id_api not in current_stop_state:
-                current_stop_state[unit_id_api] = {
-                    'last_move_time': now,
-                    'alerted_stop_minutes': None, 
-                    'speed_alert_start_time': None, 
-                    'last_recorded_speed': 0.0      
-                }
-                # No podemos continuar, necesitamos el estado inicial
-            
-            last_state = current_stop_state[unit_id_api]
-            is_moving = velocidad > 1.0 
-            
-            # Determinar si la unidad NO está en ninguna zona de resguardo/sede/vertedero
-            is_out_of_hq = not (row['EN_SEDE_FLAG'] or row['EN_RESGUARDO_SECUNDARIO_FLAG'] or row['EN_VERTEDERO_FLAG'] or row['ES_FALLA_GPS_FLAG'])
-            
-            is_speeding = velocidad >= SPEED_THRESHOLD_KPH
-
-            # --- LÓGICA DE EXCESO DE VELOCIDAD (START/UPDATE) ---
-            if is_speeding and is_out_of_hq:
-                if last_state['speed_alert_start_time'] is None:
-                    last_state['speed_alert_start_time'] = now
-                
-                if velocidad > last_state['last_recorded_speed']:
-                    last_state['last_recorded_speed'] = velocidad
-
-            # --- LÓGICA DE EXCESO DE VELOCIDAD (END/LOG) ---
-            elif not is_speeding and last_state['speed_alert_start_time'] is not None:
-                start_time = last_state['speed_alert_start_time']
-                duration_timedelta = now - start_time
-                duration_minutes = duration_timedelta.total_seconds() / 60.0
-                
-                # Registra solo si el exceso duró más de 10 segundos (~0.166 min)
-                if duration_minutes >= 0.166: 
-                    hora_log = now.strftime('%H:%M:%S')
-                    nombre_unidad_display = row['UNIDAD'].split('-')[0] if '-' in row['UNIDAD'] else row['UNIDAD']
-                    max_speed_recorded = last_state['last_recorded_speed']
-                    
-                    log_message = (
-                        f"**🟡 {hora_log}** | Unidad: **{nombre_unidad_display}** "
-                        f"| Exceso de Velocidad Máx: **{max_speed_recorded:.1f} Km/h** "
-                        f"| por: **{duration_minutes:.1f} min** "
-                        f"| en Dirección: {row['UBICACION_TEXTO']}"
-                    )
-                    st.session_state['log_historial'].insert(0, log_message)
-                
-                # RESET
-                last_state['speed_alert_start_time'] = None 
-                last_state['last_recorded_speed'] = 0.0
-
-            # --- LÓGICA DE PARADA LARGA (Movimiento Detectado - Log FIN Parada Larga) ---
-            if is_moving:
-                
-                # Actualizar el DataFrame *antes* del log
-                df_data_original.loc[index, 'STOP_DURATION_MINUTES'] = 0.0 
-                
-                if last_state.get('alerted_stop_minutes'):
-                    
-                    hora_log = now.strftime('%H:%M:%S')
-                    duracion_log = f"{last_state['alerted_stop_minutes']:.1f}"
-                    nombre_unidad_display = row['UNIDAD'].split('-')[0] if '-' in row['UNIDAD'] else row['UNIDAD']
-                    
-                    log_message = (
-                        f"**🟢 {hora_log}** | Unidad: **{nombre_unidad_display}** "
-                        f"| FIN de Parada Larga, por: **{duracion_log} min** "
-                        f"| Ubicación: {row['UBICACION_TEXTO']}"
-                    )
-                    
-                    st.session_state['log_historial'].insert(0, log_message)
-                    
-                    last_state['alerted_stop_minutes'] = None
-                
-                last_state['last_move_time'] = now
-                
-                # Reinicio de estados de alerta al moverse
-                if row['UNIDAD'] in st.session_state['alertas_descartadas']:
-                    del st.session_state['alertas_descartadas'][row['UNIDAD']]
-                if row['UNIDAD'] in st.session_state['alertas_velocidad_descartadas']:
-                    del st.session_state['alertas_velocidad_descartadas'][row['UNIDAD']]
-                
-                # Desactivamos las banderas de reproducción si la unidad se mueve
-                st.session_state['reproducir_audio_alerta'] = False
-                st.session_state['reproducir_audio_velocidad'] = False
-
-            else: # Unit is stopped (Lógica de Parada Larga - Actualizar Duración)
-                stop_duration_timedelta = now - last_state['last_move_time']
-                stop_duration_minutes = stop_duration_timedelta.total_seconds() / 60.0
-                
-                # Actualizar el DataFrame
-                df_data_original.loc[index, 'STOP_DURATION_MINUTES'] = stop_duration_minutes
-                df_data_original.loc[index, 'STOP_DURATION_TIMEDELTA'] = stop_duration_timedelta
-                
-                # LÓGICA para marcar una parada larga *activa*
-                if stop_duration_minutes > STOP_THRESHOLD_MINUTES and is_out_of_hq:
-                    last_state['alerted_stop_minutes'] = stop_duration_minutes
-                
+        hora_datos = (pd.Timestamp(snapshot_flota.hora_ultimo_exito, unit='s', tz='UTC').tz_convert('America/Caracas')
+                      if snapshot_flota.hora_ultimo_exito else now)
+        detectar_eventos_sesion(df_data_original, flota_a_usar, almacen_paradas, estados_excesos_sesion,
+                                secuencias_eventos_sesion, now, config, hora_datos)
     
     # Lógica de Filtrado Condicional (Mejorada la lógica de Parada Larga)
     df_data_mostrada = df_data_original
@@ -1019,12 +1414,23 @@ while True:
             df_data_mostrada = df_data_original[is_en_ruta].copy()
             filtro_descripcion = "Unidades Fuera de Sede 🛣️"
             
+        if st.session_state['ordenar_por_severidad']:
+            df_data_mostrada = ordenar_por_severidad(df_data_mostrada, STOP_THRESHOLD_MINUTES, SPEED_THRESHOLD_KPH)
         df_data_mostrada = df_data_mostrada.reset_index(drop=True)
     # FIN DE LA LÓGICA DE FILTRADO
+
+    # PAGINACIÓN: solo la página visible se describe y se dibuja (costo acotado sin importar el tamaño de la flota)
+    tarjetas_por_pagina = st.session_state['tarjetas_por_pagina']
+    total_paginas = max(1, -(-len(df_data_mostrada) // tarjetas_por_pagina))
+    pagina_actual = min(st.session_state['pagina_tarjetas'], total_paginas - 1)
+    st.session_state['pagina_tarjetas'] = pagina_actual
+    inicio_pagina = pagina_actual * tarjetas_por_pagina
+    df_pagina = df_data_mostrada.iloc[inicio_pagina:inicio_pagina + tarjetas_por_pagina]
     
     # Lógica de Detección y Construcción de Alerta de Parada Larga (Alertas Visibles)
     unidades_en_alerta_stop = pd.DataFrame()
     mensaje_alerta_stop = ""
+    sonar_alerta_stop = False
 
     if not is_fallback:
         # La condición de parada larga incluye ahora NO estar en Vertedero
@@ -1042,11 +1448,9 @@ while True:
             todas_las_alertas_stop['UNIDAD'].isin(unidades_pendientes_stop)
         ].sort_values(by='STOP_DURATION_MINUTES', ascending=False)
         
-        # CONTROL DEL AUDIO PARADA
+        # CONTROL DEL AUDIO PARADA: solo cuando entra alguna unidad nueva en alerta
+        sonar_alerta_stop = hay_unidades_nuevas_en_alerta('unidades_alerta_parada', unidades_en_alerta_stop['UNIDAD'])
         if not unidades_en_alerta_stop.empty:
-            if st.session_state.get('reproducir_audio_alerta') == False:
-                 st.session_state['reproducir_audio_alerta'] = True
-            
             total_alertas = len(unidades_en_alerta_stop)
             mensaje_alerta_stop += f"**{total_alertas} PARADA LARGA(S) PENDIENTE(S) 🚨**\n\n"
             
@@ -1055,12 +1459,11 @@ while True:
                 total_segundos = row['STOP_DURATION_TIMEDELTA'].total_seconds()
                 tiempo_parado = f"{int(total_segundos // 60)}min {int(total_segundos % 60):02}seg" 
                 mensaje_alerta_stop += (f"**{nombre_unidad}** ({tiempo_parado}):\n---\n")
-        else:
-             st.session_state['reproducir_audio_alerta'] = False
     
     # Lógica de Detección de Alerta de Velocidad
     unidades_en_alerta_speed = pd.DataFrame()
     mensaje_alerta_speed = ""
+    sonar_alerta_speed = False
 
     if not is_fallback:
         # La condición de exceso de velocidad incluye ahora NO estar en Vertedero
@@ -1078,11 +1481,9 @@ while True:
             todas_las_alertas_speed['UNIDAD'].isin(unidades_pendientes_speed)
         ].sort_values(by='VELOCIDAD', ascending=False)
         
-        # CONTROL DEL AUDIO VELOCIDAD
+        # CONTROL DEL AUDIO VELOCIDAD: solo cuando entra alguna unidad nueva en alerta
+        sonar_alerta_speed = hay_unidades_nuevas_en_alerta('unidades_alerta_velocidad', unidades_en_alerta_speed['UNIDAD'])
         if not unidades_en_alerta_speed.empty:
-            if st.session_state.get('reproducir_audio_velocidad') == False:
-                 st.session_state['reproducir_audio_velocidad'] = True
-            
             total_alertas = len(unidades_en_alerta_speed)
             mensaje_alerta_speed += f"**{total_alertas} EXCESO DE VELOCIDAD PENDIENTE(S) ⚠️**\n\n"
             
@@ -1091,20 +1492,15 @@ while True:
                 velocidad_formateada = f"{row['VELOCIDAD']:.1f} Km/h"
                 estado_critico = "🚨 CRÍTICO" if row['VELOCIDAD'] > SPEED_THRESHOLD_KPH + 4.0 else "⚠️ ALERTA"
                 mensaje_alerta_speed += (f"**{nombre_unidad}** ({estado_critico} a {velocidad_formateada}):\n---\n")
-        else:
-            st.session_state['reproducir_audio_velocidad'] = False
     
     # =========================================================================
     # --- RENDERIZADO DE ALERTAS EN EL SIDEBAR ---
     # =========================================================================
-    unique_time_id = int(time.time() * 1000) 
     
-    # AUDIO PARADA
+    # AUDIO PARADA (en los demás ciclos el placeholder queda vacío: el audio ya sonó)
     with audio_stop_placeholder.container():
-        if st.session_state.get('reproducir_audio_alerta'):
+        if sonar_alerta_stop:
              reproducir_alerta_sonido(AUDIO_BASE64_PARADA)
-        else:
-             audio_stop_placeholder.empty() 
              
     # ALERTA PARADA
     with alerta_stop_placeholder.container():
@@ -1118,11 +1514,10 @@ while True:
             def aceptar_todas_paradas():
                 for uid in unidades_en_alerta_stop['UNIDAD']:
                     st.session_state['alertas_descartadas'][uid] = True
-                st.session_state['reproducir_audio_alerta'] = False
                     
             st.button(
                 "✅ Aceptar y Silenciar TODAS las Paradas", 
-                key=f"descartar_all_stops_{unique_time_id}",
+                key="descartar_all_stops",
                 on_click=aceptar_todas_paradas,
                 type="primary", 
                 use_container_width=True
@@ -1130,12 +1525,10 @@ while True:
         else:
             alerta_stop_placeholder.empty()
 
-    # AUDIO VELOCIDAD
+    # AUDIO VELOCIDAD (igual que el de parada)
     with audio_velocidad_placeholder.container():
-        if st.session_state.get('reproducir_audio_velocidad'):
+        if sonar_alerta_speed:
              reproducir_alerta_sonido(AUDIO_BASE64_VELOCIDAD)
-        else:
-             audio_velocidad_placeholder.empty()
              
     # ALERTA VELOCIDAD
     with alerta_velocidad_placeholder.container():
@@ -1149,11 +1542,10 @@ while True:
             def aceptar_todas_velocidades():
                 for uid in unidades_en_alerta_speed['UNIDAD']:
                     st.session_state['alertas_velocidad_descartadas'][uid] = True
-                st.session_state['reproducir_audio_velocidad'] = False
                     
             st.button(
                 "✅ Aceptar y Silenciar TODOS los Excesos", 
-                key=f"descartar_all_speed_{unique_time_id}",
+                key="descartar_all_speed",
                 on_click=aceptar_todas_velocidades,
                 type="primary",
                 use_container_width=True
@@ -1188,7 +1580,7 @@ while True:
             
             # INICIO DEL DESPLEGABLE DE ESTADÍSTICAS
             with st.expander("📊 **Estadísticas de la Flota**", expanded=True):
-                # Renderizado (usando la función definida fuera del loop)
+                # Renderizado (usando la función definida fuera del ciclo)
                 st.markdown(format_metric_line("Total Flota", total_unidades), unsafe_allow_html=True)
                 st.markdown("---")
                 st.markdown(format_metric_line("Estado Operacional", is_section_title=True), unsafe_allow_html=True)
@@ -1215,7 +1607,8 @@ while True:
             
             # --- RENDERIZADO DE DEBUG Y HORA ---
             with debug_status_placeholder.container():
-                hora_actual = obtener_hora_venezuela().strftime('%Y-%m-%d %H:%M:%S')
+                # Hora en que se obtuvieron los datos mostrados (no la hora del ciclo)
+                hora_actual = datetime.fromtimestamp(snapshot_flota.hora_ultimo_exito or time.time(), VENEZUELA_TZ).strftime('%Y-%m-%d %H:%M:%S')
                 
                 st.markdown(
                     f'<div style="text-align: center; color: #888888; margin-top: 15px; font-size: 0.8em;">'
@@ -1239,7 +1632,8 @@ while True:
         else:
             log_placeholder.empty()
 
-    # --- Actualizar el Contenedor Principal (Tarjetas) ---
+    # --- Actualizar el Contenedor Principal (Encabezado y Tarjetas) ---
+    tarjetas = []
     with placeholder_main_content.container():
         st.markdown(
     f"<h2 id='main-title'>Rastreo GPS - Flota {flota_a_usar}</h2>", 
@@ -1249,6 +1643,21 @@ while True:
         
         st.subheader(f"{filtro_descripcion} - ({len(df_data_mostrada)})")
 
+        if reproduccion_sesion is not None:
+            reproduccion = reproduccion_sesion['reproduccion']
+            st.info(
+                f"⏪ **Reproducción del archivo**: {reproduccion.fecha} a las **{reproduccion.reloj:%H:%M:%S} VET**, "
+                f"velocidad **{reproduccion.velocidad:.0f}×**" + (" — **reproducción terminada**." if reproduccion.terminada else ".")
+            )
+
+        # 🚨 LAST-KNOWN-GOOD: La API falló pero seguimos mostrando la última lectura válida 🚨
+        if snapshot_flota.es_obsoleto and not is_fallback:
+            st.warning(
+                f"⚠️ **Datos desactualizados**: la API de Foresight GPS no responde. "
+                f"Se muestra la última lectura válida, de hace **{formatear_antiguedad(snapshot_flota.edad_segundos())}** "
+                f"(intentos fallidos: {snapshot_flota.fallos_consecutivos})."
+            )
+
         if is_fallback:
             causa_display = df_data_original['UBICACION_TEXTO'].iloc[0].split(' - ')[1]
             st.error(f"🚨 **ERROR CRÍTICO DE CONEXIÓN/DATOS** 🚨")
@@ -1258,105 +1667,36 @@ while True:
              st.info(f"No hay unidades que cumplan el filtro **'{filtro_descripcion}'** para la flota **{flota_a_usar}** en este momento.")
 
         else:
-            
-            # COMIENZO DEL RENDERIZADO DE TARJETAS
-            
-            COLUMNS_PER_ROW = 5
-            rows = [df_data_mostrada[i:i + COLUMNS_PER_ROW] for i in range(0, len(df_data_mostrada), COLUMNS_PER_ROW)]
-
-            for row_index, row_data in enumerate(rows):
-                cols = st.columns(COLUMNS_PER_ROW)
-                
-                for col_index, row_tuple in enumerate(row_data.iterrows()):
-                    with cols[col_index]:
-                        
-                        row = row_tuple[1] 
-
-                        nombre_unidad_display = row['UNIDAD'].split('-')[0] if '-' in row['UNIDAD'] else row['UNIDAD']
-                        velocidad_formateada = f"{row['VELOCIDAD']:.0f}"
-                        card_style = row['CARD_STYLE']
-                        estado_ignicion = row['IGNICION']
-                        velocidad_float = row['VELOCIDAD']
-                        stop_duration = row['STOP_DURATION_MINUTES']
-                        
-                        estado_display = estado_ignicion 
-                        color_velocidad = "white"
-                        
-                        # Determinar si la unidad NO está en ninguna zona crítica
-                        is_out_of_hq_status = not (row['EN_SEDE_FLAG'] or row['EN_RESGUARDO_SECUNDARIO_FLAG'] or row['EN_VERTEDERO_FLAG'] or row['ES_FALLA_GPS_FLAG'])
-                        
-                        # Lógica de Precedencia: Falla GPS > Parada Larga > Exceso de Velocidad
-                        
-                        if row['ES_FALLA_GPS_FLAG']:
-                            color_velocidad = "black" 
-                            
-                        else:
-                            # Resaltado visual para Parada Larga
-                            if stop_duration > STOP_THRESHOLD_MINUTES and velocidad_float < 1.0 and is_out_of_hq_status:
-                                parada_display = f"Parada Larga 🛑: {stop_duration:.0f} min"
-                                card_style = "background-color: #FFC107; padding: 15px; border-radius: 5px; color: black; margin-bottom: 0px;" 
-                                estado_display = parada_display 
-                                color_velocidad = "black"
-                                
-                            # Resaltado visual para Exceso de Velocidad
-                            elif velocidad_float > SPEED_THRESHOLD_KPH + 4.0: 
-                                color_velocidad = "#D32F2F" # ROJO (Crítico)
-                                estado_display = "EXCESO VELOCIDAD 🚨"
-                            elif velocidad_float >= SPEED_THRESHOLD_KPH:
-                                color_velocidad = "#FF9800" # NARANJA (Alerta)
-                                estado_display = "Alerta Velocidad ⚠️" 
-
-                        # Estructura del card HTML
-                        st.markdown(f'<div style="{card_style}">', unsafe_allow_html=True)
-                        st.markdown(
-                            f'<p style="text-align: center; margin-bottom: 10px; margin-top: 0px;">'
-                            f'<span style="background-color: rgba(0,0,0,0.3); padding: 5px 10px; border-radius: 5px; font-size: 1.5em; font-weight: 900;">'
-                            f'{nombre_unidad_display}'
-                            f'</span>'
-                            f'</p>',
-                            unsafe_allow_html=True
-                        )
-                        # El texto de la velocidad debe ser negro si el fondo es claro (Vertedero o Falla GPS)
-                        final_text_color = "black" if COLOR_VERTEDERO == "#FCC6BB" and row['EN_VERTEDERO_FLAG'] else color_velocidad
-                        if row['ES_FALLA_GPS_FLAG']:
-                            final_text_color = "black"
-                            
-                        st.markdown(
-                            f'<p style="display: flex; align-items: center; justify-content: center; font-size: 1.9em; font-weight: 900; margin-top: 0px;">'
-                            f'📍 <span style="margin-left: 8px; color: {final_text_color};">{velocidad_formateada} Km</span>'
-                            f'</p>',
-                            unsafe_allow_html=True
-                        )
-                        st.markdown(f'<p style="font-size: 1.0em; margin-top: 0px; opacity: 1.1; text-align: center; margin-bottom: 0px;">{estado_display}</p>', unsafe_allow_html=True)
-                        st.markdown('</div>', unsafe_allow_html=True)
-
-                        # Botón de Ubicación
-                        with st.expander("Detalles ℹ️", expanded=False):
-                            stop_timedelta_card = row['STOP_DURATION_TIMEDELTA']
-                            tiempo_parado_display = f"{int(stop_timedelta_card.total_seconds() // 60)} min {int(stop_timedelta_card.total_seconds() % 60):02} seg"
-                            
-                            st.caption(f"Tiempo Parado: **{tiempo_parado_display}**") 
-                            
-                            falla_motivo = row.get('FALLA_GPS_MOTIVO')
-                            last_report_display = row.get('LAST_REPORT_TIME_DISPLAY')
-                            
-                            if falla_motivo:
-                                st.error(
-                                    f"🚫 **Motivo Falla GPS:** {falla_motivo}\n\n"
-                                    f"🕒 **Último Reporte:** {last_report_display}"
-                                )
-                            
-                            st.caption(f"Estado GPS: **{estado_ignicion}**")
-                            st.caption(f"Dirección: **{row['UBICACION_TEXTO']}**")
-                            
-                            if not falla_motivo:
-                                st.caption(f"Último Reporte: **{last_report_display}**")
-                                
-                            st.caption(f"Coordenadas: ({row['LONGITUD']:.4f}, {row['LATITUD']:.4f})\r\n")
-                        
-                st.markdown("<div style='height: 15px;'></div>", unsafe_allow_html=True)
-            
-    st.markdown("---")
-    
-    # USO DEL PARÁMETRO DINÁMICO DE PAUSA
-    time.sleep(TIME_SLEEP)
+            if total_paginas > 1:
+                st.caption(
+                    f"Página **{pagina_actual + 1} de {total_paginas}** — unidades {inicio_pagina + 1} a "
+                    f"{inicio_pagina + len(df_pagina)} de {len(df_data_mostrada)} (cambie de página en **Vista de Tarjetas 🗂️**)."
+                )
+            # En reproducción el historial de posiciones (datos en vivo) no corresponde al reloj simulado
+            desplazamientos = desplazamientos_km(df_pagina, now) if reproduccion_sesion is None else None
+            tarjetas = describir_tarjetas(df_pagina, STOP_THRESHOLD_MINUTES, SPEED_THRESHOLD_KPH, desplazamientos)
+
+    return tarjetas
+
+
+# Contenido principal: encabezado (lo dibuja el ciclo) y, debajo, la rejilla de tarjetas. La rejilla se dibuja
+# aquí, fuera del fragmento, así las ejecuciones del fragmento no la reenvían; solo cambia en las ejecuciones
+# completas (datos nuevos, ver vigilar_datos, o interacciones). Conserva en la sesión el HTML de sus bloques.
+placeholder_main_content = st.empty()
+contenedor_tarjetas = st.container()
+if 'rejilla_tarjetas' not in st.session_state:
+    st.session_state['rejilla_tarjetas'] = RejillaTarjetas(COLUMNS_PER_ROW)
+
+tarjetas_pagina = ciclo_monitoreo()
+with contenedor_tarjetas:
+    # Solo la página visible, en bloques de una llamada a st.markdown cada uno
+    st.session_state['rejilla_tarjetas'].dibujar(tarjetas_pagina)
+
+@st.fragment(run_every=INTERVALO_REVISION_SEGUNDOS)
+def vigilar_datos():
+    """No dibuja nada: relanza el script (y con él el ciclo de monitoreo) solo si hay algo nuevo que mostrar."""
+    flota = st.session_state['flota_seleccionada']
+    if flota and ciclo_pendiente(flota, st.session_state['config_params']):
+        st.rerun()
+
+vigilar_datos()
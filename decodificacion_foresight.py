@@ -0,0 +1,98 @@
+# --- DECODIFICACIÓN DE RESPUESTAS DE LA API FORESIGHT ---
+# La respuesta trae decenas de campos por unidad, pero el dashboard solo usa unos pocos.
+# El decodificador se elige según lo que esté instalado (ninguno es obligatorio):
+#   - msgspec: decodifica contra un esquema tipado (coordenadas y velocidad ya como float, aunque
+#              la API las envíe como texto) y descarta en C los campos que no usamos.
+#   - orjson:  parser en C, bastante más rápido que el json de la librería estándar.
+#   - json:    librería estándar (siempre disponible).
+# Todos retornan la lista 'DATA' como dicts con las mismas claves que lee ingerir_unidades
+# (una lista vacía si la respuesta trae "DATA": null o no la trae).
+
+import json
+import os
+from typing import Any, Callable, Dict, List, Optional, Union
+
+# Campos de cada elemento de 'DATA' que consume el dashboard
+CAMPOS_UNIDAD = ("name", "unitid", "ylat", "xlong", "speed_dunit", "ignition", "location", "LastReportTime")
+
+DecodificadorUnidades = Callable[[bytes], List[Dict[str, Any]]]
+
+
+def _lista_data(respuesta: Optional[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """La lista 'DATA' de una respuesta ya parseada ([] si falta o es null)."""
+    return ((respuesta or {}).get("ForesightFlexAPI") or {}).get("DATA") or []
+
+
+def _decodificar_json(contenido: bytes) -> List[Dict[str, Any]]:
+    return _lista_data(json.loads(contenido))
+
+
+DECODIFICADORES: Dict[str, DecodificadorUnidades] = {"json": _decodificar_json}
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+if orjson is not None:
+    def _decodificar_orjson(contenido: bytes) -> List[Dict[str, Any]]:
+        return _lista_data(orjson.loads(contenido))
+
+    DECODIFICADORES["orjson"] = _decodificar_orjson
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+if msgspec is not None:
+    class UnidadForesight(msgspec.Struct):
+        """
+        Esquema de un elemento de 'DATA' (solo los campos usados; el resto se ignora al decodificar).
+        Se decodifica con strict=False: los números que la API envía como texto ("10.48") se convierten.
+        """
+        name: Optional[str] = "N/A"
+        unitid: Union[int, str, None] = None
+        ylat: float = 0.0
+        xlong: float = 0.0
+        speed_dunit: float = 0.0
+        ignition: Union[bool, str] = "false"
+        location: Optional[str] = "Dirección no disponible"
+        LastReportTime: Optional[str] = "N/A"
+
+        def __post_init__(self):
+            # unit_id debe ser único, usamos name como fallback
+            if self.unitid is None:
+                self.unitid = self.name if self.name != "N/A" else "N/A_ID_FALLBACK"
+
+    class _CuerpoForesight(msgspec.Struct):
+        DATA: Optional[List[UnidadForesight]] = None
+
+    class _RespuestaForesight(msgspec.Struct):
+        ForesightFlexAPI: Optional[_CuerpoForesight] = None
+
+    _DECODER_MSGSPEC = msgspec.json.Decoder(_RespuestaForesight, strict=False)
+
+    def _decodificar_msgspec(contenido: bytes) -> List[Dict[str, Any]]:
+        cuerpo = _DECODER_MSGSPEC.decode(contenido).ForesightFlexAPI
+        unidades = (cuerpo.DATA if cuerpo is not None else None) or []
+        return [msgspec.structs.asdict(unidad) for unidad in unidades]
+
+    DECODIFICADORES["msgspec"] = _decodificar_msgspec
+
+
+def seleccionar_decodificador(nombre: str = "") -> DecodificadorUnidades:
+    """
+    Retorna el decodificador pedido (o el de la variable de entorno FORESIGHT_JSON),
+    y si no se indica o no está instalado, el más rápido disponible.
+    """
+    nombre = nombre or os.environ.get("FORESIGHT_JSON", "")
+    if nombre in DECODIFICADORES:
+        return DECODIFICADORES[nombre]
+    for preferido in ("msgspec", "orjson"):
+        if preferido in DECODIFICADORES:
+            return DECODIFICADORES[preferido]
+    return _decodificar_json
+
+
+decodificar_unidades = seleccionar_decodificador()
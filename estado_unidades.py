@@ -0,0 +1,414 @@
+# --- ESTADO DE PARADAS LARGAS Y EXCESOS DE VELOCIDAD POR UNIDAD ---
+# El estado de seguimiento de cada unidad se guarda en arreglos alineados indexados por
+# UNIT_ID y cada snapshot se aplica con un único paso vectorizado (máscaras de NumPy).
+#
+# Los tiempos salen del 'LastReportTime' de cada unidad, no de la hora en que alguien
+# consultó: un mismo reporte leído dos veces no cambia nada (idempotente) y la duración de
+# una parada no depende de cuántos dashboards estén abiertos ni de cada cuánto se consulta.
+# LastReportTime solo trae minutos (TIME_FORMAT), así que dentro de un mismo minuto se desempata
+# con la hora de consulta (ver horas_efectivas): un segundo reporte en el mismo minuto con otra
+# velocidad sí se procesa, y un exceso de menos de un minuto tiene duración distinta de cero.
+#
+#   - EstadoParadas: historial de movimiento (no depende de umbrales). Lo alimenta el poller,
+#     compartido por todas las sesiones a través de AlmacenEstadoUnidades (particionado por
+#     flota, con lock, desalojo por TTL y respaldo opcional en SQLite).
+#   - EstadoExcesos: episodios de exceso de velocidad. Depende del umbral de cada sesión,
+#     así que cada sesión tiene el suyo.
+
+import threading
+from collections import deque
+from typing import Any, Deque, Dict, Hashable, Iterable, List, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+# Un exceso de velocidad se registra en el log solo si duró al menos ~10 segundos (medidos con la
+# hora de consulta, ver horas_efectivas; con solo LastReportTime el mínimo real sería 1 minuto)
+DURACION_MINIMA_EXCESO_MIN = 0.166
+# Las unidades (y flotas) que no aparecen en ningún snapshot durante este tiempo se olvidan
+TTL_ESTADO_HORAS = 6
+# Eventos de fin de parada que se conservan por flota para las sesiones que aún no los leen
+MAX_EVENTOS_POR_FLOTA = 500
+
+_NAT = np.datetime64("NaT", "ns")
+_UN_MINUTO = np.timedelta64(1, "m")
+
+
+def _a_datetime64(valor: Any) -> np.datetime64:
+    """Hora local de Venezuela sin tz (igual que LAST_REPORT_DT) como datetime64[ns]."""
+    return pd.Timestamp(valor).tz_localize(None).to_datetime64().astype("datetime64[ns]")
+
+
+def horas_efectivas(reportes: np.ndarray, horas_consulta: Any) -> np.ndarray:
+    """
+    Hora de cada reporte con resolución menor a un minuto: el reporte ocurrió dentro del minuto de
+    LastReportTime y no después de la consulta que lo trajo, así que se toma la hora de consulta
+    acotada a [LastReportTime, LastReportTime + 1 min). Sin horas de consulta, el propio LastReportTime.
+    """
+    if horas_consulta is None:
+        return reportes
+    if isinstance(horas_consulta, np.ndarray):
+        consulta = horas_consulta.astype("datetime64[ns]")
+    else:
+        consulta = _a_datetime64(horas_consulta)
+    tope = reportes + (_UN_MINUTO - np.timedelta64(1, "ns"))
+    # fmax/fmin ignoran NaT en la consulta (queda el LastReportTime); un reporte NaT sigue siendo NaT
+    return np.where(np.isnat(reportes), _NAT, np.fmin(np.fmax(consulta, reportes), tope))
+
+
+def _reportes_nuevos(reportes: np.ndarray, velocidades: np.ndarray, ultimo_reporte: np.ndarray,
+                     ultima_velocidad: np.ndarray) -> np.ndarray:
+    """
+    Filas con un reporte no procesado: LastReportTime posterior al último, o el mismo minuto con otra
+    velocidad (segundo reporte dentro del minuto). Releer el mismo reporte no cambia nada.
+    """
+    mismo_minuto = (reportes == ultimo_reporte) & (velocidades != ultima_velocidad)
+    return ~np.isnat(reportes) & (np.isnat(ultimo_reporte) | (reportes > ultimo_reporte) | mismo_minuto)
+
+
+class _ColumnasPorUnidad:
+    """
+    Columnas NumPy alineadas, una fila por UNIT_ID. Las subclases declaran sus columnas en
+    COLUMNAS como {nombre: (dtype, valor_inicial)}; todas incluyen 'ultima_vista' (para el TTL).
+
+    No es thread-safe por sí sola: el acceso concurrente pasa por AlmacenEstadoUnidades.
+    """
+
+    COLUMNAS: Dict[str, Tuple[str, Any]] = {}
+
+    __slots__ = ("_ids", "_columnas")
+
+    def __init__(self):
+        self._ids = pd.Index([], dtype=object)
+        self._columnas = {nombre: np.empty(0, dtype=dtype) for nombre, (dtype, _) in self.COLUMNAS.items()}
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __contains__(self, unit_id: Hashable) -> bool:
+        return unit_id in self._ids
+
+    def __getitem__(self, nombre: str) -> np.ndarray:
+        return self._columnas[nombre]
+
+    @classmethod
+    def desde_columnas(cls, unit_ids: List[Hashable], columnas: Dict[str, np.ndarray]):
+        """Reconstruye el estado a partir de columnas guardadas (ver persistencia_estado.py)."""
+        estado = cls()
+        estado._ids = pd.Index(unit_ids, dtype=object)
+        estado._columnas = {nombre: np.asarray(columnas[nombre], dtype=dtype).copy()
+                            for nombre, (dtype, _) in cls.COLUMNAS.items()}
+        return estado
+
+    def columnas(self, unit_ids: Iterable[Hashable]) -> Dict[str, np.ndarray]:
+        """Copia de las columnas de estado para los UNIT_ID dados (que ya deben existir)."""
+        pos = self._ids.get_indexer(np.asarray(unit_ids, dtype=object))
+        return {nombre: valores[pos] for nombre, valores in self._columnas.items()}
+
+    def _posiciones(self, unit_ids: np.ndarray) -> np.ndarray:
+        """Posición de cada UNIT_ID en los arreglos; las unidades nuevas se agregan con el valor inicial."""
+        posiciones = self._ids.get_indexer(unit_ids)
+        nuevas = posiciones < 0
+        if nuevas.any():
+            ids_nuevos = pd.unique(unit_ids[nuevas])
+            n = len(ids_nuevos)
+            self._ids = self._ids.append(pd.Index(ids_nuevos, dtype=object))
+            for nombre, (dtype, inicial) in self.COLUMNAS.items():
+                self._columnas[nombre] = np.concatenate([self._columnas[nombre], np.full(n, inicial, dtype=dtype)])
+            posiciones = self._ids.get_indexer(unit_ids)
+        return posiciones
+
+    def desalojar(self, vistas_antes_de: np.datetime64) -> int:
+        """Elimina las unidades cuyo último snapshot es anterior a `vistas_antes_de`. Retorna cuántas eliminó."""
+        conservar = self._columnas["ultima_vista"] >= vistas_antes_de
+        eliminadas = int(len(conservar) - conservar.sum())
+        if eliminadas:
+            self._ids = self._ids[conservar]
+            self._columnas = {nombre: valores[conservar] for nombre, valores in self._columnas.items()}
+        return eliminadas
+
+
+class EstadoParadas(_ColumnasPorUnidad):
+    """
+    Historial de movimiento por unidad, en tiempo de reporte:
+
+      - ultimo_reporte:    LastReportTime más reciente ya procesado (los repetidos se ignoran).
+      - ultima_velocidad:  velocidad de ese reporte (desempata reportes del mismo minuto).
+      - hora_ultimo_reporte: hora efectiva de ese reporte (ver horas_efectivas).
+      - ultimo_movimiento: hora efectiva del último reporte en movimiento (= inicio de la parada actual).
+      - parada_fuera_de_base_min: duración máxima de la parada actual observada fuera de sede/resguardo/
+        vertedero (NaN si toda la parada fue en base). Decide si el fin de la parada se registra.
+    """
+
+    COLUMNAS = {
+        "ultimo_reporte": ("datetime64[ns]", _NAT),
+        "ultima_velocidad": (np.float64, np.nan),
+        "hora_ultimo_reporte": ("datetime64[ns]", _NAT),
+        "ultimo_movimiento": ("datetime64[ns]", _NAT),
+        "parada_fuera_de_base_min": (np.float64, np.nan),
+        "ultima_vista": ("datetime64[ns]", _NAT),
+    }
+
+    __slots__ = ()
+
+    def aplicar_snapshot(self, unit_ids: Iterable[Hashable], velocidades: np.ndarray, fuera_de_base: np.ndarray,
+                         fechas_reporte: np.ndarray, ahora: Any, horas_consulta: Any = None) -> Dict[str, np.ndarray]:
+        """
+        Aplica un snapshot (arreglos alineados por fila). Solo las filas con un reporte no procesado
+        (ver _reportes_nuevos) cambian el estado. `horas_consulta` (una por fila o una para todo el
+        snapshot) ubica cada reporte dentro de su minuto. Retorna, por fila:
+
+          - NUEVO_REPORTE: la fila trajo un reporte que no se había procesado.
+          - FIN_PARADA_FLAG / PARADA_FINALIZADA_MIN / PARADA_FUERA_DE_BASE_MIN: la unidad volvió a
+            moverse; duración total de la parada y, si se vio fuera de base, esa misma duración (NaN si no).
+        """
+        unit_ids = np.asarray(unit_ids, dtype=object)
+        velocidades = np.asarray(velocidades, dtype=np.float64)
+        fuera_de_base = np.asarray(fuera_de_base, dtype=bool)
+        reportes = np.asarray(fechas_reporte, dtype="datetime64[ns]")
+        pos = self._posiciones(unit_ids)
+
+        horas = horas_efectivas(reportes, horas_consulta)
+
+        ultimo_reporte = self._columnas["ultimo_reporte"][pos]
+        ultima_velocidad = self._columnas["ultima_velocidad"][pos]
+        # Estado guardado antes de existir la hora efectiva: se usa el LastReportTime
+        hora_ultimo_reporte = np.fmax(self._columnas["hora_ultimo_reporte"][pos], ultimo_reporte)
+        ultimo_movimiento = self._columnas["ultimo_movimiento"][pos]
+        fuera_de_base_min = self._columnas["parada_fuera_de_base_min"][pos]
+
+        # Reportes repetidos (o sin fecha válida) no avanzan el estado
+        nuevo = _reportes_nuevos(reportes, velocidades, ultimo_reporte, ultima_velocidad)
+        en_movimiento = velocidades > 1.0
+        detenida = nuevo & ~en_movimiento
+        avanza = nuevo & en_movimiento
+
+        # Primera vez que se ve detenida: la parada cuenta desde ese reporte
+        ultimo_movimiento = np.where(detenida & np.isnat(ultimo_movimiento), horas, ultimo_movimiento)
+        minutos_en_reporte = (horas - ultimo_movimiento) / _UN_MINUTO
+        fuera_de_base_min = np.where(detenida & fuera_de_base, np.fmax(fuera_de_base_min, minutos_en_reporte),
+                                     fuera_de_base_min)
+
+        # Fin de parada: reporte en movimiento cuando el anterior estaba detenido
+        fin_parada = avanza & (ultimo_movimiento < hora_ultimo_reporte)
+        parada_finalizada_min = np.where(fin_parada, minutos_en_reporte, np.nan)
+        # Detenida no cambia de ubicación: si se vio fuera de base, toda la parada fue fuera de base
+        # (aunque la unidad reporte poco mientras está apagada)
+        parada_fuera_de_base_min = np.where(fin_parada & ~np.isnan(fuera_de_base_min), minutos_en_reporte, np.nan)
+
+        ultimo_movimiento = np.where(avanza, horas, ultimo_movimiento)
+        fuera_de_base_min = np.where(avanza, np.nan, fuera_de_base_min)
+
+        # --- ESCRITURA DEL NUEVO ESTADO ---
+        self._columnas["ultimo_reporte"][pos] = np.where(nuevo, reportes, ultimo_reporte)
+        self._columnas["ultima_velocidad"][pos] = np.where(nuevo, velocidades, ultima_velocidad)
+        self._columnas["hora_ultimo_reporte"][pos] = np.where(nuevo, horas, hora_ultimo_reporte)
+        self._columnas["ultimo_movimiento"][pos] = ultimo_movimiento
+        self._columnas["parada_fuera_de_base_min"][pos] = fuera_de_base_min
+        self._columnas["ultima_vista"][pos] = _a_datetime64(ahora)
+
+        return {
+            "NUEVO_REPORTE": nuevo,
+            "FIN_PARADA_FLAG": fin_parada,
+            "PARADA_FINALIZADA_MIN": parada_finalizada_min,
+            "PARADA_FUERA_DE_BASE_MIN": parada_fuera_de_base_min,
+        }
+
+    def duraciones_parada(self, unit_ids: Iterable[Hashable], velocidades: np.ndarray,
+                          ahora: Any) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        (minutos, timedelta64) de la parada en curso a la hora `ahora`, medida desde el último
+        reporte en movimiento. 0 para las unidades en movimiento o sin historial.
+        """
+        pos = self._ids.get_indexer(np.asarray(unit_ids, dtype=object))
+        ultimo_movimiento = np.where(pos >= 0, self._columnas["ultimo_movimiento"][pos], _NAT)
+        sin_parada = (np.asarray(velocidades, dtype=np.float64) > 1.0) | np.isnat(ultimo_movimiento)
+        duracion = np.where(sin_parada, np.timedelta64(0, "ns"), _a_datetime64(ahora) - ultimo_movimiento)
+        duracion = np.maximum(duracion, np.timedelta64(0, "ns"))
+        return duracion / _UN_MINUTO, duracion
+
+
+class EstadoExcesos(_ColumnasPorUnidad):
+    """
+    Episodios de exceso de velocidad por unidad, en tiempo de reporte (uno por sesión, porque
+    el umbral es de la sesión):
+
+      - ultimo_reporte / ultima_velocidad: último reporte procesado (como en EstadoParadas).
+      - inicio_exceso:    hora efectiva en que empezó el exceso en curso (NaT si no hay).
+      - velocidad_maxima: velocidad máxima registrada durante el exceso en curso.
+    """
+
+    COLUMNAS = {
+        "ultimo_reporte": ("datetime64[ns]", _NAT),
+        "ultima_velocidad": (np.float64, np.nan),
+        "inicio_exceso": ("datetime64[ns]", _NAT),
+        "velocidad_maxima": (np.float64, 0.0),
+        "ultima_vista": ("datetime64[ns]", _NAT),
+    }
+
+    __slots__ = ()
+
+    def aplicar_snapshot(self, unit_ids: Iterable[Hashable], velocidades: np.ndarray, fuera_de_base: np.ndarray,
+                         fechas_reporte: np.ndarray, ahora: Any,
+                         umbral_velocidad_kph: Union[float, np.ndarray],
+                         horas_consulta: Any = None) -> Dict[str, np.ndarray]:
+        """
+        Aplica un snapshot y retorna, por fila, FIN_EXCESO_FLAG / DURACION_EXCESO_MIN /
+        VELOCIDAD_MAXIMA_EXCESO para los excesos que terminaron y duraron lo suficiente para registrarse.
+        El umbral puede ser uno por fila; `horas_consulta` como en
+        EstadoParadas.aplicar_snapshot.
+        """
+        unit_ids = np.asarray(unit_ids, dtype=object)
+        velocidades = np.asarray(velocidades, dtype=np.float64)
+        fuera_de_base = np.asarray(fuera_de_base, dtype=bool)
+        reportes = np.asarray(fechas_reporte, dtype="datetime64[ns]")
+        pos = self._posiciones(unit_ids)
+
+        horas = horas_efectivas(reportes, horas_consulta)
+
+        ultimo_reporte = self._columnas["ultimo_reporte"][pos]
+        ultima_velocidad = self._columnas["ultima_velocidad"][pos]
+        inicio_exceso = self._columnas["inicio_exceso"][pos]
+        velocidad_maxima = self._columnas["velocidad_maxima"][pos]
+
+        nuevo = _reportes_nuevos(reportes, velocidades, ultimo_reporte, ultima_velocidad)
+        en_exceso = velocidades >= umbral_velocidad_kph
+
+        # --- EXCESO DE VELOCIDAD: INICIO / ACTUALIZACIÓN ---
+        exceso_activo = nuevo & en_exceso & fuera_de_base
+        inicio_exceso = np.where(exceso_activo & np.isnat(inicio_exceso), horas, inicio_exceso)
+        velocidad_maxima = np.where(exceso_activo, np.maximum(velocidad_maxima, velocidades), velocidad_maxima)
+
+        # --- EXCESO DE VELOCIDAD: FIN ---
+        fin_exceso = nuevo & ~en_exceso & ~np.isnat(inicio_exceso)
+        duracion_exceso_min = np.where(fin_exceso, (horas - inicio_exceso) / _UN_MINUTO, np.nan)
+        velocidad_maxima_exceso = np.where(fin_exceso, velocidad_maxima, np.nan)
+        inicio_exceso = np.where(fin_exceso, _NAT, inicio_exceso)
+        velocidad_maxima = np.where(fin_exceso, 0.0, velocidad_maxima)
+
+        self._columnas["ultimo_reporte"][pos] = np.where(nuevo, reportes, ultimo_reporte)
+        self._columnas["ultima_velocidad"][pos] = np.where(nuevo, velocidades, ultima_velocidad)
+        self._columnas["inicio_exceso"][pos] = inicio_exceso
+        self._columnas["velocidad_maxima"][pos] = velocidad_maxima
+        self._columnas["ultima_vista"][pos] = _a_datetime64(ahora)
+
+        return {
+            "FIN_EXCESO_FLAG": fin_exceso & (duracion_exceso_min >= DURACION_MINIMA_EXCESO_MIN),
+            "DURACION_EXCESO_MIN": duracion_exceso_min,
+            "VELOCIDAD_MAXIMA_EXCESO": velocidad_maxima_exceso,
+        }
+
+
+class AlmacenEstadoUnidades:
+    """
+    Historial de paradas compartido por todas las sesiones, particionado por flota.
+
+    Lo alimenta el poller (una vez por consulta real a la API, haya o no sesiones mirando);
+    las sesiones solo leen duraciones y eventos. Todas las lecturas y escrituras ocurren bajo
+    un lock. Cada `intervalo_desalojo` se olvidan las unidades no vistas en `ttl` (p. ej. dadas
+    de baja en la configuración) y las flotas que ya no se consultan.
+
+    Con `persistencia` (p. ej. PersistenciaEstadoSQLite) el estado se restaura al crear el almacén
+    y cada snapshot aplicado se guarda en una sola transacción.
+    """
+
+    def __init__(self, ttl: pd.Timedelta = pd.Timedelta(hours=TTL_ESTADO_HORAS),
+                 intervalo_desalojo: pd.Timedelta = pd.Timedelta(minutes=5), persistencia=None):
+        self.ttl = ttl
+        self.intervalo_desalojo = intervalo_desalojo
+        self._lock = threading.Lock()
+        self._flotas: Dict[Hashable, EstadoParadas] = {}
+        self._eventos: Dict[Hashable, Deque[Dict[str, Any]]] = {}
+        self._secuencia = 0
+        self._ultimo_desalojo: Optional[pd.Timestamp] = None
+        self._persistencia = persistencia
+
+        if persistencia is not None:
+            for flota, (unit_ids, columnas) in persistencia.cargar().items():
+                self._flotas[flota] = EstadoParadas.desde_columnas(unit_ids, columnas)
+
+    def __len__(self) -> int:
+        """Total de unidades con estado (todas las flotas)."""
+        with self._lock:
+            return sum(len(estado) for estado in self._flotas.values())
+
+    def registrar_snapshot(self, flota: Hashable, df: pd.DataFrame, ahora: Any) -> None:
+        """
+        Aplica el DataFrame de un snapshot (UNIT_ID, VELOCIDAD, LAST_REPORT_DT y banderas EN_*)
+        a la partición de `flota` y encola un evento por cada parada que terminó. `ahora` es la hora
+        de la consulta que trajo el snapshot.
+        """
+        if df.empty or "LAST_REPORT_DT" not in df.columns:
+            return
+        unit_ids = df["UNIT_ID"].to_numpy(dtype=object)
+        fuera_de_base = ~(df["EN_SEDE_FLAG"] | df["EN_RESGUARDO_SECUNDARIO_FLAG"] |
+                          df["EN_VERTEDERO_FLAG"]).to_numpy(dtype=bool)
+        ahora = pd.Timestamp(ahora).tz_localize(None)
+
+        with self._lock:
+            estado = self._flotas.get(flota)
+            if estado is None:
+                estado = self._flotas[flota] = EstadoParadas()
+            transiciones = estado.aplicar_snapshot(unit_ids, df["VELOCIDAD"].to_numpy(), fuera_de_base,
+                                                   df["LAST_REPORT_DT"].to_numpy(), ahora, horas_consulta=ahora)
+
+            # --- EVENTOS: solo las filas que cambiaron de estado ---
+            eventos = self._eventos.setdefault(flota, deque(maxlen=MAX_EVENTOS_POR_FLOTA))
+            for fila in np.flatnonzero(transiciones["FIN_PARADA_FLAG"]):
+                self._secuencia += 1
+                eventos.append({
+                    "secuencia": self._secuencia,
+                    "UNIDAD": df["UNIDAD"].iat[fila],
+                    "UBICACION_TEXTO": df["UBICACION_TEXTO"].iat[fila],
+                    "HORA_REPORTE": pd.Timestamp(df["LAST_REPORT_DT"].iat[fila]),
+                    "PARADA_FINALIZADA_MIN": float(transiciones["PARADA_FINALIZADA_MIN"][fila]),
+                    "PARADA_FUERA_DE_BASE_MIN": float(transiciones["PARADA_FUERA_DE_BASE_MIN"][fila]),
+                })
+
+            if self._persistencia is not None and transiciones["NUEVO_REPORTE"].any():
+                self._guardar(flota, estado, unit_ids[transiciones["NUEVO_REPORTE"]])
+            if self._ultimo_desalojo is None or ahora - self._ultimo_desalojo >= self.intervalo_desalojo:
+                self._desalojar(ahora)
+
+    def duraciones_parada(self, flota: Hashable, unit_ids: Iterable[Hashable], velocidades: np.ndarray,
+                          ahora: Any) -> Tuple[np.ndarray, np.ndarray]:
+        """(minutos, timedelta64) de la parada en curso de cada unidad (ver EstadoParadas.duraciones_parada)."""
+        unit_ids = np.asarray(unit_ids, dtype=object)
+        with self._lock:
+            estado = self._flotas.get(flota)
+            if estado is None:
+                estado = EstadoParadas()
+            return estado.duraciones_parada(unit_ids, velocidades, ahora)
+
+    def eventos_desde(self, flota: Hashable, secuencia: Optional[int]) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        Eventos de fin de parada de `flota` posteriores a `secuencia` y la nueva secuencia a recordar.
+        Con `secuencia=None` (sesión que recién abre la flota) no retorna historial previo.
+        """
+        with self._lock:
+            if secuencia is None:
+                return [], self._secuencia
+            eventos = [evento for evento in self._eventos.get(flota, ()) if evento["secuencia"] > secuencia]
+            return eventos, self._secuencia
+
+    def _guardar(self, flota: Hashable, estado: EstadoParadas, unit_ids: np.ndarray) -> None:
+        # Un error del disco no debe tumbar el monitoreo: el estado en memoria sigue siendo válido
+        unit_ids = pd.unique(unit_ids)
+        try:
+            self._persistencia.guardar(flota, unit_ids, estado.columnas(unit_ids))
+        except Exception as e:
+            print(f"❌ [ESTADO] No se pudo guardar el estado de {flota}: {e}")
+
+    def _desalojar(self, ahora: pd.Timestamp) -> None:
+        limite = (ahora - self.ttl).to_datetime64().astype("datetime64[ns]")
+        for flota, estado in list(self._flotas.items()):
+            estado.desalojar(limite)
+            if len(estado) == 0:
+                del self._flotas[flota]
+                self._eventos.pop(flota, None)
+        if self._persistencia is not None:
+            try:
+                self._persistencia.eliminar_vistas_antes_de(limite)
+            except Exception as e:
+                print(f"❌ [ESTADO] No se pudo depurar el estado guardado: {e}")
+        self._ultimo_desalojo = ahora
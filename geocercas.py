@@ -0,0 +1,246 @@
+# --- MOTOR DE GEOCERCAS (VERTEDERO / SEDE / RESGUARDO) ---
+# Clasifica TODAS las unidades de una flota en una sola operación vectorizada de numpy,
+# en lugar de llamar a haversine por unidad y por sitio dentro de bucles de Python.
+
+from typing import Any, Dict, Sequence
+
+import numpy as np
+
+RADIO_TIERRA_KM = 6371
+
+
+# --- CALCULO DE DISTANCIA (FUNCIÓN HAVERSINE) ---
+def haversine(lat1, lon1, lat2, lon2):
+    """Calcula la distancia Haversine entre dos puntos en la Tierra (en km). OPTIMIZADA con numpy."""
+    # Vectorización con numpy (acepta escalares o arreglos con broadcasting)
+    lat1, lon1, lat2, lon2 = map(np.radians, [lat1, lon1, lat2, lon2])
+    dlon = lon2 - lon1
+    dlat = lat2 - lat1
+    a = np.sin(dlat/2.0)**2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon/2.0)**2
+    c = 2 * np.arcsin(np.sqrt(a))
+    return RADIO_TIERRA_KM * c
+
+
+def distancia_minima_km(lats: np.ndarray, lons: np.ndarray, coords_sitios: Sequence[Sequence[float]]) -> np.ndarray:
+    """Distancia (km) de cada unidad a su sitio más cercano de la lista. `inf` si la lista está vacía."""
+    if len(coords_sitios) == 0:
+        return np.full(lats.shape, np.inf)
+
+    sitios = np.asarray(coords_sitios, dtype=float).reshape(-1, 2)
+    # Matriz (unidades x sitios) calculada en un solo paso por broadcasting
+    distancias = haversine(lats[:, None], lons[:, None], sitios[None, :, 0], sitios[None, :, 1])
+    return distancias.min(axis=1)
+
+
+# --- ÍNDICE ESPACIAL POR CUADRÍCULA (GRID) ---
+# Los sitios de cada flota se proyectan a km (equirectangular con latitud de referencia) y se
+# agrupan en celdas del tamaño del radio de proximidad. Una unidad solo se compara contra los
+# sitios de su celda y de las 8 vecinas, así que el costo es O(unidades) y no O(unidades x sitios).
+# La distancia final se sigue calculando con haversine exacto sobre esos candidatos, por lo que
+# el resultado es idéntico a la comparación contra todos los sitios.
+
+CATEGORIAS_SITIOS = ("vertedero_coords", "sede_coords", "resguardo_secundario_coords")
+_DESPLAZAMIENTO_CELDA = 2**31
+_VECINOS = np.array([(dx, dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1)], dtype=np.int64)
+
+
+def _proyectar_km(lats: np.ndarray, lons: np.ndarray, lat_referencia: float):
+    """Proyección equirectangular local (km) usada únicamente para asignar celdas."""
+    x = RADIO_TIERRA_KM * np.radians(lons) * np.cos(np.radians(lat_referencia))
+    y = RADIO_TIERRA_KM * np.radians(lats)
+    return x, y
+
+
+def _claves_celda(x: np.ndarray, y: np.ndarray, tamano_celda_km: float) -> np.ndarray:
+    ix = np.floor(x / tamano_celda_km).astype(np.int64)
+    iy = np.floor(y / tamano_celda_km).astype(np.int64)
+    return (ix << 32) + (iy + _DESPLAZAMIENTO_CELDA)
+
+
+def construir_indice_geocercas(flota_data: Dict, proximidad_km: float) -> Dict[str, Any]:
+    """
+    Precalcula el índice de cuadrícula de los sitios de una flota (se llama una sola vez al
+    cargar la configuración). Solo contiene tipos básicos y arreglos de numpy para que
+    st.cache_data pueda serializarlo.
+    """
+    todas = [c for categoria in CATEGORIAS_SITIOS for c in flota_data.get(categoria, [])]
+    if not todas:
+        return {"tamano_celda_km": proximidad_km, "lat_referencia": 0.0, "categorias": {},
+                "poligonos": _preparar_poligonos_flota(flota_data)}
+
+    lats_todas = np.asarray(todas, dtype=float).reshape(-1, 2)[:, 0]
+    lat_referencia = float(lats_todas.mean())
+
+    # La proyección estira/encoge el eje X según cos(lat_referencia)/cos(lat). Agrandamos la
+    # celda con ese factor (más un margen) para que ningún sitio dentro del radio quede fuera
+    # de las 9 celdas revisadas.
+    margen_lat = np.degrees(proximidad_km / RADIO_TIERRA_KM) + 0.01
+    lat_extrema = min(np.abs(lats_todas).max() + margen_lat, 89.0)
+    factor_x = np.cos(np.radians(lat_referencia)) / np.cos(np.radians(lat_extrema))
+    tamano_celda_km = proximidad_km * max(1.0, factor_x) * 1.01
+
+    categorias = {}
+    for categoria in CATEGORIAS_SITIOS:
+        coords = flota_data.get(categoria, [])
+        if not coords:
+            continue
+        sitios = np.asarray(coords, dtype=float).reshape(-1, 2)
+        x, y = _proyectar_km(sitios[:, 0], sitios[:, 1], lat_referencia)
+        claves = _claves_celda(x, y, tamano_celda_km)
+        orden = np.argsort(claves, kind="stable")
+        categorias[categoria] = {
+            "claves": claves[orden],
+            "lat": sitios[orden, 0],
+            "lon": sitios[orden, 1],
+        }
+
+    return {"tamano_celda_km": tamano_celda_km, "lat_referencia": lat_referencia, "categorias": categorias,
+            "poligonos": _preparar_poligonos_flota(flota_data)}
+
+
+def _preparar_poligonos_flota(flota_data: Dict) -> Dict[str, Dict[str, Any]]:
+    return {c: preparar_poligonos(flota_data.get(clave, [])) for c, clave in CATEGORIAS_POLIGONOS.items()}
+
+
+def distancia_minima_indexada_km(lats: np.ndarray, lons: np.ndarray, indice: Dict[str, Any], categoria: str) -> np.ndarray:
+    """
+    Igual que distancia_minima_km pero usando el índice de cuadrícula. Solo se calculan las
+    distancias a los sitios de las celdas vecinas: una unidad sin sitios cerca recibe `inf`.
+    """
+    distancias_min = np.full(lats.shape, np.inf)
+    datos_categoria = indice["categorias"].get(categoria)
+    if datos_categoria is None or lats.size == 0:
+        return distancias_min
+
+    x, y = _proyectar_km(lats, lons, indice["lat_referencia"])
+    tamano = indice["tamano_celda_km"]
+    ix = np.floor(x / tamano).astype(np.int64)
+    iy = np.floor(y / tamano).astype(np.int64)
+
+    # Claves de las 9 celdas (propia + vecinas) de cada unidad: matriz (unidades x 9)
+    claves_vecinas = ((ix[:, None] + _VECINOS[:, 0]) << 32) + (iy[:, None] + _VECINOS[:, 1] + _DESPLAZAMIENTO_CELDA)
+    inicio = np.searchsorted(datos_categoria["claves"], claves_vecinas, side="left").ravel()
+    fin = np.searchsorted(datos_categoria["claves"], claves_vecinas, side="right").ravel()
+    conteos = fin - inicio
+
+    total_pares = int(conteos.sum())
+    if total_pares == 0:
+        return distancias_min
+
+    # Expansión vectorizada a pares (unidad, sitio candidato)
+    unidad_por_celda = np.repeat(np.arange(lats.size), len(_VECINOS))
+    idx_unidad = np.repeat(unidad_por_celda, conteos)
+    desplazamiento = np.arange(total_pares) - np.repeat(np.cumsum(conteos) - conteos, conteos)
+    idx_sitio = np.repeat(inicio, conteos) + desplazamiento
+
+    distancias = haversine(lats[idx_unidad], lons[idx_unidad],
+                           datos_categoria["lat"][idx_sitio], datos_categoria["lon"][idx_sitio])
+    np.minimum.at(distancias_min, idx_unidad, distancias)
+    return distancias_min
+
+
+# --- GEOCERCAS POLIGONALES (VERTEDEROS Y SEDES COMO LOTES IRREGULARES) ---
+# Cada categoría de puntos admite además una lista de polígonos en el JSON de la flota:
+#   "vertedero_poligonos": [ [[lat, lon], [lat, lon], [lat, lon], ...], ... ]
+# La prueba se hace en dos pasos por lote: filtro por bounding box (todas las unidades contra
+# todos los polígonos a la vez) y ray-casting exacto solo sobre las unidades candidatas.
+
+CATEGORIAS_POLIGONOS = {
+    "vertedero_coords": "vertedero_poligonos",
+    "sede_coords": "sede_poligonos",
+    "resguardo_secundario_coords": "resguardo_secundario_poligonos",
+}
+
+
+def preparar_poligonos(poligonos: Sequence[Sequence[Sequence[float]]]) -> Dict[str, Any]:
+    """Convierte la lista de polígonos del JSON a arreglos de vértices con su bounding box precalculado."""
+    vertices = []
+    for poligono in poligonos:
+        arreglo = np.asarray(poligono, dtype=float).reshape(-1, 2)
+        if len(arreglo) >= 3:
+            vertices.append(arreglo)
+
+    if not vertices:
+        return {"bbox": np.empty((0, 4)), "vertices": []}
+
+    # bbox: [lat_min, lon_min, lat_max, lon_max] por polígono
+    bbox = np.array([np.concatenate([v.min(axis=0), v.max(axis=0)]) for v in vertices])
+    return {"bbox": bbox, "vertices": vertices}
+
+
+def _ray_casting(lats: np.ndarray, lons: np.ndarray, vertices: np.ndarray) -> np.ndarray:
+    """Prueba punto-en-polígono (regla par-impar) de varios puntos contra un polígono, sin bucles."""
+    lat_i, lon_i = vertices[:, 0], vertices[:, 1]
+    lat_j, lon_j = np.roll(lat_i, 1), np.roll(lon_i, 1)
+
+    py = lats[:, None]
+    px = lons[:, None]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # Los lados horizontales dan división por cero, pero ya quedan excluidos por la primera condición
+        cruza = ((lat_i > py) != (lat_j > py)) & (px < (lon_j - lon_i) * (py - lat_i) / (lat_j - lat_i) + lon_i)
+    return (cruza.sum(axis=1) % 2) == 1
+
+
+def dentro_de_poligonos(lats: np.ndarray, lons: np.ndarray, poligonos: Dict[str, Any]) -> np.ndarray:
+    """Retorna True para cada unidad que está dentro de al menos uno de los polígonos preparados."""
+    dentro = np.zeros(lats.shape, dtype=bool)
+    bbox = poligonos["bbox"]
+    if len(bbox) == 0 or lats.size == 0:
+        return dentro
+
+    # 1. Filtro por bounding box en lote: matriz (unidades x polígonos)
+    en_bbox = (
+        (lats[:, None] >= bbox[:, 0]) & (lats[:, None] <= bbox[:, 2]) &
+        (lons[:, None] >= bbox[:, 1]) & (lons[:, None] <= bbox[:, 3])
+    )
+
+    # 2. Ray-casting exacto solo sobre los candidatos de cada polígono
+    for j, vertices in enumerate(poligonos["vertices"]):
+        candidatos = np.flatnonzero(en_bbox[:, j] & ~dentro)
+        if candidatos.size:
+            dentro[candidatos] = _ray_casting(lats[candidatos], lons[candidatos], vertices)
+    return dentro
+
+
+def clasificar_geocercas(lats, lons, flota_data: Dict, proximidad_km: float) -> Dict[str, np.ndarray]:
+    """
+    Retorna las columnas EN_VERTEDERO_FLAG / EN_SEDE_FLAG / EN_RESGUARDO_SECUNDARIO_FLAG y
+    DISTANCIA_SITIO_KM para todas las unidades a la vez.
+
+    Respeta la prioridad operacional original: Vertedero > Sede > Resguardo Secundario
+    (una unidad solo puede tener una bandera activa). Si la flota trae su 'indice_geocercas'
+    (ver construir_indice_geocercas) se usa; si no, se compara contra todos los sitios.
+    En modo indexado, DISTANCIA_SITIO_KM es `inf` para unidades sin ningún sitio en su vecindario.
+
+    Una unidad dentro de un polígono de la categoría cuenta como dentro de la zona
+    (con distancia 0), además del radio de `proximidad_km` alrededor de cada punto.
+    """
+    lats = np.asarray(lats, dtype=float)
+    lons = np.asarray(lons, dtype=float)
+
+    indice = flota_data.get("indice_geocercas")
+    if indice is not None and indice.get("tamano_celda_km", 0) >= proximidad_km:
+        distancias = {c: distancia_minima_indexada_km(lats, lons, indice, c) for c in CATEGORIAS_SITIOS}
+        poligonos = indice.get("poligonos") or _preparar_poligonos_flota(flota_data)
+    else:
+        distancias = {c: distancia_minima_km(lats, lons, flota_data.get(c, [])) for c in CATEGORIAS_SITIOS}
+        poligonos = _preparar_poligonos_flota(flota_data)
+
+    for categoria, poligonos_categoria in poligonos.items():
+        dentro = dentro_de_poligonos(lats, lons, poligonos_categoria)
+        distancias[categoria] = np.where(dentro, 0.0, distancias[categoria])
+
+    dist_vertedero = distancias["vertedero_coords"]
+    dist_sede = distancias["sede_coords"]
+    dist_resguardo = distancias["resguardo_secundario_coords"]
+
+    en_vertedero = dist_vertedero <= proximidad_km
+    en_sede = (dist_sede <= proximidad_km) & ~en_vertedero
+    en_resguardo_secundario = (dist_resguardo <= proximidad_km) & ~en_vertedero & ~en_sede
+
+    return {
+        "EN_VERTEDERO_FLAG": en_vertedero,
+        "EN_SEDE_FLAG": en_sede,
+        "EN_RESGUARDO_SECUNDARIO_FLAG": en_resguardo_secundario,
+        "DISTANCIA_SITIO_KM": np.minimum(np.minimum(dist_vertedero, dist_sede), dist_resguardo),
+    }
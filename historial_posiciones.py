@@ -0,0 +1,144 @@
+# --- HISTORIAL DE POSICIONES POR UNIDAD (BUFFER CIRCULAR EN MEMORIA) ---
+# Cada unidad tiene un buffer circular de capacidad fija con sus últimos reportes
+# (hora del reporte, lat, lon, velocidad, ignición). Todas las unidades comparten las mismas
+# matrices NumPy (una fila por unidad), así que la memoria por unidad es constante y cada
+# snapshot se agrega con una sola escritura vectorizada. Responde "¿dónde estaba hace N minutos?"
+# sin re-consultar la API (las tarjetas muestran cuánto se desplazó cada unidad, ver dashboard.py).
+#
+# Una unidad se conserva mientras siga apareciendo en las consultas, aunque no envíe reportes
+# nuevos (estacionada o con el GPS fallando): el desalojo usa la última consulta que la incluyó.
+
+import threading
+from typing import Any, Dict, Hashable, Iterable
+
+import numpy as np
+import pandas as pd
+
+# ~6 horas con un reporte por minuto
+CAPACIDAD_POR_UNIDAD = 360
+
+_NAT = np.datetime64("NaT", "ns")
+# Campos de cada muestra (mismo nombre que la columna del snapshot): (dtype, valor vacío)
+CAMPOS_MUESTRA = {
+    "LAST_REPORT_DT": ("datetime64[ns]", _NAT),
+    "LATITUD": (np.float64, np.nan),
+    "LONGITUD": (np.float64, np.nan),
+    "VELOCIDAD": (np.float32, np.nan),
+    "IGNICION_ACTIVA": (bool, False),
+}
+
+
+class HistorialPosiciones:
+    """
+    Buffers circulares por UNIT_ID, thread-safe (los escribe el poller y los leen las sesiones).
+
+    Una muestra solo se agrega si su LastReportTime es posterior a la última guardada para esa
+    unidad: el mismo reporte consultado dos veces (o por dos flotas que comparten la unidad) se
+    guarda una sola vez.
+    """
+
+    def __init__(self, capacidad_por_unidad: int = CAPACIDAD_POR_UNIDAD):
+        self.capacidad = int(capacidad_por_unidad)
+        self._lock = threading.Lock()
+        self._ids = pd.Index([], dtype=object)
+        self._muestras = {campo: np.empty((0, self.capacidad), dtype=dtype)
+                          for campo, (dtype, _) in CAMPOS_MUESTRA.items()}
+        self._cabeza = np.empty(0, dtype=np.int32)  # Próxima posición a escribir
+        self._cantidad = np.empty(0, dtype=np.int32)  # Muestras válidas (<= capacidad)
+        self._ultimo_reporte = np.empty(0, dtype="datetime64[ns]")
+        self._ultima_vista = np.empty(0, dtype="datetime64[ns]")  # Última consulta que incluyó la unidad
+
+    def __len__(self) -> int:
+        """Unidades con historial."""
+        with self._lock:
+            return len(self._ids)
+
+    def _posiciones(self, unit_ids: np.ndarray) -> np.ndarray:
+        posiciones = self._ids.get_indexer(unit_ids)
+        nuevas = posiciones < 0
+        if nuevas.any():
+            ids_nuevos = pd.unique(unit_ids[nuevas])
+            n = len(ids_nuevos)
+            self._ids = self._ids.append(pd.Index(ids_nuevos, dtype=object))
+            for campo, (dtype, vacio) in CAMPOS_MUESTRA.items():
+                self._muestras[campo] = np.concatenate(
+                    [self._muestras[campo], np.full((n, self.capacidad), vacio, dtype=dtype)])
+            self._cabeza = np.concatenate([self._cabeza, np.zeros(n, dtype=np.int32)])
+            self._cantidad = np.concatenate([self._cantidad, np.zeros(n, dtype=np.int32)])
+            self._ultimo_reporte = np.concatenate([self._ultimo_reporte, np.full(n, _NAT)])
+            self._ultima_vista = np.concatenate([self._ultima_vista, np.full(n, _NAT)])
+            posiciones = self._ids.get_indexer(unit_ids)
+        return posiciones
+
+    def agregar_snapshot(self, df: pd.DataFrame, ahora: Any) -> int:
+        """
+        Agrega los reportes nuevos del DataFrame de un snapshot consultado a la hora `ahora` y marca
+        todas sus unidades como vistas. Retorna cuántas muestras se guardaron.
+        """
+        if df.empty or "LAST_REPORT_DT" not in df.columns:
+            return 0
+        unit_ids = df["UNIT_ID"].to_numpy(dtype=object)
+        reportes = df["LAST_REPORT_DT"].to_numpy(dtype="datetime64[ns]")
+        vista = pd.Timestamp(ahora).tz_localize(None).to_datetime64().astype("datetime64[ns]")
+
+        with self._lock:
+            pos = self._posiciones(unit_ids)
+            self._ultima_vista[pos] = vista
+            # Una fila por unidad (la primera si la API la repite) y solo reportes más nuevos
+            pos_unicas, filas = np.unique(pos, return_index=True)
+            ultimo = self._ultimo_reporte[pos_unicas]
+            reporte = reportes[filas]
+            nuevo = ~np.isnat(reporte) & (np.isnat(ultimo) | (reporte > ultimo))
+            if not nuevo.any():
+                return 0
+
+            destino, filas = pos_unicas[nuevo], filas[nuevo]
+            columna = self._cabeza[destino]
+            for campo, (dtype, _) in CAMPOS_MUESTRA.items():
+                self._muestras[campo][destino, columna] = df[campo].to_numpy(dtype=dtype)[filas]
+            self._cabeza[destino] = (columna + 1) % self.capacidad
+            self._cantidad[destino] = np.minimum(self._cantidad[destino] + 1, self.capacidad)
+            self._ultimo_reporte[destino] = reportes[filas]
+            return int(nuevo.sum())
+
+    def posicion_en(self, unit_ids: Iterable[Hashable], instante: Any) -> pd.DataFrame:
+        """
+        Última muestra de cada unidad con reporte <= `instante` ("¿dónde estaba hace 20 minutos?").
+        Una fila por UNIT_ID pedido, con NaN/NaT si no hay muestra tan antigua.
+        """
+        unit_ids = np.asarray(list(unit_ids), dtype=object)
+        limite = pd.Timestamp(instante).tz_localize(None).to_datetime64().astype("datetime64[ns]")
+        resultado: Dict[str, Any] = {"UNIT_ID": unit_ids}
+        for campo, (dtype, vacio) in CAMPOS_MUESTRA.items():
+            resultado[campo] = np.full(len(unit_ids), vacio, dtype=dtype)
+
+        with self._lock:
+            pos = self._ids.get_indexer(unit_ids)
+            existe = np.flatnonzero(pos >= 0)
+            if len(existe):
+                filas = pos[existe]
+                fechas = self._muestras["LAST_REPORT_DT"][filas]
+                # Entre las muestras anteriores al instante, la más reciente (vectorizado por fila)
+                candidatas = ~np.isnat(fechas) & (fechas <= limite)
+                claves = np.where(candidatas, fechas.astype(np.int64), np.iinfo(np.int64).min)
+                columna = claves.argmax(axis=1)
+                encontrada = candidatas[np.arange(len(filas)), columna]
+                destino = existe[encontrada]
+                for campo in CAMPOS_MUESTRA:
+                    resultado[campo][destino] = self._muestras[campo][filas[encontrada], columna[encontrada]]
+        return pd.DataFrame(resultado)
+
+    def desalojar(self, vistas_antes_de: Any) -> int:
+        """Elimina las unidades que ninguna consulta incluye desde `vistas_antes_de`. Retorna cuántas eliminó."""
+        limite = pd.Timestamp(vistas_antes_de).tz_localize(None).to_datetime64().astype("datetime64[ns]")
+        with self._lock:
+            conservar = ~np.isnat(self._ultima_vista) & (self._ultima_vista >= limite)
+            eliminadas = int(len(conservar) - conservar.sum())
+            if eliminadas:
+                self._ids = self._ids[conservar]
+                self._muestras = {campo: valores[conservar] for campo, valores in self._muestras.items()}
+                self._cabeza = self._cabeza[conservar]
+                self._cantidad = self._cantidad[conservar]
+                self._ultimo_reporte = self._ultimo_reporte[conservar]
+                self._ultima_vista = self._ultima_vista[conservar]
+            return eliminadas
@@ -0,0 +1,94 @@
+# --- INGESTIÓN DE DATOS DE UNIDADES (API FORESIGHT -> COLUMNAS TIPADAS) ---
+# Vive en un módulo (y no en dashboard.py) para que sus cachés sobrevivan a los reruns
+# de Streamlit: el script se re-ejecuta completo, pero los módulos importados no.
+
+import threading
+from typing import Any, Dict, Iterable, List
+
+import numpy as np
+import pandas as pd
+
+# Formato de fecha y hora requerido para parsear 'LastReportTime': 'Sep 30 2025 12:57PM'
+TIME_FORMAT = '%b %d %Y %I:%M%p'
+
+
+class CacheFechasReporte:
+    """
+    Memoiza el parseo de 'LastReportTime'. Entre un sondeo y el siguiente la mayoría de las
+    unidades repite exactamente el mismo texto, así que solo se parsean (con UNA llamada
+    vectorizada a pd.to_datetime) los textos que no se habían visto antes.
+    """
+
+    def __init__(self, formato: str = TIME_FORMAT, capacidad: int = 50_000):
+        self._formato = formato
+        self._capacidad = capacidad
+        self._cache: Dict[object, np.datetime64] = {}
+        self._lock = threading.Lock()
+
+    def parsear(self, textos: Iterable) -> pd.Series:
+        """Retorna una serie datetime64[ns] (NaT para textos vacíos o con formato inválido)."""
+        serie = pd.Series(textos, dtype=object)
+
+        with self._lock:
+            faltantes = [texto for texto in pd.unique(serie) if texto not in self._cache]
+            if faltantes:
+                # Cota simple de memoria: si se llena, se reinicia y se parsea todo lo vigente otra vez
+                if len(self._cache) + len(faltantes) > self._capacidad:
+                    self._cache.clear()
+                    faltantes = list(pd.unique(serie))
+                parseados = pd.to_datetime(pd.Series(faltantes, dtype=object), format=self._formato, errors='coerce')
+                self._cache.update(zip(faltantes, parseados.to_numpy(dtype='datetime64[ns]')))
+            fechas = serie.map(self._cache)
+
+        return pd.Series(fechas, index=serie.index).astype('datetime64[ns]')
+
+
+# Instancia única del proceso (compartida por el poller y todas las sesiones)
+FECHAS_REPORTE = CacheFechasReporte()
+
+
+def minutos_desde(fechas: pd.Series, hora_referencia: pd.Timestamp) -> np.ndarray:
+    """Minutos transcurridos entre cada fecha y `hora_referencia` como arreglo float (NaN si la fecha es NaT)."""
+    diferencias = hora_referencia.to_datetime64() - fechas.to_numpy(dtype='datetime64[ns]')
+    return diferencias / np.timedelta64(1, 'm')
+
+
+def ingerir_unidades(lista_unidades: List[Dict[str, Any]]) -> pd.DataFrame:
+    """
+    Extrae de la lista 'DATA' de la API solo los campos que usa el dashboard, en UNA pasada,
+    y arma cada columna tipada de una vez (float64 para coordenadas, float32 para velocidad, bool
+    para ignición, category para UNIDAD y UNIT_ID, datetime64 para el último reporte) en lugar de
+    un dict por unidad con dtype object. Las conversiones las hace NumPy/pandas sobre la columna entera.
+    """
+    campos = [
+        (
+            unidad.get("name", "N/A"),
+            # unit_id debe ser único, usamos unitid o name como fallback
+            unidad.get("unitid", unidad.get("name", "N/A_ID_FALLBACK")),
+            unidad.get("ylat", 0.0),
+            unidad.get("xlong", 0.0),
+            unidad.get("speed_dunit", 0.0),
+            unidad.get("ignition", "false"),
+            unidad.get("location", "Dirección no disponible"),
+            unidad.get("LastReportTime", "N/A"),
+        )
+        for unidad in lista_unidades
+    ]
+    nombres, unit_ids, latitudes, longitudes, velocidades, ignicion, ubicaciones, reportes = (
+        zip(*campos) if campos else ((),) * 8
+    )
+
+    df = pd.DataFrame({
+        "UNIDAD": pd.Categorical(nombres),
+        "UNIT_ID": pd.Categorical(unit_ids),
+        "IGNICION_ACTIVA": np.char.lower(np.array(ignicion, dtype=str)) == "true",
+        # NumPy convierte también los números que la API envía como texto ("10.48")
+        "VELOCIDAD": np.array(velocidades, dtype=np.float32),
+        "LATITUD": np.array(latitudes, dtype=np.float64),
+        "LONGITUD": np.array(longitudes, dtype=np.float64),
+        "UBICACION_TEXTO": np.array(ubicaciones, dtype=object),
+        "LAST_REPORT_TIME_DISPLAY": np.array(reportes, dtype=object),
+    })
+    # Fecha del último reporte ya parseada (solo los textos nuevos desde el sondeo anterior se parsean)
+    df["LAST_REPORT_DT"] = FECHAS_REPORTE.parsear(df["LAST_REPORT_TIME_DISPLAY"])
+    return df
@@ -0,0 +1,114 @@
+# --- PERSISTENCIA DEL HISTORIAL DE PARADAS EN SQLITE ---
+# El historial de paradas (estado_unidades.EstadoParadas) vive en memoria; este módulo lo respalda en
+# una base SQLite local en modo WAL para que un reinicio o redeploy retome los temporizadores
+# de parada en curso en lugar de reiniciarlos a "ahora". Cada snapshot aplicado se guarda
+# con UNA transacción (executemany), no una escritura por unidad.
+
+import sqlite3
+import threading
+from typing import Dict, Hashable, Iterable, Tuple
+
+import numpy as np
+
+# Mismas columnas que EstadoParadas.COLUMNAS
+COLUMNAS_ESTADO = ("ultimo_reporte", "ultima_velocidad", "hora_ultimo_reporte", "ultimo_movimiento",
+                   "parada_fuera_de_base_min", "ultima_vista")
+# Columnas datetime64 (se guardan como enteros en nanosegundos desde epoch, NULL si NaT)
+COLUMNAS_FECHA = ("ultimo_reporte", "hora_ultimo_reporte", "ultimo_movimiento", "ultima_vista")
+# Columnas agregadas después de la primera versión del esquema: {columna: tipo SQLite}
+_COLUMNAS_AGREGADAS = {"ultima_velocidad": "REAL", "hora_ultimo_reporte": "INTEGER"}
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS estado_paradas (
+    flota TEXT NOT NULL,
+    unit_id NOT NULL,  -- sin tipo: conserva int o str tal como viene de la API
+    ultimo_reporte INTEGER,
+    ultima_velocidad REAL,
+    hora_ultimo_reporte INTEGER,
+    ultimo_movimiento INTEGER,
+    parada_fuera_de_base_min REAL,
+    ultima_vista INTEGER,
+    PRIMARY KEY (flota, unit_id)
+)
+"""
+
+
+def _a_sql(columna: str, valores: np.ndarray) -> list:
+    """Convierte una columna NumPy a valores de SQLite (NaT/NaN -> NULL)."""
+    if columna in COLUMNAS_FECHA:
+        enteros = valores.astype("datetime64[ns]").astype(np.int64).tolist()
+        return [None if nat else entero for entero, nat in zip(enteros, np.isnat(valores).tolist())]
+    return [None if np.isnan(valor) else valor for valor in valores.astype(np.float64).tolist()]
+
+
+def _desde_sql(columna: str, valores: list) -> np.ndarray:
+    """Inverso de _a_sql."""
+    if columna in COLUMNAS_FECHA:
+        return np.array([np.datetime64("NaT", "ns") if valor is None else np.datetime64(valor, "ns")
+                         for valor in valores], dtype="datetime64[ns]")
+    return np.array([np.nan if valor is None else valor for valor in valores], dtype=np.float64)
+
+
+class PersistenciaEstadoSQLite:
+    """Respaldo del estado por (flota, unit_id) en SQLite (WAL). Seguro para usar desde varios hilos."""
+
+    def __init__(self, ruta: str):
+        self.ruta = ruta
+        self._lock = threading.Lock()
+        self._conexion = sqlite3.connect(ruta, check_same_thread=False, isolation_level=None)
+        # WAL: los lectores no bloquean al escritor y cada commit es un append al log
+        self._conexion.execute("PRAGMA journal_mode=WAL")
+        self._conexion.execute("PRAGMA synchronous=NORMAL")
+        self._conexion.execute(_ESQUEMA)
+        # Bases creadas con un esquema anterior: las columnas nuevas quedan en NULL (NaT/NaN al cargar)
+        existentes = {fila[1] for fila in self._conexion.execute("PRAGMA table_info(estado_paradas)")}
+        for columna, tipo in _COLUMNAS_AGREGADAS.items():
+            if columna not in existentes:
+                self._conexion.execute(f"ALTER TABLE estado_paradas ADD COLUMN {columna} {tipo}")
+
+    def guardar(self, flota: Hashable, unit_ids: Iterable[Hashable], columnas: Dict[str, np.ndarray]) -> None:
+        """Inserta/actualiza las filas de la flota en una sola transacción."""
+        valores = [_a_sql(columna, columnas[columna]) for columna in COLUMNAS_ESTADO]
+        filas = [(str(flota), unit_id, *resto) for unit_id, *resto in zip(list(unit_ids), *valores)]
+        if not filas:
+            return
+        with self._lock:
+            self._conexion.execute("BEGIN")
+            try:
+                self._conexion.executemany(
+                    f"INSERT OR REPLACE INTO estado_paradas (flota, unit_id, {', '.join(COLUMNAS_ESTADO)}) "
+                    f"VALUES (?, ?, {', '.join('?' * len(COLUMNAS_ESTADO))})",
+                    filas
+                )
+                self._conexion.execute("COMMIT")
+            except Exception:
+                self._conexion.execute("ROLLBACK")
+                raise
+
+    def cargar(self) -> Dict[str, Tuple[list, Dict[str, np.ndarray]]]:
+        """Retorna {flota: (unit_ids, {columna: arreglo})} con todo lo guardado."""
+        with self._lock:
+            filas = self._conexion.execute(
+                f"SELECT flota, unit_id, {', '.join(COLUMNAS_ESTADO)} FROM estado_paradas ORDER BY flota"
+            ).fetchall()
+
+        por_flota: Dict[str, list] = {}
+        for fila in filas:
+            por_flota.setdefault(fila[0], []).append(fila[1:])
+
+        resultado = {}
+        for flota, filas_flota in por_flota.items():
+            unit_ids, *columnas = zip(*filas_flota)
+            resultado[flota] = (list(unit_ids), {nombre: _desde_sql(nombre, list(valores))
+                                                 for nombre, valores in zip(COLUMNAS_ESTADO, columnas)})
+        return resultado
+
+    def eliminar_vistas_antes_de(self, limite: np.datetime64) -> None:
+        """Borra las unidades cuyo último snapshot es anterior a `limite` (mismo TTL que la memoria)."""
+        limite_ns = int(np.datetime64(limite, "ns").astype(np.int64))
+        with self._lock:
+            self._conexion.execute("DELETE FROM estado_paradas WHERE ultima_vista < ?", (limite_ns,))
+
+    def cerrar(self) -> None:
+        with self._lock:
+            self._conexion.close()
@@ -0,0 +1,277 @@
+# --- POLLER COMPARTIDO DE FLOTAS ---
+# Un único hilo por proceso consulta la API de Foresight una vez por intervalo
+# para cada flota que alguna sesión esté mirando, y publica un snapshot
+# inmutable. Las sesiones de Streamlit solo leen el último snapshot, así que la
+# carga sobre la API y el CPU no crecen con el número de usuarios conectados.
+#
+# Si una consulta falla, se sigue sirviendo el último snapshot bueno (marcado como
+# obsoleto, con su antigüedad) y la flota se reintenta con backoff exponencial.
+#
+# Las claves suscritas de forma permanente se siguen consultando aunque nadie las mire
+# (a un ritmo más lento), para que el historial de movimiento no tenga huecos.
+#
+# Cada publicación lleva una versión creciente: una sesión compara la versión que ya
+# dibujó con la del último snapshot para saber, sin esperar ni bloquear, si hay datos nuevos.
+
+import threading
+import time
+from dataclasses import dataclass, replace
+from typing import Callable, Dict, Hashable, Iterable, List, Optional, Set, Union
+
+import pandas as pd
+
+BACKOFF_MAXIMO_SEGUNDOS = 120.0
+
+
+@dataclass(frozen=True)
+class SnapshotFlota:
+    """Resultado de una consulta de flota, publicado por el poller y compartido entre sesiones."""
+    datos: pd.DataFrame
+    hora_consulta: float  # time.time() del último intento (exitoso o no)
+    version: int  # Creciente: un snapshot más nuevo de la misma clave siempre tiene versión mayor
+    hora_ultimo_exito: Optional[float] = None  # time.time() en que se obtuvieron `datos`
+    error: Optional[str] = None  # Error del último intento, None si fue exitoso
+    fallos_consecutivos: int = 0
+
+    @property
+    def es_obsoleto(self) -> bool:
+        """True si el último intento falló y `datos` son los del último snapshot bueno."""
+        return self.error is not None and self.hora_ultimo_exito is not None
+
+    def edad_segundos(self, ahora: Optional[float] = None) -> float:
+        """Segundos transcurridos desde que se obtuvieron los datos mostrados."""
+        referencia = self.hora_ultimo_exito if self.hora_ultimo_exito is not None else self.hora_consulta
+        return (ahora if ahora is not None else time.time()) - referencia
+
+
+class PollerFlotas:
+    """
+    Hilo de fondo que refresca las flotas suscritas cada `intervalo_segundos`.
+
+    La clave de cada suscripción (p. ej. el nombre de la flota) se pasa a `funcion_consulta(clave)`, que debe
+    retornar un DataFrame o lanzar una excepción si la consulta falla. Una clave que nadie
+    lee durante `inactividad_maxima_segundos` se da de baja y deja de consultarse.
+
+    Si se entrega `funcion_consulta_lote(claves) -> {clave: DataFrame | Exception}`, cada ciclo
+    refresca todas las claves suscritas con una sola llamada (p. ej. todas las flotas en paralelo).
+
+    Cuando falla una clave que nunca tuvo datos buenos se publica `funcion_fallback(error)`.
+
+    Las claves de `suscribir_permanente` nunca se dan de baja; mientras nadie las lea se
+    refrescan cada `intervalo_sin_lectores_segundos` en lugar de cada `intervalo_segundos`.
+
+    IMPORTANTE: el DataFrame del snapshot es compartido. Quien necesite modificarlo
+    debe trabajar sobre una copia (`snapshot.datos.copy()`).
+    """
+
+    def __init__(self, funcion_consulta: Callable[[Hashable], pd.DataFrame],
+                 intervalo_segundos: float = 5.0, inactividad_maxima_segundos: float = 60.0,
+                 funcion_consulta_lote: Optional[Callable[[List[Hashable]], Dict[Hashable, Union[pd.DataFrame, Exception]]]] = None,
+                 funcion_fallback: Optional[Callable[[Exception], pd.DataFrame]] = None,
+                 backoff_maximo_segundos: float = BACKOFF_MAXIMO_SEGUNDOS,
+                 intervalo_sin_lectores_segundos: Optional[float] = None):
+        self._funcion_consulta = funcion_consulta
+        self._funcion_consulta_lote = funcion_consulta_lote
+        self._funcion_fallback = funcion_fallback or (lambda error: pd.DataFrame())
+        self.intervalo_segundos = intervalo_segundos
+        self.inactividad_maxima_segundos = inactividad_maxima_segundos
+        self.backoff_maximo_segundos = backoff_maximo_segundos
+        self.intervalo_sin_lectores_segundos = intervalo_sin_lectores_segundos or intervalo_segundos
+
+        self._lock = threading.Lock()
+        self._snapshots: Dict[Hashable, SnapshotFlota] = {}
+        self._ultima_lectura: Dict[Hashable, float] = {}
+        self._locks_consulta: Dict[Hashable, threading.Lock] = {}
+        self._proximo_intento: Dict[Hashable, float] = {}
+        self._permanentes: Set[Hashable] = set()
+        self._version = 0
+
+        self._despertar = threading.Event()
+        self._hilo: Optional[threading.Thread] = None
+
+    # --- API PÚBLICA (usada por las sesiones) ---
+
+    def obtener_snapshot(self, clave: Hashable) -> SnapshotFlota:
+        """Suscribe la clave (si no lo estaba) y retorna su último snapshot publicado."""
+        self._asegurar_hilo()
+
+        despertar = False
+        with self._lock:
+            ahora = time.time()
+            sin_lectores = ahora - self._ultima_lectura.get(clave, 0.0) > self.inactividad_maxima_segundos
+            self._ultima_lectura[clave] = ahora
+            snapshot = self._snapshots.get(clave)
+            if snapshot is None:
+                # La consulta síncrona de abajo cubre este ciclo: el hilo no debe repetirla.
+                self._proximo_intento.setdefault(clave, ahora + self.intervalo_segundos)
+            elif sin_lectores and snapshot.error is None:
+                # Clave permanente que se refrescaba al ritmo lento: vuelve al intervalo normal ya
+                proximo = snapshot.hora_consulta + self.intervalo_segundos
+                if proximo < self._proximo_intento.get(clave, 0.0):
+                    self._proximo_intento[clave] = proximo
+                    despertar = True
+        if despertar:
+            self._despertar.set()
+
+        if snapshot is None:
+            # Primera sesión que pide esta flota: consultamos de forma síncrona para no
+            # mostrar una pantalla vacía hasta el próximo ciclo del hilo.
+            snapshot = self._consultar_y_publicar(clave)
+
+        return snapshot
+
+    def suscribir_permanente(self, claves: Iterable[Hashable]) -> None:
+        """Mantiene las claves suscritas aunque ninguna sesión las lea (y arranca el hilo)."""
+        with self._lock:
+            for clave in claves:
+                self._permanentes.add(clave)
+                self._ultima_lectura.setdefault(clave, 0.0)
+        self._asegurar_hilo()
+        self._despertar.set()
+
+    def invalidar(self, condicion: Callable[[Hashable], bool]) -> int:
+        """
+        Fuerza el refresco inmediato de las claves suscritas que cumplan `condicion` (p. ej. una
+        sola flota), sin tocar las demás ni borrar lo que se está mostrando. Retorna cuántas claves marcó.
+        """
+        with self._lock:
+            claves = [clave for clave in self._ultima_lectura if condicion(clave)]
+            for clave in claves:
+                self._proximo_intento[clave] = 0.0
+        if claves:
+            self._despertar.set()
+        return len(claves)
+
+    def detener(self) -> None:
+        """Detiene el hilo de fondo (usado al descartar el recurso compartido)."""
+        hilo = self._hilo
+        self._hilo = None
+        self._despertar.set()
+        if hilo is not None and hilo.is_alive():
+            hilo.join(timeout=1.0)
+
+    # --- LÓGICA INTERNA ---
+
+    def _asegurar_hilo(self) -> None:
+        with self._lock:
+            if self._hilo is not None and self._hilo.is_alive():
+                return
+            self._despertar.clear()
+            self._hilo = threading.Thread(target=self._bucle, name="poller-flotas", daemon=True)
+            self._hilo.start()
+
+    def _lock_de(self, clave: Hashable) -> threading.Lock:
+        with self._lock:
+            return self._locks_consulta.setdefault(clave, threading.Lock())
+
+    def _consultar_y_publicar(self, clave: Hashable) -> SnapshotFlota:
+        """Consulta la API para la clave y publica el snapshot. Evita consultas duplicadas simultáneas."""
+        lock_clave = self._lock_de(clave)
+        hora_inicio = time.time()
+
+        with lock_clave:
+            # Si otra sesión/hilo publicó mientras esperábamos el lock, reutilizamos su resultado.
+            with self._lock:
+                existente = self._snapshots.get(clave)
+            if existente is not None and existente.hora_consulta >= hora_inicio:
+                return existente
+
+            try:
+                resultado = self._funcion_consulta(clave)
+            except Exception as e:
+                resultado = e
+            return self._publicar(clave, resultado)
+
+    def _publicar(self, clave: Hashable, resultado: Union[pd.DataFrame, Exception]) -> SnapshotFlota:
+        """Publica datos nuevos, o ante un error conserva el último snapshot bueno y agenda el reintento."""
+        ahora = time.time()
+        with self._lock:
+            self._version += 1
+            anterior = self._snapshots.get(clave)
+
+            if not isinstance(resultado, Exception):
+                self._proximo_intento[clave] = ahora + self._intervalo_de(clave, ahora)
+                snapshot = SnapshotFlota(datos=resultado, hora_consulta=ahora, version=self._version,
+                                         hora_ultimo_exito=ahora)
+            else:
+                fallos = (anterior.fallos_consecutivos if anterior is not None else 0) + 1
+                espera = min(self.intervalo_segundos * (2 ** fallos), self.backoff_maximo_segundos)
+                self._proximo_intento[clave] = ahora + espera
+                print(f"❌ [POLLER] Error al refrescar {clave} (fallo #{fallos}, reintento en {espera:.0f}s): {resultado}")
+
+                if anterior is not None and anterior.hora_ultimo_exito is not None:
+                    # Last-known-good: mismos datos, marcados como obsoletos
+                    snapshot = replace(anterior, hora_consulta=ahora, version=self._version,
+                                       error=str(resultado), fallos_consecutivos=fallos)
+                else:
+                    snapshot = SnapshotFlota(datos=self._funcion_fallback(resultado), hora_consulta=ahora,
+                                             version=self._version, error=str(resultado), fallos_consecutivos=fallos)
+
+            self._snapshots[clave] = snapshot
+        return snapshot
+
+    def _intervalo_de(self, clave: Hashable, ahora: float) -> float:
+        """Intervalo normal si alguna sesión leyó la clave recientemente; si no, el de sin lectores."""
+        if ahora - self._ultima_lectura.get(clave, 0.0) <= self.inactividad_maxima_segundos:
+            return self.intervalo_segundos
+        return self.intervalo_sin_lectores_segundos
+
+    def _refrescar(self, claves: List[Hashable]) -> None:
+        """Refresca las claves activas (en lote si hay función de lote, si no una por una)."""
+        if not claves:
+            return
+
+        if self._funcion_consulta_lote is not None:
+            try:
+                resultados = self._funcion_consulta_lote(claves)
+            except Exception as e:
+                resultados = {clave: e for clave in claves}
+            with self._lock:
+                activas = set(self._ultima_lectura)
+            for clave, resultado in resultados.items():
+                if clave in activas:
+                    self._publicar(clave, resultado)
+            return
+
+        for clave in claves:
+            self._consultar_y_publicar(clave)
+
+    def _claves_a_refrescar(self) -> List[Hashable]:
+        """
+        Da de baja las claves que ninguna sesión ha leído recientemente y retorna las activas
+        cuyo backoff (si lo tienen) ya venció.
+        """
+        ahora = time.time()
+        with self._lock:
+            for clave, ultima in list(self._ultima_lectura.items()):
+                if ahora - ultima > self.inactividad_maxima_segundos and clave not in self._permanentes:
+                    del self._ultima_lectura[clave]
+                    self._snapshots.pop(clave, None)
+                    self._locks_consulta.pop(clave, None)
+                    self._proximo_intento.pop(clave, None)
+            # Se incluyen las claves que vencen dentro del próximo cuarto de intervalo para que
+            # viajen juntas en el mismo lote en lugar de desfasarse en consultas separadas.
+            limite = ahora + self.intervalo_segundos * 0.25
+            return [clave for clave in self._ultima_lectura
+                    if self._proximo_intento.get(clave, 0.0) <= limite]
+
+    def _segundos_hasta_proxima_clave(self) -> float:
+        with self._lock:
+            proximos = [self._proximo_intento.get(clave, 0.0) for clave in self._ultima_lectura]
+        if not proximos:
+            return self.intervalo_segundos
+        return min(self.intervalo_segundos, max(0.05, min(proximos) - time.time()))
+
+    def _bucle(self) -> None:
+        hilo_actual = threading.current_thread()
+        while self._hilo is hilo_actual:
+            try:
+                # Cada clave tiene su propio vencimiento (intervalo normal, backoff o invalidación)
+                self._refrescar(self._claves_a_refrescar())
+            except Exception as e:
+                # Nunca dejamos morir el hilo: se conservan los snapshots anteriores.
+                print(f"❌ [POLLER] Error inesperado en el ciclo: {e}")
+
+            self._despertar.wait(self._segundos_hasta_proxima_clave())
+            if self._hilo is hilo_actual:
+                self._despertar.clear()
@@ -0,0 +1,196 @@
+# --- REPRODUCCIÓN DEL ARCHIVO HISTÓRICO (MODO "REPLAY") ---
+# Reconstruye, sondeo a sondeo, lo que el poller vio de una flota en un día archivado y lo
+# entrega con el mismo formato que ingerir_unidades, para pasarlo por la misma clasificación
+# y las mismas alertas que los datos en vivo. Sirve para ajustar umbrales sin esperar eventos
+# reales y como entrada determinista para medir el bucle principal.
+#
+# La lectura es perezosa (generador): se abre un archivo Parquet a la vez con memory-map y se
+# leen lotes de filas, así un día completo nunca está en memoria; solo el último estado de
+# cada unidad.
+
+import os
+import time
+from typing import Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from archivo_telemetria import carpeta_particion, pyarrow_disponible
+from ingestion_unidades import TIME_FORMAT
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:
+    pq = None
+
+# Columnas de ingerir_unidades (la clasificación se recalcula con la configuración actual de la flota)
+COLUMNAS_INGESTION = [
+    "UNIDAD", "UNIT_ID", "IGNICION_ACTIVA", "VELOCIDAD", "LATITUD", "LONGITUD",
+    "UBICACION_TEXTO", "LAST_REPORT_TIME_DISPLAY", "LAST_REPORT_DT",
+]
+VELOCIDAD_MINIMA, VELOCIDAD_MAXIMA = 1, 100
+# Huecos del archivo (p. ej. la noche, o el servidor apagado) más largos que esto se saltan
+SALTO_MAXIMO = pd.Timedelta(minutes=5)
+UBICACION_NO_ARCHIVADA = "Sin dirección en el archivo"
+
+
+def _aplicar_reportes(estado: Optional[pd.DataFrame], partes: List[pd.DataFrame]) -> pd.DataFrame:
+    """Estado por UNIT_ID actualizado con los reportes de un sondeo (mismo orden de unidades)."""
+    nuevas = pd.concat(partes).drop_duplicates("UNIT_ID", keep="last").set_index("UNIT_ID")
+    if estado is None:
+        return nuevas
+    combinado = pd.concat([estado, nuevas])
+    combinado = combinado[~combinado.index.duplicated(keep="last")]
+    return combinado.reindex(estado.index.append(nuevas.index.difference(estado.index, sort=False)))
+
+
+def _como_ingestion(estado: pd.DataFrame) -> pd.DataFrame:
+    """DataFrame con las columnas y tipos de ingerir_unidades."""
+    df = estado.reset_index()
+    df["LAST_REPORT_DT"] = df["LAST_REPORT_DT"].astype("datetime64[ns]")
+    # Archivos escritos antes de guardar estas columnas
+    if "UBICACION_TEXTO" not in df.columns:
+        df["UBICACION_TEXTO"] = UBICACION_NO_ARCHIVADA
+    if "LAST_REPORT_TIME_DISPLAY" not in df.columns:
+        df["LAST_REPORT_TIME_DISPLAY"] = df["LAST_REPORT_DT"].dt.strftime(TIME_FORMAT).fillna("N/A")
+    df["VELOCIDAD"] = df["VELOCIDAD"].astype(np.float32)
+    df["IGNICION_ACTIVA"] = df["IGNICION_ACTIVA"].astype(bool)
+    df["UNIDAD"] = df["UNIDAD"].astype("category")
+    df["UNIT_ID"] = df["UNIT_ID"].astype("category")
+    return df[COLUMNAS_INGESTION]
+
+
+def _primera_hora_consulta(archivo) -> Optional[pd.Timestamp]:
+    """
+    Menor HORA_CONSULTA de una parte (None si está vacía), de las estadísticas de cada row group;
+    si el archivo no las trae, se lee esa columna.
+    """
+    metadatos = archivo.metadata
+    minimos = []
+    for grupo in range(metadatos.num_row_groups):
+        row_group = metadatos.row_group(grupo)
+        columna = next(row_group.column(i) for i in range(row_group.num_columns)
+                       if row_group.column(i).path_in_schema == "HORA_CONSULTA")
+        if columna.statistics is None or not columna.statistics.has_min_max:
+            horas = archivo.read(columns=["HORA_CONSULTA"]).column(0).to_pandas()
+            return pd.Timestamp(horas.min()) if len(horas) else None
+        minimos.append(pd.Timestamp(columna.statistics.min))
+    return min(minimos) if minimos else None
+
+
+def iterar_sondeos(raiz: str, flota: str, fecha: str,
+                   desde: Optional[pd.Timestamp] = None) -> Iterator[Tuple[pd.Timestamp, pd.DataFrame]]:
+    """
+    Genera (HORA_CONSULTA, DataFrame de la flota completa) por cada sondeo archivado del día
+    `fecha` ('AAAA-MM-DD'), en orden. El archivo solo guarda los reportes nuevos, así que las
+    unidades sin reporte nuevo conservan el último conocido. Con `desde`, los sondeos anteriores
+    se aplican al estado pero no se entregan.
+    """
+    if not pyarrow_disponible():
+        raise ImportError("La reproducción del archivo requiere pyarrow (pip install pyarrow).")
+    carpeta = carpeta_particion(raiz, flota, fecha)
+    if not os.path.isdir(carpeta):
+        return
+    desde = pd.Timestamp(desde).tz_localize(None) if desde is not None else None
+
+    estado = None
+    pendientes: List[pd.DataFrame] = []  # Filas del sondeo en curso (puede cruzar lotes y archivos)
+    hora_actual = None
+    # Partes en orden de su primera HORA_CONSULTA (no del nombre del archivo). Cada parte guarda sondeos
+    # consecutivos en orden, así que recorrerlas así entrega todos los sondeos en orden cronológico.
+    partes = []
+    for nombre in (n for n in os.listdir(carpeta) if n.endswith(".parquet")):
+        # Solo el footer: las partes se abren de a una al recorrerlas
+        with pq.ParquetFile(os.path.join(carpeta, nombre)) as archivo:
+            primera_hora = _primera_hora_consulta(archivo)
+        if primera_hora is not None:
+            partes.append((primera_hora, nombre))
+
+    for _, nombre in sorted(partes):
+        archivo = pq.ParquetFile(os.path.join(carpeta, nombre), memory_map=True)
+        disponibles = set(archivo.schema_arrow.names)
+        columnas = ["HORA_CONSULTA"] + [c for c in COLUMNAS_INGESTION if c in disponibles]
+        for lote in archivo.iter_batches(columns=columnas):
+            filas = lote.to_pandas()
+            horas = filas["HORA_CONSULTA"].to_numpy()
+            cortes = (np.flatnonzero(horas[1:] != horas[:-1]) + 1).tolist()
+            for inicio, fin in zip([0] + cortes, cortes + [len(filas)]):
+                hora = pd.Timestamp(horas[inicio])
+                if hora_actual is not None and hora != hora_actual:
+                    estado, pendientes = _aplicar_reportes(estado, pendientes), []
+                    if desde is None or hora_actual >= desde:
+                        yield hora_actual, _como_ingestion(estado)
+                hora_actual = hora
+                pendientes.append(filas.iloc[inicio:fin].drop(columns="HORA_CONSULTA"))
+
+    if pendientes:
+        estado = _aplicar_reportes(estado, pendientes)
+        if desde is None or hora_actual >= desde:
+            yield hora_actual, _como_ingestion(estado)
+
+
+class ReproduccionArchivo:
+    """
+    Reloj de reproducción sobre iterar_sondeos: el tiempo del archivo avanza `velocidad` veces
+    más rápido que el real. `avanzar()` entrega, en orden, todos los sondeos que ya "ocurrieron"
+    según ese reloj; a 100× la sesión los aplica todos (no se pierden paradas ni excesos) aunque
+    solo dibuje el último.
+    """
+
+    def __init__(self, raiz: str, flota: str, fecha: str, velocidad: float = VELOCIDAD_MINIMA,
+                 desde: Optional[pd.Timestamp] = None):
+        self.flota = flota
+        self.fecha = fecha
+        self.velocidad = float(np.clip(velocidad, VELOCIDAD_MINIMA, VELOCIDAD_MAXIMA))
+        self.sondeos_entregados = 0
+        self._sondeos = iterar_sondeos(raiz, flota, fecha, desde)
+        self._siguiente = next(self._sondeos, None)
+        self.reloj: Optional[pd.Timestamp] = self._siguiente[0] if self._siguiente is not None else None
+        self._ancla: Optional[Tuple[float, pd.Timestamp]] = None  # (time.monotonic(), hora del archivo)
+
+    @property
+    def terminada(self) -> bool:
+        return self._siguiente is None
+
+    def _reloj_en(self, ahora_real: float) -> pd.Timestamp:
+        inicio_real, inicio_archivo = self._ancla
+        return inicio_archivo + pd.Timedelta(seconds=(ahora_real - inicio_real) * self.velocidad)
+
+    def cambiar_velocidad(self, velocidad: float, ahora_real: Optional[float] = None) -> None:
+        """Cambia la velocidad sin saltos: el reloj sigue desde donde va."""
+        velocidad = float(np.clip(velocidad, VELOCIDAD_MINIMA, VELOCIDAD_MAXIMA))
+        if velocidad == self.velocidad:
+            return
+        if self._ancla is not None:
+            ahora_real = time.monotonic() if ahora_real is None else ahora_real
+            self._ancla = (ahora_real, self._reloj_en(ahora_real))
+        self.velocidad = velocidad
+
+    def sondeo_pendiente(self, ahora_real: Optional[float] = None) -> bool:
+        """True si `avanzar()` entregaría algún sondeo ahora (no avanza nada)."""
+        if self._siguiente is None:
+            return False
+        if self._ancla is None:
+            return True
+        espera = self._siguiente[0] - self._reloj_en(time.monotonic() if ahora_real is None else ahora_real)
+        return espera <= pd.Timedelta(0) or espera > SALTO_MAXIMO
+
+    def avanzar(self, ahora_real: Optional[float] = None) -> List[Tuple[pd.Timestamp, pd.DataFrame]]:
+        """Sondeos con HORA_CONSULTA <= reloj (la primera llamada entrega el primero y arranca el reloj)."""
+        if self._siguiente is None:
+            return []
+        ahora_real = time.monotonic() if ahora_real is None else ahora_real
+        if self._ancla is None:
+            self._ancla = (ahora_real, self._siguiente[0])
+        self.reloj = self._reloj_en(ahora_real)
+        if self._siguiente[0] - self.reloj > SALTO_MAXIMO:
+            # Hueco largo en el archivo: se salta directo al próximo sondeo
+            self._ancla = (ahora_real, self._siguiente[0])
+            self.reloj = self._siguiente[0]
+
+        entregados = []
+        while self._siguiente is not None and self._siguiente[0] <= self.reloj:
+            entregados.append(self._siguiente)
+            self._siguiente = next(self._sondeos, None)
+        self.sondeos_entregados += len(entregados)
+        return entregados
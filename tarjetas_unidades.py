@@ -0,0 +1,141 @@
+# --- RENDERIZADO DE LAS TARJETAS DE UNIDADES (HTML EN BLOQUES, INCREMENTAL) ---
+# Cada tarjeta se describe primero como un valor inmutable con todo lo que se dibuja (ya
+# formateado) y se convierte a HTML con una plantilla fija: una rejilla CSS (display: grid)
+# por bloque de tarjetas, enviada con UNA sola llamada a st.markdown. Los detalles van en un
+# <details> nativo, que se abre en el navegador sin volver a ejecutar nada en el servidor.
+#
+# La rejilla se dibuja en la ejecución completa del script, fuera del fragmento del ciclo: las
+# ejecuciones del fragmento (botones de las alertas) no la tocan. Streamlit borra lo que una ejecución
+# completa no vuelve a enviar, así que en cada una van todos los bloques: la rejilla guarda (en la
+# sesión) las tarjetas y el HTML de cada bloque y solo vuelve a armar el de los bloques con alguna
+# tarjeta distinta. Un bloque sin cambios es el mismo mensaje, y Streamlit manda solo su hash si el
+# navegador ya lo tiene en caché (mensajes de global.minCachedMessageSize = 10 KB o más); los bloques
+# más chicos viajan completos.
+
+import re
+from dataclasses import dataclass
+from html import escape
+from typing import List, Optional, Sequence, Tuple
+
+import streamlit as st
+
+# Tarjetas por bloque: un cambio reenvía solo su bloque (None = toda la flota en un único bloque)
+TARJETAS_POR_BLOQUE = 50
+
+# Estilos comunes de la rejilla (se inyectan una vez por página, ver dashboard.py)
+CSS_TARJETAS = """
+.rejilla-tarjetas { display: grid; gap: 1rem; margin-bottom: 1rem; }
+.celda-tarjeta { min-width: 0; }
+.tarjeta-unidad { padding: 15px; border-radius: 5px; }
+.tarjeta-unidad p { margin: 0; text-align: center; }
+.tarjeta-unidad .tarjeta-nombre { margin-bottom: 10px; }
+.tarjeta-nombre span { background-color: rgba(0,0,0,0.3); padding: 5px 10px; border-radius: 5px; font-size: 1.5em; font-weight: 900; }
+.tarjeta-unidad .tarjeta-velocidad { display: flex; align-items: center; justify-content: center; font-size: 1.9em; font-weight: 900; }
+.tarjeta-velocidad span { margin-left: 8px; }
+.tarjeta-detalles { font-size: 0.85em; margin-top: 6px; padding: 4px 8px; border: 1px solid rgba(128,128,128,0.3); border-radius: 5px; }
+.tarjeta-detalles summary { cursor: pointer; }
+.tarjeta-detalles p { margin: 4px 0; opacity: 0.8; }
+.tarjeta-falla { background-color: rgba(255,43,43,0.09); color: #FF4B4B; padding: 6px 8px; border-radius: 5px; margin: 4px 0; }
+"""
+
+_NEGRITA_MARKDOWN = re.compile(r"\*\*(.+?)\*\*")
+
+
+@dataclass(frozen=True)
+class TarjetaUnidad:
+    """Contenido visible de la tarjeta de una unidad. Dos tarjetas iguales se dibujan igual."""
+    nombre: str
+    velocidad: str  # Km/h redondeados, tal como se muestran
+    estado: str
+    estilo: str  # CSS del fondo de la tarjeta
+    color_velocidad: str
+    tiempo_parado: str  # Minutos enteros (no cambia en cada ciclo mientras la unidad sigue parada)
+    falla_motivo: Optional[str]  # Markdown (**negritas**)
+    estado_gps: str
+    direccion: str
+    ultimo_reporte: str
+    coordenadas: str
+    desplazamiento: Optional[str] = None  # Km en línea recta en los últimos minutos (None sin historial)
+
+
+def _texto(valor: str) -> str:
+    """Texto escapado para HTML, con las **negritas** de Markdown convertidas a <strong>."""
+    return _NEGRITA_MARKDOWN.sub(r"<strong>\1</strong>", escape(str(valor)))
+
+
+def html_tarjeta(tarjeta: TarjetaUnidad) -> str:
+    """HTML de una tarjeta con sus detalles desplegables (sin saltos de línea: Markdown no lo reinterpreta)."""
+    if tarjeta.falla_motivo:
+        detalle_reporte = (
+            f'<div class="tarjeta-falla">🚫 <strong>Motivo Falla GPS:</strong> {_texto(tarjeta.falla_motivo)}<br>'
+            f'🕒 <strong>Último Reporte:</strong> {_texto(tarjeta.ultimo_reporte)}</div>'
+        )
+        ultimo_reporte = ""
+    else:
+        detalle_reporte = ""
+        ultimo_reporte = f'<p>Último Reporte: <strong>{_texto(tarjeta.ultimo_reporte)}</strong></p>'
+    desplazamiento = (f'<p>Desplazamiento: <strong>{_texto(tarjeta.desplazamiento)}</strong></p>'
+                      if tarjeta.desplazamiento else "")
+    return (
+        f'<div class="celda-tarjeta">'
+        f'<div class="tarjeta-unidad" style="{escape(tarjeta.estilo)}">'
+        f'<p class="tarjeta-nombre"><span>{_texto(tarjeta.nombre)}</span></p>'
+        f'<p class="tarjeta-velocidad">📍 <span style="color: {escape(tarjeta.color_velocidad)};">{_texto(tarjeta.velocidad)} Km</span></p>'
+        f'<p>{_texto(tarjeta.estado)}</p>'
+        f'</div>'
+        f'<details class="tarjeta-detalles"><summary>Detalles ℹ️</summary>'
+        f'<p>Tiempo Parado: <strong>{_texto(tarjeta.tiempo_parado)}</strong></p>'
+        f'{detalle_reporte}'
+        f'<p>Estado GPS: <strong>{_texto(tarjeta.estado_gps)}</strong></p>'
+        f'<p>Dirección: <strong>{_texto(tarjeta.direccion)}</strong></p>'
+        f'{ultimo_reporte}'
+        f'<p>Coordenadas: {_texto(tarjeta.coordenadas)}</p>'
+        f'{desplazamiento}'
+        f'</details>'
+        f'</div>'
+    )
+
+
+def html_bloque(tarjetas: Sequence[TarjetaUnidad], columnas_por_fila: int) -> str:
+    """Una rejilla CSS con las tarjetas dadas."""
+    return (
+        f'<div class="rejilla-tarjetas" style="grid-template-columns: repeat({columnas_por_fila}, minmax(0, 1fr));">'
+        + "".join(html_tarjeta(tarjeta) for tarjeta in tarjetas)
+        + '</div>'
+    )
+
+
+class RejillaTarjetas:
+    """
+    Rejilla de `columnas_por_fila` columnas, en bloques de `tarjetas_por_bloque` tarjetas (un st.markdown
+    por bloque). Conserva el HTML de cada bloque entre ejecuciones: se guarda en st.session_state.
+    """
+
+    def __init__(self, columnas_por_fila: int, tarjetas_por_bloque: Optional[int] = TARJETAS_POR_BLOQUE):
+        self.columnas_por_fila = columnas_por_fila
+        # Múltiplo de las columnas: cada bloque termina en una fila completa y los bloques quedan alineados
+        self.tarjetas_por_bloque = (max(1, -(-tarjetas_por_bloque // columnas_por_fila)) * columnas_por_fila
+                                    if tarjetas_por_bloque else None)
+        # (tarjetas, HTML) del último dibujo de cada bloque
+        self._dibujados: List[Tuple[Tuple[TarjetaUnidad, ...], str]] = []
+
+    def _bloques(self, tarjetas: Sequence[TarjetaUnidad]) -> List[Tuple[TarjetaUnidad, ...]]:
+        tamano = self.tarjetas_por_bloque or max(1, len(tarjetas))
+        return [tuple(tarjetas[inicio:inicio + tamano]) for inicio in range(0, len(tarjetas), tamano)]
+
+    def dibujar(self, tarjetas: Sequence[TarjetaUnidad]) -> int:
+        """
+        Dibuja `tarjetas` en orden en el contenedor actual y retorna cuántos bloques cambiaron (HTML armado
+        de nuevo). Los bloques sin cambios reenvían el HTML guardado.
+        """
+        cambiados = 0
+        dibujados = []
+        for posicion, bloque in enumerate(self._bloques(tarjetas)):
+            anterior = self._dibujados[posicion] if posicion < len(self._dibujados) else None
+            if anterior is None or anterior[0] != bloque:
+                anterior = (bloque, html_bloque(bloque, self.columnas_por_fila))
+                cambiados += 1
+            dibujados.append(anterior)
+            st.markdown(anterior[1], unsafe_allow_html=True)
+        self._dibujados = dibujados
+        return cambiados
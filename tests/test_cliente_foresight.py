@@ -0,0 +1,139 @@
+# --- PRUEBAS DEL CLIENTE FORESIGHT CONTRA UN SERVIDOR LOCAL ---
+# Un http.server en un hilo hace de API: responde 'usersearchplatform' con una unidad por ID
+# y, según el prefijo del ID, tarda más que el timeout ("lento"), devuelve JSON roto ("roto")
+# o espera a que llegue otra petición en paralelo ("par").
+#
+# Uso:
+#   python -m pytest tests
+
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cliente_foresight import (  # noqa: E402
+    consultar_flotas_concurrente, consultar_unidades, crear_sesion_http,
+)
+
+HEADERS = {"Content-Type": "application/json"}
+ESPERA_LENTO_SEGUNDOS = 1.0
+TIMEOUT_CORTO_SEGUNDOS = 0.2
+
+
+class _ApiFalsa(BaseHTTPRequestHandler):
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        ids = payload["ids"].split(",")
+        self.server.lotes.append(ids)
+
+        if any(i.startswith("lento") for i in ids):
+            time.sleep(ESPERA_LENTO_SEGUNDOS)
+        if any(i.startswith("par") for i in ids):
+            # Solo pasa si las dos flotas "par" se consultan a la vez
+            self.server.barrera.wait()
+        if any(i.startswith("roto") for i in ids):
+            cuerpo = b'{"ForesightFlexAPI": {"DATA": [{"name": '
+        else:
+            data = [{"name": f"U-{i}", "unitid": i, "speed_dunit": "10.5", "ignition": "true"} for i in ids]
+            cuerpo = json.dumps({"ForesightFlexAPI": {"DATA": data}}).encode()
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def api():
+    servidor = ThreadingHTTPServer(("127.0.0.1", 0), _ApiFalsa)
+    servidor.daemon_threads = True
+    servidor.lotes = []
+    servidor.barrera = threading.Barrier(2, timeout=2)
+    hilo = threading.Thread(target=servidor.serve_forever, daemon=True)
+    hilo.start()
+    try:
+        yield servidor, f"http://127.0.0.1:{servidor.server_address[1]}/"
+    finally:
+        servidor.shutdown()
+        servidor.server_close()
+
+
+@pytest.fixture
+def sesion():
+    with crear_sesion_http() as s:
+        yield s
+
+
+def test_ids_en_lotes(api, sesion):
+    servidor, url = api
+    ids = ",".join(str(i) for i in range(1, 8)) + ",3, ,7"
+
+    unidades = consultar_unidades(sesion, ids, HEADERS, api_url=url, tamano_lote=3)
+
+    assert sorted(len(lote) for lote in servidor.lotes) == [1, 3, 3]
+    assert sorted(i for lote in servidor.lotes for i in lote) == [str(i) for i in range(1, 8)]
+    assert [u["name"] for u in unidades] == [f"U-{i}" for i in range(1, 8)]
+
+
+def test_lote_fallido_conserva_resultados_parciales(api, sesion):
+    _, url = api
+    ids = "1,2,lento-1,roto-1,5,6"
+
+    unidades = consultar_unidades(sesion, ids, HEADERS, api_url=url,
+                                  timeout=TIMEOUT_CORTO_SEGUNDOS, tamano_lote=2)
+
+    assert [u["name"] for u in unidades] == ["U-1", "U-2", "U-5", "U-6"]
+
+
+def test_todos_los_lotes_fallan(api, sesion):
+    _, url = api
+    with pytest.raises(requests.exceptions.RequestException):
+        consultar_unidades(sesion, "roto-1,roto-2", HEADERS, api_url=url, tamano_lote=1)
+
+
+def test_json_invalido(api, sesion):
+    _, url = api
+    with pytest.raises(requests.exceptions.InvalidJSONError):
+        consultar_unidades(sesion, "roto-1", HEADERS, api_url=url)
+
+
+def test_timeout(api, sesion):
+    _, url = api
+    with pytest.raises(requests.exceptions.Timeout):
+        consultar_unidades(sesion, "lento-1", HEADERS, api_url=url, timeout=TIMEOUT_CORTO_SEGUNDOS)
+
+
+def test_flotas_concurrentes(api, sesion):
+    servidor, url = api
+    ids_por_flota = {
+        "Norte": "par-1",
+        "Sur": "par-2",
+        "Toda Flota": "1,2,3,4,5",
+        "Lenta": "lento-1",
+        "Rota": "roto-1",
+    }
+
+    resultados = consultar_flotas_concurrente(
+        sesion, ids_por_flota, HEADERS, api_url=url,
+        timeouts={"Lenta": TIMEOUT_CORTO_SEGUNDOS},
+        tamanos_lote={"Toda Flota": 2},
+    )
+
+    # "Norte" y "Sur" solo responden si el servidor recibió ambas peticiones a la vez
+    assert [u["name"] for u in resultados["Norte"]] == ["U-par-1"]
+    assert [u["name"] for u in resultados["Sur"]] == ["U-par-2"]
+    assert [u["name"] for u in resultados["Toda Flota"]] == [f"U-{i}" for i in range(1, 6)]
+    assert isinstance(resultados["Lenta"], requests.exceptions.Timeout)
+    assert isinstance(resultados["Rota"], requests.exceptions.InvalidJSONError)
+    assert sorted(len(lote) for lote in servidor.lotes if lote[0].isdigit()) == [1, 2, 2]